@@ -1,13 +1,36 @@
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
-import pygame
 import os
-import json
+import queue
 import random
 import time
-from mutagen.mp3 import MP3
 from tkinter import font as tkfont
-from collections import deque
+
+from duplicate_finder import DuplicateFinder
+from library_scanner import LibraryScanner
+from library_store import LibraryStore
+from library_watcher import LibraryWatcher
+from player_engine import PlayerEngine
+from playlist_view import VirtualPlaylistView
+from playlist_formats import PlaylistImporter, write_playlist
+from audio_decode import numpy_available
+from spectrum import SpectrumAnalyzer, NUM_BANDS
+from waveform import WaveformStore, WaveformBuilder
+from seek_bar import WaveformSeekBar
+from perf_trace import tracer, startup
+from perf_overlay import PerfOverlay
+
+# Интервалы опроса команд сервера управления, мс
+CONTROL_POLL_ACTIVE = 20
+CONTROL_POLL_CLIENTS = 50
+CONTROL_POLL_IDLE = 200
+
+# Интервал приема изменений от наблюдателя за папками, мс
+WATCHER_POLL = 500
+
+# Наибольший размер микса, подобранного по звучанию
+MAX_SMART_MIX = 100
+
 
 class ModernMusicPlayer:
     def __init__(self, root):
@@ -16,81 +39,240 @@ class ModernMusicPlayer:
         self.root.geometry("1200x800")
         self.root.configure(bg='#000000')
         
-        # Пути для хранения данных
+        # Путь для хранения данных
         self.data_dir = "music_player_data"
-        self.playlists_file = os.path.join(self.data_dir, "playlists.json")
-        
-        # Создаем директорию для данных если ее нет
-        if not os.path.exists(self.data_dir):
-            os.makedirs(self.data_dir)
-        
-        # Инициализация pygame mixer
-        pygame.mixer.init()
         
-        # Переменные
-        self.playlist = []
-        self.current_song_index = 0
-        self.paused = False
-        self.playing = False
-        self.volume = 0.7
-        self.song_length = 0
-        self.current_time = 0
-        pygame.mixer.music.set_volume(self.volume)
+        # Библиотека и воспроизведение работают без Tk; окно только
+        # вызывает их методы и подписано на события
+        self.library = LibraryStore(self.data_dir)
+        self.load_playlists()
+        startup.mark('library')
+        self.engine = PlayerEngine(self.library)
+        self.engine.listeners.append(self.on_engine_event)
+        self.library.listeners.append(self.on_playlists_changed)
+        self.library_refresh_id = None
+        
+        # Тикер позиции работает только во время воспроизведения
+        self.tick_after_id = None
+        
+        # Спектр по декодированному звуку (нужен numpy)
+        self.spectrum = SpectrumAnalyzer(self.engine.position) if numpy_available() else None
+        self.viz_after_id = None
+        self.viz_bars = []
+        self.viz_bars_canvas = None
+        
+        # Формы волны для прогресс-бара (строятся в фоне, нужен numpy)
+        if numpy_available():
+            self.waveforms = WaveformStore(os.path.join(self.data_dir, "waveforms"))
+            self.waveform_builder = WaveformBuilder(self.waveforms)
+        else:
+            self.waveforms = None
+            self.waveform_builder = None
         
-        # Плейлисты
-        self.user_playlists = {}
-        self.current_playlist = "main"
+        # Страница поиска
+        self.search_after_id = None
+        self.search_results = []
+        self.search_listbox = None
         
-        # История прослушивания
-        self.recently_played = deque(maxlen=10)
+        # Страница библиотеки строится при первом показе
+        self.library_stats = None
+        self.library_cards = None
         
-        # Словарь для хранения треков в интерфейсе
-        self.track_frames = {}
+        # Размеры плейлистов и их сумма считаются один раз, дальше
+        # обновляются только для измененных плейлистов
+        self.playlist_sizes = {name: len(tracks) for name, tracks in self.library.playlists.items()}
+        self.total_tracks = sum(self.playlist_sizes.values())
+        self.changed_playlists = set()
         
-        # Загружаем плейлисты
-        self.load_playlists()
+        startup.mark('engine')
         
         # Кастомные шрифты
         self.setup_fonts()
         
         # Создание интерфейса
         self.create_widgets()
-        
-        # Загрузка тестовых треков (опционально)
-        self.load_sample_tracks()
-        
-        # Обновление времени
-        self.update_time()
+        startup.mark('widgets')
         
         # Анимация
-        self.animate_visualizer()
+        self.start_visualizer()
+        
+        # Оверлей производительности (F12)
+        self.perf_overlay = PerfOverlay(self.root)
         
         # Привязка горячих клавиш
         self.bind_hotkeys()
         
-        # Микширование
-        self.mix_mode = False
-        self.mix_interval = 3000  # 3 секунды между треками в режиме микса
-        self.mix_timer = None
+        # Фоновое сканирование папок
+        self.scanner = None
+        self.scan_target = None
+        # Фоновый импорт файла плейлиста
+        self.importer = None
+        self.import_target = None
+        # Наблюдение за папками библиотеки и поиск дубликатов
+        self.watcher = None
+        self.duplicate_finder = None
+        self.control = None
+        
+        # Фоновая работа начинается, когда окно уже показано: таймер
+        # срабатывает в mainloop, а after_idle — после первой отрисовки
+        self.root.after(0, lambda: self.root.after_idle(self.finish_startup))
     
-    def load_playlists(self):
-        """Загружает плейлисты из файла"""
-        if os.path.exists(self.playlists_file):
-            try:
-                with open(self.playlists_file, 'r', encoding='utf-8') as f:
-                    self.user_playlists = json.load(f)
-            except:
-                self.user_playlists = {"main": [], "избранное": []}
+    def finish_startup(self):
+        """Окно готово к работе: отчет о запуске и фоновые задачи"""
+        startup.mark('first_paint')
+        print(startup.report())
+        
+        # Построение поискового индекса
+        self.start_search_indexing()
+        
+        # Фоновые проходы по библиотеке: формы волны и громкость
+        if self.waveform_builder is not None:
+            self.waveform_builder.enqueue_library(self.library.library_paths())
+        self.library.start_analysis()
+        
+        # Изменения файлов в папках библиотеки
+        self.start_watcher()
+        
+        # Сервер удаленного управления (HTTP + WebSocket)
+        self.start_control_server()
+    
+    def start_watcher(self):
+        """Следит за папками библиотеки; изменения применяются в главном цикле Tk"""
+        self.watcher = LibraryWatcher(self.library.roots,
+                                      self.library.metadata_cache.peek,
+                                      self.library.hashes)
+        self.watcher.start()
+        self.root.after(WATCHER_POLL, self.poll_watcher)
+    
+    def poll_watcher(self):
+        """Применяет пачки изменений файлов (боковая панель и страницы обновятся по событию)"""
+        if self.watcher is None:
+            return
+        
+        for batch in self.watcher.take_results():
+            moved, removed, added = self.library.apply_fs_changes(batch)
+            if moved or removed or added:
+                print(f"Библиотека: перенесено {moved}, удалено {removed}, добавлено {added}")
+            # Теги треков текущего плейлиста могли измениться
+            tracks = self.engine.playlist
+            if any(entry['path'] in tracks for entry in batch['entries']):
+                self.refresh_playlist_display()
+        self.root.after(WATCHER_POLL, self.poll_watcher)
+    
+    def row_info(self, path):
+        """Метаданные строки плейлиста: файлы под inotify берутся из кэша без stat"""
+        if self.watcher is not None and self.watcher.watches(path):
+            entry = self.library.metadata_cache.peek(path)
+            if entry is not None:
+                return entry
+        return self.library.track_info(path)
+    
+    def start_control_server(self):
+        """Запускает сервер управления; команды из сети выполняются в главном цикле Tk"""
+        # asyncio и сервер нужны только после запуска окна
+        from control_server import ControlServer, engine_handlers, load_token
+        
+        try:
+            token = load_token(self.data_dir)
+        except OSError as e:
+            print(f"Сервер управления не запущен: нет токена доступа ({e})")
+            return
+        self.control = ControlServer(engine_handlers(self.engine, self.library), token=token)
+        try:
+            self.control.start()
+        except OSError as e:
+            print(f"Сервер управления не запущен: {e}")
+            self.control = None
+            return
+        print(f"Сервер управления: http://{self.control.host}:{self.control.port}")
+        
+        self.engine.listeners.append(self.control.publish)
+        self.library.listeners.append(self.control.publish_playlists)
+        self.control_active_until = 0
+        self.root.after(CONTROL_POLL_IDLE, self.poll_control)
+    
+    def poll_control(self):
+        """Выполняет команды из сети. Опрос чаще, пока клиенты активны"""
+        if self.control is None:
+            return
+        
+        pending = not self.control.commands.empty()
+        self.control.process_pending()
+        self.control.publish_position(self.engine)
+        
+        now = time.monotonic()
+        if pending:
+            self.control_active_until = now + 1.0
+        if now < self.control_active_until:
+            interval = CONTROL_POLL_ACTIVE
+        elif self.control.client_count:
+            interval = CONTROL_POLL_CLIENTS
         else:
-            self.user_playlists = {"main": [], "избранное": []}
+            interval = CONTROL_POLL_IDLE
+        self.root.after(interval, self.poll_control)
+    
+    def on_playlists_changed(self, kind, name, added, removed):
+        """Обновляет боковую панель и страницы после изменений (в том числе по сети)"""
+        if name is not None:
+            self.changed_playlists.add(name)
+        elif kind == 'rename':
+            # Путь трека сменился во всех плейлистах; размеры те же
+            self.changed_playlists.add(self.engine.current_playlist)
+        if self.library_refresh_id is None:
+            self.library_refresh_id = self.root.after_idle(self.refresh_library_views)
+    
+    def refresh_library_views(self):
+        """Обновляет только виджеты измененных плейлистов"""
+        self.library_refresh_id = None
+        changed, self.changed_playlists = self.changed_playlists, set()
+        
+        for name in changed:
+            tracks = self.library.playlists.get(name)
+            size = len(tracks) if tracks is not None else 0
+            self.total_tracks += size - self.playlist_sizes.pop(name, 0)
+            if tracks is not None:
+                self.playlist_sizes[name] = size
+            self.update_playlist_widgets(name, tracks is not None)
+        
+        if self.engine.current_playlist in changed:
+            self.refresh_playlist_display()
+        else:
+            self.update_track_count()
+        self.update_library_stats()
+    
+    def update_playlist_widgets(self, name, exists):
+        """Кнопка в боковой панели и карточка библиотеки для одного плейлиста"""
+        button = self.sidebar_buttons.get(name)
+        if not exists:
+            if button is not None:
+                button.destroy()
+                del self.sidebar_buttons[name]
+            if self.library_cards is not None and name in self.library_cards:
+                self.library_cards.pop(name)[0].destroy()
+            return
+        
+        if button is None:
+            self.add_sidebar_button(name)
+        if self.library_cards is None:
+            return
+        card = self.library_cards.get(name)
+        if card is None:
+            self.add_library_card(name)
+        else:
+            card[1].config(text=f"{self.playlist_sizes[name]} треков")
+    
+    def load_playlists(self):
+        """Загружает плейлисты из снимка и журнала изменений"""
+        self.library.load()
         
-        # Загружаем текущий плейлист
-        self.playlist = self.user_playlists.get(self.current_playlist, [])
+        if self.library.recovered_from:
+            messagebox.showwarning("Плейлисты повреждены",
+                                 "Не удалось прочитать файл плейлистов. Он сохранен как\n"
+                                 f"{self.library.recovered_from}")
     
     def save_playlists(self):
-        """Сохраняет плейлисты в файл"""
-        with open(self.playlists_file, 'w', encoding='utf-8') as f:
-            json.dump(self.user_playlists, f, ensure_ascii=False, indent=2)
+        """Сворачивает журнал изменений в полный снимок плейлистов"""
+        self.library.compact()
     
     def setup_fonts(self):
         self.title_font = ('Segoe UI', 24, 'bold')
@@ -117,6 +299,7 @@ class ModernMusicPlayer:
         self.root.bind('<Down>', lambda e: self.volume_down())
         self.root.bind('<Escape>', lambda e: self.root.quit())
         self.root.bind('<m>', lambda e: self.toggle_mix())
+        self.root.bind('<F12>', lambda e: self.perf_overlay.toggle())
     
     def volume_up(self):
         """Увеличить громкость"""
@@ -152,127 +335,19 @@ class ModernMusicPlayer:
         # Контент
         self.content_frame = tk.Frame(main_area, bg='#121212')
         self.content_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=(0, 100))
-        
-        # Заголовок
-        title_frame = tk.Frame(self.content_frame, bg='#121212')
-        title_frame.pack(fill=tk.X, pady=(20, 10))
-        
-        self.welcome_label = tk.Label(title_frame, 
-                                    text=f"Music Player - {self.current_playlist}", 
-                                    font=self.title_font,
-                                    bg='#121212',
-                                    fg='white')
-        self.welcome_label.pack(side=tk.LEFT)
-        
-        # Быстрые действия
-        quick_actions = tk.Frame(self.content_frame, bg='#121212')
-        quick_actions.pack(fill=tk.X, pady=(0, 20))
-        
-        action_btn = tk.Button(quick_actions,
-                             text="🎵 Добавить музыку",
-                             command=self.add_songs,
-                             bg='#1DB954',
-                             fg='white',
-                             font=self.button_font,
-                             relief='flat',
-                             padx=20,
-                             pady=10,
-                             cursor='hand2',
-                             activebackground='#1ED760')
-        action_btn.pack(side=tk.LEFT)
-        
-        # Кнопка очистки плейлиста
-        clear_btn = tk.Button(quick_actions,
-                            text="🗑️ Очистить плейлист",
-                            command=self.clear_playlist,
-                            bg='#E22134',
-                            fg='white',
-                            font=self.button_font,
-                            relief='flat',
-                            padx=20,
-                            pady=10,
-                            cursor='hand2',
-                            activebackground='#FF3B30')
-        clear_btn.pack(side=tk.LEFT, padx=10)
-        
-        # Кнопка создания микса
-        mix_btn = tk.Button(quick_actions,
-                          text="🔀 Создать микс",
-                          command=self.create_mix,
-                          bg='#9C27B0',
-                          fg='white',
-                          font=self.button_font,
-                          relief='flat',
-                          padx=20,
-                          pady=10,
-                          cursor='hand2',
-                          activebackground='#BA68C8')
-        mix_btn.pack(side=tk.LEFT, padx=10)
-        
-        # Визуализатор и плейлист
-        visualizer_frame = tk.Frame(self.content_frame, bg='#181818')
-        visualizer_frame.pack(fill=tk.BOTH, expand=True)
-        
-        # Визуализатор
-        viz_container = tk.Frame(visualizer_frame, bg='#181818')
-        viz_container.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 10))
-        
-        # Визуализатор барами
-        self.viz_canvas = tk.Canvas(viz_container, bg='#181818', 
-                                   highlightthickness=0, height=200)
-        self.viz_canvas.pack(fill=tk.BOTH, expand=True)
-        
-        # Плейлист
-        playlist_container = tk.Frame(visualizer_frame, bg='#181818', width=400)
-        playlist_container.pack(side=tk.RIGHT, fill=tk.BOTH)
-        playlist_container.pack_propagate(False)
-        
-        playlist_header = tk.Frame(playlist_container, bg='#181818')
-        playlist_header.pack(fill=tk.X, pady=(10, 5))
-        
-        self.playlist_title = tk.Label(playlist_header,
-                                     text=f"Плейлист: {self.current_playlist}",
-                                     font=('Segoe UI', 16, 'bold'),
-                                     bg='#181818',
-                                     fg='white')
-        self.playlist_title.pack(side=tk.LEFT)
-        
-        # Счетчик треков
-        self.track_count_label = tk.Label(playlist_header,
-                                        text=f"{len(self.playlist)} треков",
-                                        font=self.time_font,
-                                        bg='#181818',
-                                        fg='#b3b3b3')
-        self.track_count_label.pack(side=tk.RIGHT, padx=20)
-        
-        # Список песен с прокруткой
-        playlist_scroll = tk.Frame(playlist_container, bg='#181818')
-        playlist_scroll.pack(fill=tk.BOTH, expand=True)
-        
-        # Canvas для скроллинга
-        self.playlist_canvas = tk.Canvas(playlist_scroll, bg='#181818', 
-                                        highlightthickness=0)
-        scrollbar = ttk.Scrollbar(playlist_scroll, orient="vertical", 
-                                 command=self.playlist_canvas.yview)
-        self.scrollable_frame = tk.Frame(self.playlist_canvas, bg='#181818')
-        
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.playlist_canvas.configure(
-                scrollregion=self.playlist_canvas.bbox("all")
-            )
-        )
-        
-        self.playlist_canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        self.playlist_canvas.configure(yscrollcommand=scrollbar.set)
-        
-        self.playlist_canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
-        
-        self.playlist_frame = self.scrollable_frame
-        
-        # Загружаем треки текущего плейлиста
-        self.refresh_playlist_display()
+        self.content_frame.grid_rowconfigure(0, weight=1)
+        self.content_frame.grid_columnconfigure(0, weight=1)
+        
+        # Страницы строятся один раз при первом показе и дальше только
+        # поднимаются наверх (tkraise)
+        self.views = {}
+        self.current_view = None
+        self.view_builders = {
+            'home': self.build_home_view,
+            'search': self.build_search_view,
+            'library': self.build_library_view,
+        }
+        self.show_view('home')
         
         # Нижняя панель управления
         self.create_player_bar(main_area)
@@ -346,45 +421,43 @@ class ModernMusicPlayer:
     
     def load_user_playlists(self):
         """Загружает плейлисты пользователя в боковую панель"""
-        # Очищаем контейнер
-        for widget in self.playlists_container.winfo_children():
-            widget.destroy()
-        
-        # Добавляем кнопки для каждого плейлиста
-        for playlist_name in self.user_playlists.keys():
-            btn = tk.Button(self.playlists_container,
-                          text=f"   📁  {playlist_name}",
-                          font=('Segoe UI', 11),
-                          bg='#000000',
-                          fg='#b3b3b3',
-                          anchor='w',
-                          relief='flat',
-                          padx=10,
-                          pady=8,
-                          cursor='hand2',
-                          command=lambda name=playlist_name: self.switch_playlist(name))
-            btn.pack(fill=tk.X)
-            btn.bind("<Enter>", lambda e, b=btn: b.config(bg='#282828'))
-            btn.bind("<Leave>", lambda e, b=btn: b.config(bg='#000000'))
+        self.sidebar_buttons = {}
+        for playlist_name in self.library.playlists:
+            self.add_sidebar_button(playlist_name)
+    
+    def add_sidebar_button(self, playlist_name):
+        """Кнопка плейлиста в боковой панели (новые — в конец, как в словаре)"""
+        btn = tk.Button(self.playlists_container,
+                      text=f"   📁  {playlist_name}",
+                      font=('Segoe UI', 11),
+                      bg='#000000',
+                      fg='#b3b3b3',
+                      anchor='w',
+                      relief='flat',
+                      padx=10,
+                      pady=8,
+                      cursor='hand2',
+                      command=lambda name=playlist_name: self.switch_playlist(name))
+        btn.pack(fill=tk.X)
+        btn.bind("<Enter>", lambda e, b=btn: b.config(bg='#282828'))
+        btn.bind("<Leave>", lambda e, b=btn: b.config(bg='#000000'))
+        self.sidebar_buttons[playlist_name] = btn
     
     def switch_playlist(self, playlist_name):
         """Переключается на указанный плейлист"""
-        if playlist_name in self.user_playlists:
-            self.current_playlist = playlist_name
-            self.playlist = self.user_playlists[playlist_name]
-            
-            # Обновляем отображение
-            self.refresh_playlist_display()
-            
-            # Обновляем заголовки
-            self.welcome_label.config(text=f"Music Player - {playlist_name}")
-            self.playlist_title.config(text=f"Плейлист: {playlist_name}")
-            
-            # Обновляем счетчик
-            self.update_track_count()
-            
+        if self.engine.select_playlist(playlist_name):
             print(f"Переключен на плейлист: {playlist_name}")
     
+    def show_playlist(self, playlist_name):
+        """Показывает плейлист, ставший текущим (событие движка)"""
+        # Обновляем отображение
+        self.refresh_playlist_display()
+        
+        # Обновляем заголовки
+        self.welcome_label.config(text=f"Music Player - {playlist_name}")
+        self.playlist_title.config(text=f"Плейлист: {playlist_name}")
+        self.home_stats['current'][1].config(text=f"Треков в {playlist_name}")
+    
     def activate_nav_button(self, button_name):
         """Активирует кнопку навигации (меняет цвет)"""
         for name, btn in self.nav_buttons.items():
@@ -393,30 +466,45 @@ class ModernMusicPlayer:
             else:
                 btn.config(fg='#b3b3b3', bg='#000000')
     
+    def show_view(self, name):
+        """Поднимает страницу наверх; строит ее при первом показе"""
+        view = self.views.get(name)
+        if view is None:
+            view = tk.Frame(self.content_frame, bg='#121212')
+            view.grid(row=0, column=0, sticky='nsew')
+            self.view_builders[name](view)
+            self.views[name] = view
+        view.tkraise()
+        self.current_view = name
+        
+        # Страницы под верхней остаются отображенными, поэтому <Map> при
+        # возврате на главную не приходит — визуализатор запускаем сами
+        if name == 'home':
+            self.start_visualizer()
+        elif name == 'library':
+            self.update_library_stats()
+            self.update_top_tracks()
+    
     def show_home(self):
         """Показать главную страницу"""
         self.activate_nav_button("Главная")
-        self.show_home_content()
+        self.show_view('home')
     
-    def show_home_content(self):
-        """Показывает содержимое главной страницы"""
-        # Очищаем контент
-        for widget in self.content_frame.winfo_children():
-            widget.destroy()
-        
+    def build_home_view(self, view):
+        """Строит главную страницу"""
         # Заголовок
-        title_frame = tk.Frame(self.content_frame, bg='#121212')
+        title_frame = tk.Frame(view, bg='#121212')
         title_frame.pack(fill=tk.X, pady=(20, 10))
         
         self.welcome_label = tk.Label(title_frame, 
-                                    text=f"Music Player - {self.current_playlist}", 
+                                    text=f"Music Player - {self.engine.current_playlist}", 
                                     font=self.title_font,
                                     bg='#121212',
                                     fg='white')
         self.welcome_label.pack(side=tk.LEFT)
         
         # Быстрые действия
-        quick_actions = tk.Frame(self.content_frame, bg='#121212')
+        quick_actions = tk.Frame(view, bg='#121212')
         quick_actions.pack(fill=tk.X, pady=(0, 20))
         
         action_btn = tk.Button(quick_actions,
@@ -432,6 +520,20 @@ class ModernMusicPlayer:
                              activebackground='#1ED760')
         action_btn.pack(side=tk.LEFT)
         
+        # Кнопка сканирования папки
+        scan_btn = tk.Button(quick_actions,
+                           text="📂 Сканировать папку",
+                           command=self.scan_folder,
+                           bg='#2E77D0',
+                           fg='white',
+                           font=self.button_font,
+                           relief='flat',
+                           padx=20,
+                           pady=10,
+                           cursor='hand2',
+                           activebackground='#4A90E2')
+        scan_btn.pack(side=tk.LEFT, padx=10)
+        
         # Кнопка очистки плейлиста
         clear_btn = tk.Button(quick_actions,
                             text="🗑️ Очистить плейлист",
@@ -461,23 +563,22 @@ class ModernMusicPlayer:
         mix_btn.pack(side=tk.LEFT, padx=10)
         
         # Статистика
-        stats_frame = tk.Frame(self.content_frame, bg='#181818')
+        stats_frame = tk.Frame(view, bg='#181818')
         stats_frame.pack(fill=tk.X, pady=(0, 20))
         
-        total_tracks = sum(len(tracks) for tracks in self.user_playlists.values())
-        
+        # Подписи значений обновляются по событиям, без пересчета сумм
+        self.home_stats = {}
         stats = [
-            (f"{len(self.playlist)}", f"Треков в {self.current_playlist}"),
-            (f"{len(self.user_playlists)}", "Плейлистов"),
-            (f"{total_tracks}", "Всего треков")
+            ('current', f"Треков в {self.engine.current_playlist}"),
+            ('playlists', "Плейлистов"),
+            ('total', "Всего треков")
         ]
         
-        for value, label in stats:
+        for key, label in stats:
             stat_frame = tk.Frame(stats_frame, bg='#181818')
             stat_frame.pack(side=tk.LEFT, expand=True, padx=10, pady=10)
             
             value_label = tk.Label(stat_frame,
-                                 text=value,
                                  font=('Segoe UI', 24, 'bold'),
                                  bg='#181818',
                                  fg='#1DB954')
@@ -489,9 +590,10 @@ class ModernMusicPlayer:
                                  bg='#181818',
                                  fg='#b3b3b3')
             label_label.pack()
+            self.home_stats[key] = (value_label, label_label)
         
         # Визуализатор и плейлист
-        visualizer_frame = tk.Frame(self.content_frame, bg='#181818')
+        visualizer_frame = tk.Frame(view, bg='#181818')
         visualizer_frame.pack(fill=tk.BOTH, expand=True)
         
         # Визуализатор
@@ -502,6 +604,8 @@ class ModernMusicPlayer:
         self.viz_canvas = tk.Canvas(viz_container, bg='#181818', 
                                    highlightthickness=0, height=200)
         self.viz_canvas.pack(fill=tk.BOTH, expand=True)
+        self.viz_canvas.bind("<Configure>", lambda e: self.start_visualizer())
+        self.viz_canvas.bind("<Map>", lambda e: self.start_visualizer())
         
         # Плейлист
         playlist_container = tk.Frame(visualizer_frame, bg='#181818', width=400)
@@ -512,7 +616,7 @@ class ModernMusicPlayer:
         playlist_header.pack(fill=tk.X, pady=(10, 5))
         
         self.playlist_title = tk.Label(playlist_header,
-                                     text=f"Плейлист: {self.current_playlist}",
+                                     text=f"Плейлист: {self.engine.current_playlist}",
                                      font=('Segoe UI', 16, 'bold'),
                                      bg='#181818',
                                      fg='white')
@@ -520,7 +624,7 @@ class ModernMusicPlayer:
         
         # Счетчик треков
         self.track_count_label = tk.Label(playlist_header,
-                                        text=f"{len(self.playlist)} треков",
+                                        text=f"{len(self.engine.playlist)} треков",
                                         font=self.time_font,
                                         bg='#181818',
                                         fg='#b3b3b3')
@@ -530,43 +634,32 @@ class ModernMusicPlayer:
         playlist_scroll = tk.Frame(playlist_container, bg='#181818')
         playlist_scroll.pack(fill=tk.BOTH, expand=True)
         
-        # Canvas для скроллинга
+        # Canvas для скроллинга (строки создаются только для видимой части)
         self.playlist_canvas = tk.Canvas(playlist_scroll, bg='#181818', 
                                         highlightthickness=0)
-        scrollbar = ttk.Scrollbar(playlist_scroll, orient="vertical", 
-                                 command=self.playlist_canvas.yview)
-        self.scrollable_frame = tk.Frame(self.playlist_canvas, bg='#181818')
-        
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.playlist_canvas.configure(
-                scrollregion=self.playlist_canvas.bbox("all")
-            )
-        )
-        
-        self.playlist_canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        self.playlist_canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar = ttk.Scrollbar(playlist_scroll, orient="vertical")
+        self.playlist_view = VirtualPlaylistView(self.playlist_canvas, scrollbar,
+                                                 song_font=self.song_font,
+                                                 time_font=self.time_font,
+                                                 on_play=self.play_track,
+                                                 on_remove=self.remove_from_playlist,
+                                                 get_info=self.row_info,
+                                                 peek_info=self.library.metadata_cache.peek)
         
         self.playlist_canvas.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
         
-        self.playlist_frame = self.scrollable_frame
-        
         # Загружаем треки текущего плейлиста
         self.refresh_playlist_display()
     
+    @tracer.traced()
     def refresh_playlist_display(self):
         """Обновляет отображение плейлиста"""
-        # Очищаем текущий плейлист
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-        
-        self.track_frames = {}
+        # Перепривязываем видимые строки к текущему плейлисту
+        self.playlist_view.set_items(self.engine.playlist)
         
-        # Добавляем треки из текущего плейлиста
-        for i, song_path in enumerate(self.playlist):
-            if os.path.exists(song_path):
-                self.add_track_to_display(i, song_path)
+        # Сохраняем перечитанные метаданные
+        self.library.flush()
         
         # Обновляем счетчик
         self.update_track_count()
@@ -574,20 +667,111 @@ class ModernMusicPlayer:
     def show_search(self):
         """Показать страницу поиска"""
         self.activate_nav_button("Поиск")
-        print("Переход на страницу поиска")
+        self.show_view('search')
+        self.run_search()
+    
+    def build_search_view(self, view):
+        """Строит страницу с результатами поиска"""
+        title_frame = tk.Frame(view, bg='#121212')
+        title_frame.pack(fill=tk.X, pady=(20, 10))
+        
+        title_label = tk.Label(title_frame,
+                             text="🔍 Поиск",
+                             font=self.title_font,
+                             bg='#121212',
+                             fg='white')
+        title_label.pack(side=tk.LEFT)
+        
+        self.search_info_label = tk.Label(title_frame,
+                                        text="Введите запрос в строке поиска",
+                                        font=self.time_font,
+                                        bg='#121212',
+                                        fg='#b3b3b3')
+        self.search_info_label.pack(side=tk.RIGHT, padx=20)
+        
+        # Один Listbox вместо виджетов на каждую строку
+        results_frame = tk.Frame(view, bg='#181818')
+        results_frame.pack(fill=tk.BOTH, expand=True)
+        
+        self.search_listbox = tk.Listbox(results_frame,
+                                       font=self.song_font,
+                                       bg='#181818',
+                                       fg='white',
+                                       selectbackground='#282828',
+                                       selectforeground='#1DB954',
+                                       relief='flat',
+                                       highlightthickness=0,
+                                       activestyle='none')
+        scrollbar = ttk.Scrollbar(results_frame, orient="vertical",
+                                 command=self.search_listbox.yview)
+        self.search_listbox.configure(yscrollcommand=scrollbar.set)
+        
+        self.search_listbox.pack(side="left", fill="both", expand=True, padx=10, pady=10)
+        scrollbar.pack(side="right", fill="y")
+        
+        self.search_listbox.bind('<Double-Button-1>', self.play_search_result)
+        self.search_listbox.bind('<Return>', self.play_search_result)
+    
+    def start_search_indexing(self):
+        """Строит поисковый индекс порциями, не блокируя главный цикл"""
+        self.library.start_indexing()
+        self.index_search_chunk()
+    
+    def index_search_chunk(self):
+        if self.library.index_step():
+            self.root.after(1, self.index_search_chunk)
+    
+    def get_search_query(self):
+        query = self.search_entry.get().strip()
+        if query == "Поиск музыки...":
+            return ""
+        return query
+    
+    def run_search(self):
+        """Выполняет поиск и показывает результаты"""
+        self.search_after_id = None
+        if self.search_listbox is None:
+            return
+        
+        query = self.get_search_query()
+        self.search_listbox.delete(0, tk.END)
+        if not query:
+            self.search_results = []
+            self.search_info_label.config(text="Введите запрос в строке поиска")
+            return
+        
+        start = time.perf_counter()
+        self.search_results = self.library.search(query, limit=200)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        
+        for path in self.search_results:
+            info = self.library.metadata_cache.peek(path)
+            text = os.path.basename(path)
+            if info is not None and info['artist']:
+                text = f"{text}  —  {info['artist']}"
+            self.search_listbox.insert(tk.END, text)
+        
+        status = f"{len(self.search_results)} результатов • {elapsed_ms:.1f} мс"
+        if self.library.indexing:
+            status += " • индексация..."
+        self.search_info_label.config(text=status)
+    
+    def play_search_result(self, event):
+        """Воспроизводит выбранный результат поиска"""
+        selection = self.search_listbox.curselection()
+        if not selection:
+            return
+        # Трек ищется сначала в текущем плейлисте, затем в остальных
+        self.engine.play_path(self.search_results[selection[0]])
     
     def show_library(self):
         """Показать библиотеку"""
         self.activate_nav_button("Библиотека")
-        self.show_library_content()
+        self.show_view('library')
     
-    def show_library_content(self):
-        """Показывает содержимое библиотеки"""
-        # Очищаем контент
-        for widget in self.content_frame.winfo_children():
-            widget.destroy()
-        
-        title_frame = tk.Frame(self.content_frame, bg='#121212')
+    def build_library_view(self, view):
+        """Строит страницу библиотеки"""
+        title_frame = tk.Frame(view, bg='#121212')
         title_frame.pack(fill=tk.X, pady=(20, 10))
         
         title_label = tk.Label(title_frame, 
@@ -597,24 +781,53 @@ class ModernMusicPlayer:
                              fg='white')
         title_label.pack(side=tk.LEFT)
         
+        import_btn = tk.Button(title_frame,
+                             text="📥 Импорт",
+                             command=self.import_playlist,
+                             bg='#181818',
+                             fg='white',
+                             font=self.time_font,
+                             relief='flat',
+                             padx=10,
+                             pady=5,
+                             cursor='hand2')
+        import_btn.pack(side=tk.RIGHT)
+        
+        duplicates_btn = tk.Button(title_frame,
+                                 text="🔍 Дубликаты",
+                                 command=self.find_duplicates,
+                                 bg='#181818',
+                                 fg='white',
+                                 font=self.time_font,
+                                 relief='flat',
+                                 padx=10,
+                                 pady=5,
+                                 cursor='hand2')
+        duplicates_btn.pack(side=tk.RIGHT, padx=5)
+        
+        self.duplicates_label = tk.Label(title_frame,
+                                       font=self.time_font,
+                                       bg='#121212',
+                                       fg='#b3b3b3')
+        self.duplicates_label.pack(side=tk.RIGHT, padx=10)
+        
         # Статистика библиотеки
-        stats_frame = tk.Frame(self.content_frame, bg='#181818', padx=20, pady=20)
+        stats_frame = tk.Frame(view, bg='#181818', padx=20, pady=20)
         stats_frame.pack(fill=tk.X, pady=20)
         
-        total_tracks = sum(len(tracks) for tracks in self.user_playlists.values())
-        
+        self.library_stats = {}
         stats = [
-            (f"{total_tracks}", "Всего треков"),
-            (f"{len(self.user_playlists)}", "Плейлистов"),
-            (f"{len(self.recently_played)}", "В истории прослушивания")
+            ('total', "Всего треков"),
+            ('playlists', "Плейлистов"),
+            ('plays', "Прослушиваний"),
+            ('skips', "Пропущено")
         ]
         
-        for value, label in stats:
+        for key, label in stats:
             stat_frame = tk.Frame(stats_frame, bg='#181818')
             stat_frame.pack(side=tk.LEFT, expand=True, padx=10)
             
             value_label = tk.Label(stat_frame,
-                                 text=value,
                                  font=('Segoe UI', 28, 'bold'),
                                  bg='#181818',
                                  fg='#1DB954')
@@ -626,79 +839,132 @@ class ModernMusicPlayer:
                                  bg='#181818',
                                  fg='#b3b3b3')
             label_label.pack()
+            self.library_stats[key] = value_label
+        
+        # Самые слушаемые треки (из сводки истории)
+        top_label = tk.Label(view,
+                           text="ЧАСТО СЛУШАЮ",
+                           font=('Segoe UI', 12, 'bold'),
+                           bg='#121212',
+                           fg='white')
+        top_label.pack(anchor='w')
+        
+        self.top_tracks_label = tk.Label(view,
+                                       font=self.time_font,
+                                       bg='#121212',
+                                       fg='#b3b3b3',
+                                       justify=tk.LEFT,
+                                       anchor='w')
+        self.top_tracks_label.pack(fill=tk.X, pady=(5, 0))
         
         # Список плейлистов
-        playlists_frame = tk.Frame(self.content_frame, bg='#121212')
-        playlists_frame.pack(fill=tk.BOTH, expand=True, pady=20)
+        self.library_cards_frame = tk.Frame(view, bg='#121212')
+        self.library_cards_frame.pack(fill=tk.BOTH, expand=True, pady=20)
         
-        playlists_label = tk.Label(playlists_frame,
+        playlists_label = tk.Label(self.library_cards_frame,
                                  text="МОИ ПЛЕЙЛИСТЫ",
                                  font=('Segoe UI', 12, 'bold'),
                                  bg='#121212',
                                  fg='white')
         playlists_label.pack(anchor='w', pady=(0, 10))
         
-        # Отображаем все плейлисты
-        for playlist_name, tracks in self.user_playlists.items():
-            playlist_card = tk.Frame(playlists_frame, bg='#181818')
-            playlist_card.pack(fill=tk.X, pady=5)
-            
-            # Информация о плейлисте
-            info_frame = tk.Frame(playlist_card, bg='#181818')
-            info_frame.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=15, pady=10)
-            
-            name_label = tk.Label(info_frame,
-                                text=playlist_name,
-                                font=self.song_font,
-                                bg='#181818',
-                                fg='white',
-                                anchor='w')
-            name_label.pack(fill=tk.X)
-            
-            count_label = tk.Label(info_frame,
-                                 text=f"{len(tracks)} треков",
-                                 font=self.time_font,
-                                 bg='#181818',
-                                 fg='#b3b3b3',
-                                 anchor='w')
-            count_label.pack(fill=tk.X)
-            
-            # Кнопки управления
-            btn_frame = tk.Frame(playlist_card, bg='#181818')
-            btn_frame.pack(side=tk.RIGHT, padx=10)
-            
-            play_btn = tk.Button(btn_frame,
-                               text="▶ Воспроизвести",
-                               command=lambda name=playlist_name: self.play_playlist(name),
-                               bg='#1DB954',
-                               fg='white',
-                               font=self.time_font,
-                               relief='flat',
-                               padx=10,
-                               pady=5,
-                               cursor='hand2')
-            play_btn.pack(side=tk.LEFT, padx=2)
-            
-            delete_btn = tk.Button(btn_frame,
-                                 text="🗑️",
-                                 command=lambda name=playlist_name: self.delete_playlist(name),
-                                 bg='#E22134',
-                                 fg='white',
-                                 font=('Arial', 10),
-                                 relief='flat',
-                                 width=3,
-                                 cursor='hand2')
-            delete_btn.pack(side=tk.LEFT, padx=2)
+        # Карточки плейлистов: имя -> (карточка, счетчик треков)
+        self.library_cards = {}
+        for playlist_name in self.library.playlists:
+            self.add_library_card(playlist_name)
+        
+        self.update_library_stats()
+        self.update_top_tracks()
+    
+    def add_library_card(self, playlist_name):
+        """Карточка плейлиста на странице библиотеки"""
+        playlist_card = tk.Frame(self.library_cards_frame, bg='#181818')
+        playlist_card.pack(fill=tk.X, pady=5)
+        
+        # Информация о плейлисте
+        info_frame = tk.Frame(playlist_card, bg='#181818')
+        info_frame.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=15, pady=10)
+        
+        name_label = tk.Label(info_frame,
+                            text=playlist_name,
+                            font=self.song_font,
+                            bg='#181818',
+                            fg='white',
+                            anchor='w')
+        name_label.pack(fill=tk.X)
+        
+        count_label = tk.Label(info_frame,
+                             text=f"{self.playlist_sizes.get(playlist_name, 0)} треков",
+                             font=self.time_font,
+                             bg='#181818',
+                             fg='#b3b3b3',
+                             anchor='w')
+        count_label.pack(fill=tk.X)
+        
+        # Кнопки управления
+        btn_frame = tk.Frame(playlist_card, bg='#181818')
+        btn_frame.pack(side=tk.RIGHT, padx=10)
+        
+        play_btn = tk.Button(btn_frame,
+                           text="▶ Воспроизвести",
+                           command=lambda name=playlist_name: self.play_playlist(name),
+                           bg='#1DB954',
+                           fg='white',
+                           font=self.time_font,
+                           relief='flat',
+                           padx=10,
+                           pady=5,
+                           cursor='hand2')
+        play_btn.pack(side=tk.LEFT, padx=2)
+        
+        export_btn = tk.Button(btn_frame,
+                             text="📤",
+                             command=lambda name=playlist_name: self.export_playlist(name),
+                             bg='#181818',
+                             fg='white',
+                             font=('Arial', 10),
+                             relief='flat',
+                             width=3,
+                             cursor='hand2')
+        export_btn.pack(side=tk.LEFT, padx=2)
+        
+        delete_btn = tk.Button(btn_frame,
+                             text="🗑️",
+                             command=lambda name=playlist_name: self.delete_playlist(name),
+                             bg='#E22134',
+                             fg='white',
+                             font=('Arial', 10),
+                             relief='flat',
+                             width=3,
+                             cursor='hand2')
+        delete_btn.pack(side=tk.LEFT, padx=2)
+        
+        self.library_cards[playlist_name] = (playlist_card, count_label)
+    
+    def update_library_stats(self):
+        """Счетчики библиотеки из накопленных сумм, без обхода плейлистов"""
+        if self.library_stats is None:
+            return
+        self.library_stats['total'].config(text=f"{self.total_tracks}")
+        self.library_stats['playlists'].config(text=f"{len(self.library.playlists)}")
+        history = self.library.history
+        self.library_stats['plays'].config(text=f"{history.total_plays}")
+        self.library_stats['skips'].config(text=f"{history.skip_rate():.0%}")
+    
+    def update_top_tracks(self, limit=5):
+        """Топ треков по прослушиваниям (запрос по индексу сводки)"""
+        top = self.library.history.top_tracks(limit)
+        if not top:
+            self.top_tracks_label.config(text="Пока ничего не прослушано")
+            return
+        lines = [f"{i}. {os.path.basename(path)} — {plays}"
+                 for i, (path, plays, skips, listened) in enumerate(top, 1)]
+        self.top_tracks_label.config(text="\n".join(lines))
     
     def play_playlist(self, playlist_name):
         """Начинает воспроизведение плейлиста"""
-        if playlist_name in self.user_playlists:
-            self.current_playlist = playlist_name
-            self.playlist = self.user_playlists[playlist_name]
-            
-            if self.playlist:
-                self.current_song_index = 0
-                self.play_song()
+        if playlist_name in self.library.playlists:
+            if self.engine.play_playlist(playlist_name):
                 self.show_home()  # Возвращаемся на главную
             else:
                 messagebox.showinfo("Плейлист пуст", f"Плейлист '{playlist_name}' пуст.")
@@ -711,20 +977,142 @@ class ModernMusicPlayer:
         
         if messagebox.askyesno("Удалить плейлист", 
                              f"Вы уверены, что хотите удалить плейлист '{playlist_name}'?"):
-            del self.user_playlists[playlist_name]
-            self.save_playlists()
-            
-            # Если удалили текущий плейлист, переключаемся на main
-            if self.current_playlist == playlist_name:
-                self.current_playlist = "main"
-                self.playlist = self.user_playlists.get("main", [])
-            
-            # Обновляем интерфейс
-            self.load_user_playlists()
-            self.show_library_content()
+            # Если удалили текущий плейлист, движок переключится на main;
+            # боковая панель и библиотека обновятся по событию
+            self.library.delete_playlist(playlist_name)
             
             messagebox.showinfo("Успешно", f"Плейлист '{playlist_name}' удален.")
     
+    def import_playlist(self):
+        """Импортирует M3U/M3U8/PLS/XSPF в новый плейлист (разбор в фоне)"""
+        if self.importer is not None and not self.importer.done:
+            messagebox.showinfo("Импорт", "Импорт уже выполняется.")
+            return
+        
+        path = filedialog.askopenfilename(
+            title="Выберите плейлист",
+            filetypes=[("Playlists", "*.m3u *.m3u8 *.pls *.xspf")]
+        )
+        if not path:
+            return
+        
+        # Имя плейлиста — имя файла, при совпадении добавляем номер
+        base_name = os.path.splitext(os.path.basename(path))[0]
+        name = base_name
+        number = 2
+        while name in self.library.playlists:
+            name = f"{base_name} ({number})"
+            number += 1
+        
+        self.import_target = name
+        self.library.create_playlist(name)
+        self.importer = PlaylistImporter(path)
+        self.importer.start()
+        self.root.after(100, self.poll_import)
+    
+    def poll_import(self):
+        """Добавляет найденные треки импортируемого плейлиста пачками"""
+        importer = self.importer
+        if importer is None:
+            return
+        
+        # Плейлист удалили во время импорта
+        if self.import_target not in self.library.playlists:
+            importer.cancel()
+            self.importer = None
+            return
+        
+        finished = importer.done
+        tracks = importer.take_results()
+        if tracks:
+            self.library.add_tracks(self.import_target, tracks)
+        
+        if not finished:
+            self.root.after(100, self.poll_import)
+            return
+        
+        self.importer = None
+        if importer.error is not None:
+            messagebox.showerror("Ошибка импорта",
+                               f"Не удалось прочитать плейлист: {importer.error}")
+            return
+        
+        added = len(self.library.playlists[self.import_target])
+        message = f"Плейлист '{self.import_target}': добавлено {added} треков"
+        if importer.missing:
+            message += f", не найдено файлов: {importer.missing}"
+        messagebox.showinfo("Импорт завершен", message)
+    
+    def find_duplicates(self):
+        """Ищет одинаковые файлы во всей библиотеке (в фоне)"""
+        if self.duplicate_finder is not None and not self.duplicate_finder.done:
+            messagebox.showinfo("Дубликаты", "Поиск уже выполняется.")
+            return
+        
+        # Похожие по звучанию ищутся, если есть признаки треков
+        self.duplicate_finder = DuplicateFinder(self.library.library_paths(),
+                                                self.library.hashes,
+                                                features=self.library.features,
+                                                info=self.library.metadata_cache.peek)
+        self.duplicate_finder.start()
+        self.root.after(200, self.poll_duplicates)
+    
+    def poll_duplicates(self):
+        """Прогресс поиска дубликатов и результат"""
+        finder = self.duplicate_finder
+        if finder is None:
+            return
+        
+        if not finder.done:
+            stages = {'size': "размеры", 'partial': "начала файлов",
+                      'full': "файлы целиком", 'similar': "звучание"}
+            if finder.stage is not None:
+                self.duplicates_label.config(
+                    text=f"{stages[finder.stage]} {finder.checked}/{finder.stage_total}")
+            self.root.after(200, self.poll_duplicates)
+            return
+        
+        self.duplicate_finder = None
+        self.duplicates_label.config(text="")
+        if not finder.groups and not finder.similar:
+            messagebox.showinfo("Дубликаты", "Одинаковых файлов не найдено.")
+            return
+        
+        copies = sum(len(group) - 1 for group in finder.groups)
+        message = f"Одинаковых файлов: {len(finder.groups)} групп, лишних копий {copies}."
+        if finder.similar:
+            # Похожие по звучанию только показываем: это могут быть разные записи
+            names = "\n".join(" = ".join(os.path.basename(path) for path in group)
+                              for group in finder.similar[:5])
+            message += f"\n\nПохожи по звучанию ({len(finder.similar)}):\n{names}"
+        if not finder.groups:
+            messagebox.showinfo("Дубликаты", message)
+            return
+        
+        if messagebox.askyesno("Дубликаты", message + "\n\nОставить в плейлистах по одному файлу?"):
+            replaced = self.library.merge_duplicates(finder.groups)
+            messagebox.showinfo("Успешно", f"Заменено копий в плейлистах: {replaced}")
+    
+    def export_playlist(self, playlist_name):
+        """Сохраняет плейлист в файл M3U/M3U8, PLS или XSPF"""
+        path = filedialog.asksaveasfilename(
+            title="Экспорт плейлиста",
+            initialfile=f"{playlist_name}.m3u8",
+            defaultextension=".m3u8",
+            filetypes=[("M3U8", "*.m3u8"), ("M3U", "*.m3u"), ("PLS", "*.pls"), ("XSPF", "*.xspf")]
+        )
+        if not path:
+            return
+        
+        try:
+            write_playlist(path, self.library.playlists[playlist_name],
+                           info=self.library.metadata_cache.peek)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Ошибка экспорта", f"Не удалось сохранить плейлист: {e}")
+            return
+        
+        messagebox.showinfo("Успешно", f"Плейлист '{playlist_name}' сохранен в {path}")
+    
     def show_favorites(self):
         """Показать избранное"""
         self.activate_nav_button("Избранное")
@@ -777,16 +1165,12 @@ class ModernMusicPlayer:
                 messagebox.showerror("Ошибка", "Введите название плейлиста")
                 return
             
-            if name in self.user_playlists:
+            if name in self.library.playlists:
                 messagebox.showerror("Ошибка", "Плейлист с таким названием уже существует")
                 return
             
-            # Создаем новый плейлист
-            self.user_playlists[name] = []
-            self.save_playlists()
-            
-            # Обновляем интерфейс
-            self.load_user_playlists()
+            # Создаем новый плейлист (интерфейс обновится по событию)
+            self.library.create_playlist(name)
             dialog.destroy()
             
             messagebox.showinfo("Успешно", f"Плейлист '{name}' создан!")
@@ -837,6 +1221,7 @@ class ModernMusicPlayer:
         self.search_entry.bind('<FocusIn>', self.on_search_focus_in)
         self.search_entry.bind('<FocusOut>', self.on_search_focus_out)
         self.search_entry.bind('<Return>', self.on_search_enter)
+        self.search_entry.bind('<KeyRelease>', self.on_search_key)
     
     def on_search_focus_in(self, event):
         if self.search_entry.get() == "Поиск музыки...":
@@ -848,10 +1233,27 @@ class ModernMusicPlayer:
             self.search_entry.insert(0, "Поиск музыки...")
             self.search_entry.config(fg='gray')
     
+    def on_search_key(self, event):
+        """Поиск по мере ввода с задержкой (debounce)"""
+        if event.keysym == 'Return':
+            return
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(150, self.on_search_idle)
+    
+    def on_search_idle(self):
+        self.search_after_id = None
+        if not self.get_search_query():
+            return
+        if self.current_view != 'search':
+            self.show_search()
+        else:
+            self.run_search()
+    
     def on_search_enter(self, event):
-        query = self.search_entry.get()
-        if query and query != "Поиск музыки...":
-            print(f"Поиск: {query}")
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.on_search_idle()
     
     def create_player_bar(self, parent):
         player_bar = tk.Frame(parent, bg='#181818', height=100)
@@ -928,7 +1330,18 @@ class ModernMusicPlayer:
                                    command=self.toggle_shuffle,
                                    **button_style)
         self.shuffle_btn.pack(side=tk.LEFT, padx=20)
-        self.shuffle_mode = False
+        
+        # Правый клик по кнопке — веса перемешивания ('' — обычное)
+        self.shuffle_weighting_var = tk.StringVar(value='')
+        self.shuffle_menu = tk.Menu(self.root, tearoff=0)
+        for label, value in (("Обычное", ''),
+                             ("Реже часто игравшие", 'plays'),
+                             ("Реже недавние", 'recent')):
+            self.shuffle_menu.add_radiobutton(label=label, value=value,
+                                              variable=self.shuffle_weighting_var,
+                                              command=self.set_shuffle_weighting)
+        self.shuffle_btn.bind('<Button-3>',
+                              lambda e: self.shuffle_menu.tk_popup(e.x_root, e.y_root))
         
         # Кнопка повтора
         self.repeat_btn = tk.Button(buttons_frame,
@@ -937,7 +1350,6 @@ class ModernMusicPlayer:
                                   command=self.toggle_repeat,
                                   **button_style)
         self.repeat_btn.pack(side=tk.LEFT, padx=5)
-        self.repeat_mode = False
         
         # Кнопка микширования
         self.mix_btn = tk.Button(buttons_frame,
@@ -961,14 +1373,10 @@ class ModernMusicPlayer:
         # Кастомный прогресс-бар
         self.progress_canvas = tk.Canvas(progress_frame, 
                                         bg='#181818',
-                                        height=4,
+                                        height=20,
                                         highlightthickness=0)
         self.progress_canvas.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=10)
-        
-        self.progress_bg = self.progress_canvas.create_rectangle(0, 0, 400, 4, 
-                                                                fill='#404040', outline='')
-        self.progress_fg = self.progress_canvas.create_rectangle(0, 0, 0, 4, 
-                                                                fill='#1DB954', outline='')
+        self.seek_bar = WaveformSeekBar(self.progress_canvas)
         
         self.progress_canvas.bind("<Button-1>", self.on_progress_click)
         self.progress_canvas.bind("<B1-Motion>", self.on_progress_drag)
@@ -1001,7 +1409,7 @@ class ModernMusicPlayer:
                                      from_=0,
                                      to=100,
                                      orient=tk.HORIZONTAL,
-                                     value=self.volume*100,
+                                     value=self.engine.volume*100,
                                      command=self.set_volume)
         
         # Стиль для ползунка
@@ -1015,80 +1423,54 @@ class ModernMusicPlayer:
     
     def toggle_shuffle(self):
         """Включить/выключить случайное воспроизведение"""
-        self.shuffle_mode = not self.shuffle_mode
-        if self.shuffle_mode:
-            self.shuffle_btn.config(fg='#1DB954')
+        self.engine.set_shuffle(not self.engine.shuffle_mode)
+        if self.engine.shuffle_mode:
             print("Случайное воспроизведение включено")
         else:
-            self.shuffle_btn.config(fg='white')
             print("Случайное воспроизведение выключено")
     
+    def set_shuffle_weighting(self):
+        """Режим весов из меню кнопки перемешивания"""
+        weighting = self.shuffle_weighting_var.get() or None
+        self.engine.set_shuffle_weighting(weighting)
+        print(f"Веса перемешивания: {weighting or 'обычные'}")
+    
     def toggle_repeat(self):
         """Включить/выключить повтор"""
-        self.repeat_mode = not self.repeat_mode
-        if self.repeat_mode:
-            self.repeat_btn.config(fg='#1DB954')
+        self.engine.set_repeat(not self.engine.repeat_mode)
+        if self.engine.repeat_mode:
             print("Повтор включен")
         else:
-            self.repeat_btn.config(fg='white')
             print("Повтор выключен")
     
     def toggle_mix(self):
         """Включить/выключить режим микширования"""
-        self.mix_mode = not self.mix_mode
-        if self.mix_mode:
-            self.mix_btn.config(fg='#9C27B0')
+        self.engine.set_mix(not self.engine.mix_mode)
+        if self.engine.mix_mode:
             print("Режим микширования включен")
-            self.start_mix_mode()
         else:
-            self.mix_btn.config(fg='white')
             print("Режим микширования выключен")
-            self.stop_mix_mode()
-    
-    def start_mix_mode(self):
-        """Запускает режим микширования"""
-        if self.mix_mode and self.playlist:
-            # Останавливаем текущее воспроизведение
-            if self.playing:
-                pygame.mixer.music.stop()
-            
-            # Запускаем микс
-            self.play_mix()
-    
-    def stop_mix_mode(self):
-        """Останавливает режим микширования"""
-        if self.mix_timer:
-            self.root.after_cancel(self.mix_timer)
-            self.mix_timer = None
-    
-    def play_mix(self):
-        """Воспроизводит микс (перемешанные треки)"""
-        if not self.mix_mode or not self.playlist:
-            return
-        
-        # Выбираем случайный трек
-        self.current_song_index = random.randint(0, len(self.playlist) - 1)
-        
-        # Воспроизводим трек
-        self.play_song()
-        
-        # Устанавливаем таймер для следующего трека
-        if self.mix_mode:
-            # Используем короткий интервал для микса (3-10 секунд)
-            mix_interval = random.randint(3000, 10000)
-            self.mix_timer = self.root.after(mix_interval, self.play_mix)
+    
+    def show_modes(self, shuffle, weighting, repeat, mix):
+        """Подсвечивает кнопки включенных режимов (событие движка)"""
+        self.shuffle_weighting_var.set(weighting or '')
+        self.shuffle_btn.config(fg='#1DB954' if shuffle else 'white')
+        self.repeat_btn.config(fg='#1DB954' if repeat else 'white')
+        self.mix_btn.config(fg='#9C27B0' if mix else 'white')
     
     def create_mix(self):
-        """Создает новый микс из случайных треков"""
-        if len(self.playlist) < 3:
+        """Создает новый микс: по звучанию из всей библиотеки или из случайных треков"""
+        smart_available = self.library.can_smart_mix()
+        if len(self.engine.playlist) < 3 and not smart_available:
             messagebox.showwarning("Недостаточно треков", 
                                  "Для создания микса нужно хотя бы 3 трека в плейлисте.")
             return
+        max_tracks = MAX_SMART_MIX if smart_available else min(20, len(self.engine.playlist))
         
         # Спрашиваем пользователя о длительности микса
         dialog = tk.Toplevel(self.root)
         dialog.title("Создать микс")
-        dialog.geometry("400x250")
+        dialog.geometry("400x290")
         dialog.configure(bg='#121212')
         dialog.resizable(False, False)
         
@@ -1118,10 +1500,10 @@ class ModernMusicPlayer:
                 bg='#121212',
                 fg='white').pack(pady=5)
         
-        track_count_var = tk.StringVar(value=str(min(10, len(self.playlist))))
+        track_count_var = tk.StringVar(value=str(min(10, max_tracks)))
         track_count_spin = tk.Spinbox(dialog,
                                     from_=3,
-                                    to=min(20, len(self.playlist)),
+                                    to=max_tracks,
                                     textvariable=track_count_var,
                                     font=('Segoe UI', 12),
                                     width=10)
@@ -1142,6 +1524,19 @@ class ModernMusicPlayer:
         mix_name_entry.pack(pady=5, padx=40, fill=tk.X)
         mix_name_entry.insert(0, f"Микс {time.strftime('%d.%m.%Y')}")
         
+        # Подбор по темпу, тональности и энергии (когда признаки посчитаны)
+        smart_var = tk.BooleanVar(value=smart_available)
+        tk.Checkbutton(dialog,
+                      text="Подобрать по звучанию из всей библиотеки",
+                      variable=smart_var,
+                      state=tk.NORMAL if smart_available else tk.DISABLED,
+                      font=('Segoe UI', 10),
+                      bg='#121212',
+                      fg='white',
+                      selectcolor='#121212',
+                      activebackground='#121212',
+                      activeforeground='white').pack(pady=(10, 0))
+        
         # Кнопки
         button_frame = tk.Frame(dialog, bg='#121212')
         button_frame.pack(pady=20)
@@ -1154,18 +1549,24 @@ class ModernMusicPlayer:
                 messagebox.showerror("Ошибка", "Введите название микса")
                 return
             
-            # Выбираем случайные треки
-            if track_count > len(self.playlist):
-                track_count = len(self.playlist)
+            mix_tracks = []
+            if smart_var.get():
+                # Начинаем с играющего трека, дальше — плавные переходы
+                mix_tracks = self.library.smart_mix(track_count, seed=self.engine.current_path)
             
-            mix_tracks = random.sample(self.playlist, track_count)
+            if len(mix_tracks) < 3:
+                # Выбираем случайные треки
+                if track_count > len(self.engine.playlist):
+                    track_count = len(self.engine.playlist)
+                if track_count < 3:
+                    messagebox.showwarning("Недостаточно треков",
+                                         "Для создания микса нужно хотя бы 3 трека в плейлисте.")
+                    return
+                mix_tracks = random.sample(self.engine.playlist, track_count)
+            track_count = len(mix_tracks)
             
             # Создаем новый плейлист с миксом
-            self.user_playlists[mix_name] = mix_tracks
-            self.save_playlists()
-            
-            # Обновляем интерфейс
-            self.load_user_playlists()
+            self.library.create_playlist(mix_name, mix_tracks)
             dialog.destroy()
             
             # Переключаемся на новый микс
@@ -1204,100 +1605,10 @@ class ModernMusicPlayer:
         """Включить/выключить беззвучный режим"""
         self.is_muted = not self.is_muted
         if self.is_muted:
-            self.old_volume = self.volume
-            pygame.mixer.music.set_volume(0)
-            self.volume_slider.set(0)
+            self.old_volume = self.engine.volume
+            self.engine.set_volume(0)
         else:
-            pygame.mixer.music.set_volume(self.old_volume)
-            self.volume_slider.set(self.old_volume * 100)
-    
-    def load_sample_tracks(self):
-        """Загружает несколько тестовых треков для демонстрации"""
-        sample_tracks = [
-            ("Lofi Chill Mix", "Chillhop Music", "3:45"),
-            ("Summer Vibes", "Tropical House", "4:20"),
-            ("Deep Focus", "Study Music", "5:10"),
-            ("Evening Jazz", "Jazz Vibes", "4:55"),
-            ("Workout Energy", "Power Music", "3:30")
-        ]
-        
-        for i, (track, artist, duration) in enumerate(sample_tracks):
-            track_frame = tk.Frame(self.playlist_frame, bg='#181818')
-            track_frame.pack(fill=tk.X, pady=2)
-            
-            # Номер трека
-            num_label = tk.Label(track_frame,
-                               text=str(i+1),
-                               font=self.time_font,
-                               bg='#181818',
-                               fg='#b3b3b3',
-                               width=3)
-            num_label.pack(side=tk.LEFT, padx=10)
-            
-            # Иконка воспроизведения
-            play_icon = tk.Label(track_frame,
-                               text="▶",
-                               font=('Arial', 10),
-                               bg='#181818',
-                               fg='#181818')
-            play_icon.pack(side=tk.LEFT)
-            
-            # Информация о треке
-            info_frame = tk.Frame(track_frame, bg='#181818')
-            info_frame.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=10)
-            
-            track_label = tk.Label(info_frame,
-                                 text=track,
-                                 font=self.song_font,
-                                 bg='#181818',
-                                 fg='white',
-                                 anchor='w')
-            track_label.pack(fill=tk.X)
-            
-            artist_label = tk.Label(info_frame,
-                                  text=artist,
-                                  font=self.time_font,
-                                  bg='#181818',
-                                  fg='#b3b3b3',
-                                  anchor='w')
-            artist_label.pack(fill=tk.X)
-            
-            # Длительность
-            dur_label = tk.Label(track_frame,
-                               text=duration,
-                               font=self.time_font,
-                               bg='#181818',
-                               fg='#b3b3b3')
-            dur_label.pack(side=tk.RIGHT, padx=20)
-            
-            # Эффекты при наведении
-            def on_enter(e, frame=track_frame, icon=play_icon, num=num_label):
-                frame.config(bg='#282828')
-                icon.config(bg='#282828', fg='white')
-                num.config(bg='#282828')
-                info_frame.config(bg='#282828')
-                track_label.config(bg='#282828')
-                artist_label.config(bg='#282828')
-                dur_label.config(bg='#282828')
-            
-            def on_leave(e, frame=track_frame, icon=play_icon, num=num_label):
-                frame.config(bg='#181818')
-                icon.config(bg='#181818', fg='#181818')
-                num.config(bg='#181818')
-                info_frame.config(bg='#181818')
-                track_label.config(bg='#181818')
-                artist_label.config(bg='#181818')
-                dur_label.config(bg='#181818')
-            
-            track_frame.bind("<Enter>", on_enter)
-            track_frame.bind("<Leave>", on_leave)
-            
-            # Храним информацию о треке
-            self.track_frames[track] = {
-                'frame': track_frame,
-                'track_label': track_label,
-                'artist_label': artist_label
-            }
+            self.engine.set_volume(self.old_volume)
     
     def add_songs(self):
         files = filedialog.askopenfilenames(
@@ -1306,259 +1617,169 @@ class ModernMusicPlayer:
         )
         
         if files:
-            for file in files:
-                if file not in self.playlist:
-                    self.playlist.append(file)
-            
-            # Сохраняем в текущий плейлист
-            self.user_playlists[self.current_playlist] = self.playlist
-            self.save_playlists()
+            # Добавляем в текущий плейлист (изменение пишется в журнал)
+            self.library.add_tracks(self.engine.current_playlist, files)
             
             # Обновляем отображение
             self.refresh_playlist_display()
             
-            messagebox.showinfo("Успешно", f"Добавлено {len(files)} треков в '{self.current_playlist}'")
+            messagebox.showinfo("Успешно", f"Добавлено {len(files)} треков в '{self.engine.current_playlist}'")
+    
+    def scan_folder(self):
+        """Рекурсивно сканирует папку и добавляет найденные треки в фоне"""
+        if self.scanner is not None and not self.scanner.done:
+            messagebox.showinfo("Сканирование", "Сканирование уже выполняется.")
+            return
+        
+        folder = filedialog.askdirectory(title="Выберите папку с музыкой")
+        if not folder:
+            return
+        
+        self.scan_target = self.engine.current_playlist
+        self.scanner = LibraryScanner(folder)
+        self.scanner.start()
+        
+        # Дальше папка отслеживается: новые треки попадут в этот же плейлист
+        if self.library.add_root(folder, self.scan_target) and self.watcher is not None:
+            self.watcher.add_root(folder)
+        self.root.after(100, self.poll_scan)
+    
+    def poll_scan(self):
+        """Забирает результаты сканирования пачками в главном цикле Tk"""
+        scanner = self.scanner
+        if scanner is None:
+            return
+        
+        # Флаг читаем до забора результатов, чтобы не потерять последнюю пачку
+        finished = scanner.done
+        entries = scanner.take_results()
+        
+        if entries:
+            self.library.metadata_cache.put_many(entries)
+            
+            self.library.add_tracks(self.scan_target,
+                                    [entry['path'] for entry in entries])
+            
+            if self.scan_target == self.engine.current_playlist:
+                self.refresh_playlist_display()
+        
+        if finished:
+            self.scanner = None
+            self.library.flush()
+            self.update_track_count()
+            messagebox.showinfo("Успешно", 
+                              f"Сканирование завершено: найдено {scanner.probed} треков "
+                              f"для '{self.scan_target}'")
+            return
+        
+        # Прогресс
+        if self.scan_target == self.engine.current_playlist:
+            self.track_count_label.config(
+                text=f"{len(self.engine.playlist)} треков • сканирование {scanner.probed}/{scanner.found}")
+        self.root.after(100, self.poll_scan)
     
     def clear_playlist(self):
         """Очистить весь плейлист"""
-        if self.playlist:
+        if self.engine.playlist:
             if messagebox.askyesno("Очистить плейлист", 
-                                 f"Вы уверены, что хотите очистить плейлист '{self.current_playlist}'?"):
-                # Останавливаем воспроизведение
-                if self.playing:
-                    pygame.mixer.music.stop()
-                    self.playing = False
-                    self.paused = False
-                    self.play_btn.config(text="▶")
-                
-                # Останавливаем микс если активен
-                if self.mix_mode:
-                    self.stop_mix_mode()
-                    self.mix_mode = False
-                    self.mix_btn.config(fg='white')
-                
-                # Очищаем плейлист
-                self.playlist.clear()
-                self.user_playlists[self.current_playlist] = []
-                self.save_playlists()
+                                 f"Вы уверены, что хотите очистить плейлист '{self.engine.current_playlist}'?"):
+                # Останавливаем воспроизведение и микс, очищаем плейлист
+                self.engine.clear_playlist()
                 
                 # Обновляем отображение
                 self.refresh_playlist_display()
                 
                 # Сбрасываем информацию о текущем треке
                 self.current_track_label.config(text="Не воспроизводится")
-                self.current_artist_label.config(text=f"Плейлист '{self.current_playlist}' очищен")
+                self.current_artist_label.config(text=f"Плейлист '{self.engine.current_playlist}' очищен")
                 self.time_current.config(text="0:00")
                 self.time_total.config(text="0:00")
-                self.progress_canvas.coords(self.progress_fg, 0, 0, 0, 4)
+                self.seek_bar.set_summary(None)
+                self.seek_bar.set_progress(0)
                 
-                print(f"Плейлист '{self.current_playlist}' очищен")
+                print(f"Плейлист '{self.engine.current_playlist}' очищен")
     
     def update_track_count(self):
         """Обновляет счетчик треков"""
-        count = len(self.playlist)
+        count = len(self.engine.playlist)
         self.track_count_label.config(text=f"{count} треков")
-    
-    def add_track_to_display(self, index, file_path):
-        """Добавляет трек в отображаемый плейлист"""
-        song_name = os.path.basename(file_path)
-        
-        track_frame = tk.Frame(self.scrollable_frame, bg='#181818')
-        track_frame.pack(fill=tk.X, pady=2)
         
-        # Номер трека
-        num_label = tk.Label(track_frame,
-                           text=str(index + 1),
-                           font=self.time_font,
-                           bg='#181818',
-                           fg='#b3b3b3',
-                           width=3)
-        num_label.pack(side=tk.LEFT, padx=10)
-        
-        # Иконка воспроизведения
-        play_icon = tk.Label(track_frame,
-                           text="▶",
-                           font=('Arial', 10),
-                           bg='#181818',
-                           fg='#181818')
-        play_icon.pack(side=tk.LEFT)
-        
-        # Информация о треке
-        info_frame = tk.Frame(track_frame, bg='#181818')
-        info_frame.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=10)
-        
-        track_label = tk.Label(info_frame,
-                             text=song_name,
-                             font=self.song_font,
-                             bg='#181818',
-                             fg='white',
-                             anchor='w')
-        track_label.pack(fill=tk.X)
-        
-        # Получаем информацию о файле
-        try:
-            audio = MP3(file_path)
-            duration = time.strftime('%M:%S', time.gmtime(audio.info.length))
-            bitrate = f"{audio.info.bitrate // 1000} kbps"
-            artist_info = f"{duration} • {bitrate}"
-        except:
-            artist_info = "Неизвестный артист"
-            duration = "--:--"
-        
-        artist_label = tk.Label(info_frame,
-                              text=artist_info,
-                              font=self.time_font,
-                              bg='#181818',
-                              fg='#b3b3b3',
-                              anchor='w')
-        artist_label.pack(fill=tk.X)
-        
-        # Длительность
-        dur_label = tk.Label(track_frame,
-                           text=duration,
-                           font=self.time_font,
-                           bg='#181818',
-                           fg='#b3b3b3')
-        dur_label.pack(side=tk.RIGHT, padx=20)
-        
-        # Кнопка удаления из плейлиста
-        delete_btn = tk.Button(track_frame,
-                             text="🗑️",
-                             font=('Arial', 8),
-                             bg='#181818',
-                             fg='#b3b3b3',
-                             relief='flat',
-                             width=2,
-                             cursor='hand2',
-                             command=lambda path=file_path: self.remove_from_playlist(path))
-        delete_btn.pack(side=tk.RIGHT, padx=5)
-        
-        # Эффекты при наведении и клике
-        def on_enter(e):
-            track_frame.config(bg='#282828')
-            for widget in [num_label, play_icon, info_frame, track_label, 
-                          artist_label, dur_label, delete_btn]:
-                widget.config(bg='#282828')
-            play_icon.config(fg='white')
-        
-        def on_leave(e):
-            track_frame.config(bg='#181818')
-            for widget in [num_label, play_icon, info_frame, track_label, 
-                          artist_label, dur_label, delete_btn]:
-                widget.config(bg='#181818')
-            play_icon.config(fg='#181818')
-        
-        def on_click(e):
-            index = self.playlist.index(file_path)
-            self.current_song_index = index
-            self.play_song()
-        
-        track_frame.bind("<Enter>", on_enter)
-        track_frame.bind("<Leave>", on_leave)
-        track_frame.bind("<Button-1>", on_click)
-        
-        # Храним информацию о треке
-        self.track_frames[file_path] = {
-            'frame': track_frame,
-            'track_label': track_label,
-            'artist_label': artist_label
-        }
+        # Статистика главной страницы
+        self.home_stats['current'][0].config(text=f"{count}")
+        self.home_stats['playlists'][0].config(text=f"{len(self.library.playlists)}")
+        self.home_stats['total'][0].config(text=f"{self.total_tracks}")
+    
+    def play_track(self, index):
+        """Воспроизводит трек текущего плейлиста по индексу"""
+        self.engine.play_index(index)
     
     def remove_from_playlist(self, file_path):
         """Удаляет трек из плейлиста"""
-        if file_path in self.playlist:
-            # Если этот трек сейчас играет, останавливаем
-            if self.playing and self.playlist[self.current_song_index] == file_path:
-                pygame.mixer.music.stop()
-                self.playing = False
-                self.paused = False
-                self.play_btn.config(text="▶")
-            
-            # Удаляем из плейлиста
-            self.playlist.remove(file_path)
-            self.user_playlists[self.current_playlist] = self.playlist
-            self.save_playlists()
+        if file_path in self.engine.playlist:
+            self.engine.remove_track(file_path)
             
             # Обновляем отображение
             self.refresh_playlist_display()
             
             print(f"Трек удален из плейлиста")
     
-    def play_song(self):
-        if not self.playlist:
-            return
-            
-        song_path = self.playlist[self.current_song_index]
+    def on_engine_event(self, event, data):
+        """Обновляет интерфейс по событиям движка воспроизведения"""
+        if event == 'track':
+            self.show_track_info(data['path'])
+            self.update_library_stats()
+        elif event == 'state':
+            self.play_btn.config(text="⏸" if data['playing'] else "▶")
+            if data['playing']:
+                self.start_ticker()
+                self.start_visualizer()
+        elif event == 'seek':
+            self.show_position(data['position'])
+        elif event == 'volume':
+            # Громкость могли изменить не ползунком
+            if abs(self.volume_slider.get() - data['volume'] * 100) > 0.5:
+                self.volume_slider.set(data['volume'] * 100)
+        elif event == 'modes':
+            self.show_modes(data['shuffle'], data['weighting'], data['repeat'], data['mix'])
+        elif event == 'playlist':
+            self.show_playlist(data['name'])
+        elif event == 'error':
+            self.current_artist_label.config(text=data['message'])
+    
+    def show_track_info(self, song_path):
+        """Обновляет информацию о текущем треке"""
         song_name = os.path.basename(song_path)
-        
-        try:
-            pygame.mixer.music.load(song_path)
-            pygame.mixer.music.play()
-            self.playing = True
-            self.paused = False
-            
-            # Обновление информации
-            self.current_track_label.config(text=song_name)
-            self.play_btn.config(text="⏸")
-            
-            # Получение информации о треке
-            try:
-                audio = MP3(song_path)
-                self.song_length = audio.info.length
-                total_time = time.strftime('%M:%S', time.gmtime(self.song_length))
-                self.time_total.config(text=total_time)
-            except:
-                self.song_length = 300
-                self.time_total.config(text="5:00")
-            
-            # Добавляем в историю
-            if song_name not in self.recently_played:
-                self.recently_played.append(song_name)
-            
-        except Exception as e:
-            print(f"Ошибка воспроизведения: {e}")
-            self.current_artist_label.config(text="Ошибка воспроизведения файла")
+        self.current_track_label.config(text=song_name)
+        
+        # Визуализатор декодирует новый трек в фоне
+        if self.spectrum is not None:
+            self.spectrum.load(song_path)
+        self.start_visualizer()
+        
+        # Форма волны: готовая сводка с диска или запрос на построение вне очереди
+        self.seek_bar.set_progress(0)
+        summary = self.waveforms.load(song_path) if self.waveforms is not None else None
+        self.seek_bar.set_summary(summary)
+        if summary is None and self.waveform_builder is not None:
+            self.waveform_builder.request(song_path)
+        
+        # Длительность движок берет из кэша метаданных
+        total_time = time.strftime('%M:%S', time.gmtime(self.engine.song_length))
+        self.time_total.config(text=total_time)
     
     def play_pause(self):
-        if not self.playlist:
-            self.current_artist_label.config(text="Плейлист пуст. Добавьте музыку.")
-            return
-            
-        if not self.playing:
-            if self.paused:
-                pygame.mixer.music.unpause()
-                self.paused = False
-                self.playing = True
-                self.play_btn.config(text="⏸")
-            else:
-                self.play_song()
-        else:
-            pygame.mixer.music.pause()
-            self.playing = False
-            self.paused = True
-            self.play_btn.config(text="▶")
+        self.engine.play_pause()
     
     def next_song(self):
-        if not self.playlist:
-            return
-            
-        if self.shuffle_mode:
-            self.current_song_index = random.randint(0, len(self.playlist) - 1)
-        else:
-            self.current_song_index = (self.current_song_index + 1) % len(self.playlist)
-        
-        self.play_song()
+        self.engine.next_song()
     
     def prev_song(self):
-        if not self.playlist:
-            return
-            
-        self.current_song_index = (self.current_song_index - 1) % len(self.playlist)
-        self.play_song()
+        self.engine.prev_song()
     
     def set_volume(self, val):
-        self.volume = float(val) / 100
-        pygame.mixer.music.set_volume(self.volume)
+        volume = float(val) / 100
+        if abs(volume - self.engine.volume) > 1e-6:
+            self.engine.set_volume(volume)
     
     def on_progress_click(self, event):
         """Обработка клика по прогресс-бару"""
@@ -1566,80 +1787,134 @@ class ModernMusicPlayer:
     
     def on_progress_drag(self, event):
         """Обработка перетаскивания прогресс-бара"""
-        if hasattr(self, 'song_length') and self.song_length > 0:
-            canvas_width = self.progress_canvas.winfo_width()
-            if canvas_width > 0:
-                click_pos = min(max(event.x / canvas_width, 0), 1)
-                new_time = self.song_length * click_pos
-                pygame.mixer.music.set_pos(new_time)
-                
-                # Немедленное обновление отображения
-                self.time_current.config(text=time.strftime('%M:%S', time.gmtime(new_time)))
-                bar_width = int(canvas_width * click_pos)
-                self.progress_canvas.coords(self.progress_fg, 0, 0, bar_width, 4)
+        canvas_width = self.progress_canvas.winfo_width()
+        if self.engine.song_length > 0 and canvas_width > 0:
+            click_pos = min(max(event.x / canvas_width, 0), 1)
+            self.engine.seek(self.engine.song_length * click_pos)
+    
+    def show_position(self, position):
+        """Показывает позицию в треке"""
+        self.time_current.config(text=time.strftime('%M:%S', time.gmtime(position)))
+        if self.engine.song_length > 0:
+            self.seek_bar.set_progress(position / self.engine.song_length)
+    
+    def start_ticker(self):
+        """Запускает обновление позиции. Тикер работает только во время воспроизведения"""
+        if self.tick_after_id is not None:
+            self.root.after_cancel(self.tick_after_id)
+        self.tick_after_id = self.root.after_idle(self.update_time)
     
+    def next_tick_interval(self, current_time):
+        """Интервал до следующего обновления в мс.
+        
+        Прогресс-бар должен сдвинуться хотя бы на пиксель, а счетчик времени —
+        смениться в начале следующей секунды. К ожидаемому концу трека
+        тикер просыпается заранее, чтобы быстро обработать событие pygame.
+        """
+        if self.root.state() == 'iconic':
+            return 1000
+        
+        interval = 1000 - (current_time % 1) * 1000
+        canvas_width = self.progress_canvas.winfo_width()
+        if self.engine.song_length > 0 and canvas_width > 1:
+            interval = min(interval, self.engine.song_length * 1000 / canvas_width)
+            remaining = (self.engine.song_length - current_time) * 1000
+            if remaining > 0:
+                interval = min(interval, remaining + 20)
+        return int(min(max(interval, 50), 1000))
+    
+    @tracer.traced()
     def update_time(self):
-        if self.playing and hasattr(self, 'song_length'):
-            current_time = pygame.mixer.music.get_pos() / 1000
-            
-            # Проверка на завершение трека
-            if current_time >= self.song_length and self.song_length > 0:
-                if self.repeat_mode:
-                    pygame.mixer.music.rewind()
-                    pygame.mixer.music.play()
-                else:
-                    self.next_song()
-            elif current_time >= 0:  # Корректное время
-                # Обновление времени
-                self.time_current.config(text=time.strftime('%M:%S', 
-                                                          time.gmtime(current_time)))
-                
-                # Обновление прогресс-бара
-                if self.song_length > 0:
-                    progress = current_time / self.song_length
-                    canvas_width = self.progress_canvas.winfo_width()
-                    if canvas_width > 0:
-                        bar_width = int(canvas_width * progress)
-                        self.progress_canvas.coords(self.progress_fg, 0, 0, 
-                                                   bar_width, 4)
+        self.tick_after_id = None
+        
+        # Окончание трека, очередь и события микса обрабатывает движок
+        self.engine.poll()
+        self.poll_waveforms()
+        
+        # На паузе и в остановке тикер не перезапускается
+        if not self.engine.playing:
+            return
+        
+        current_time = self.engine.position()
+        self.show_position(current_time)
         
-        self.root.after(100, self.update_time)
+        # Событие 'state' из engine.poll() могло уже запустить новый тикер
+        if self.tick_after_id is None:
+            self.tick_after_id = self.root.after(self.next_tick_interval(current_time),
+                                                 self.update_time)
+    
+    def poll_waveforms(self):
+        """Показывает форму волны, как только она построена для текущего трека"""
+        if self.waveform_builder is None:
+            return
+        while True:
+            try:
+                path = self.waveform_builder.done.get_nowait()
+            except queue.Empty:
+                break
+            if path == self.engine.current_path and self.seek_bar.summary is None:
+                self.seek_bar.set_summary(self.waveforms.load(path))
+    
+    def start_visualizer(self):
+        """Запускает анимацию визуализатора, если она остановлена"""
+        if self.viz_after_id is None:
+            self.viz_after_id = self.root.after_idle(self.animate_visualizer)
+    
+    def create_visualizer_bars(self, width, height):
+        """Создает столбики один раз; дальше они только двигаются через coords()"""
+        self.viz_canvas.delete("all")
+        self.viz_bars = []
+        for i in range(NUM_BANDS):
+            color_intensity = int(100 + 155 * (i / NUM_BANDS))
+            color = f'#{color_intensity:02x}{255:02x}{color_intensity:02x}'
+            self.viz_bars.append(self.viz_canvas.create_rectangle(0, height, 0, height,
+                                                                  fill=color, outline=''))
+        self.viz_bars_canvas = self.viz_canvas
     
+    @tracer.traced()
     def animate_visualizer(self):
-        """Анимация визуализатора"""
-        if hasattr(self, 'viz_canvas') and self.viz_canvas.winfo_exists():
-            self.viz_canvas.delete("all")
-            
-            width = self.viz_canvas.winfo_width()
-            height = self.viz_canvas.winfo_height()
-            
-            if width > 10 and height > 10:
-                num_bars = 30
-                bar_width = max(2, width // (num_bars * 2))
-                
-                for i in range(num_bars):
-                    x = i * (bar_width * 1.5) + 20
-                    
-                    base_height = height * 0.3
-                    if self.playing:
-                        time_factor = (time.time() * 2 + i * 0.3) % 1
-                        dynamic_height = base_height * (0.5 + 0.5 * abs(time_factor - 0.5))
-                    else:
-                        dynamic_height = base_height * 0.3
-                    
-                    color_intensity = int(100 + 155 * (i / num_bars))
-                    color = f'#{color_intensity:02x}{255:02x}{color_intensity:02x}'
-                    
-                    bar_height = int(dynamic_height * (0.7 + 0.3 * (i % 3)))
-                    self.viz_canvas.create_rectangle(x, height - bar_height,
-                                                   x + bar_width, height,
-                                                   fill=color, outline='')
-        
-        if self.root.winfo_exists():
-            self.root.after(100, self.animate_visualizer)
+        """Анимация визуализатора по спектру играющего трека"""
+        self.viz_after_id = None
+        
+        # Визуализатор не виден — анимация останавливается до <Map>
+        # или возврата на главную страницу
+        if (not hasattr(self, 'viz_canvas') or self.current_view != 'home'
+                or not self.viz_canvas.winfo_viewable()):
+            if self.spectrum is not None:
+                self.spectrum.set_active(False)
+            return
+        
+        width = self.viz_canvas.winfo_width()
+        height = self.viz_canvas.winfo_height()
+        if width <= 10 or height <= 10:
+            return
+        
+        if self.viz_bars_canvas is not self.viz_canvas:
+            self.create_visualizer_bars(width, height)
+        
+        animated = self.engine.playing and self.spectrum is not None
+        if self.spectrum is not None:
+            self.spectrum.set_active(animated)
+        levels = self.spectrum.levels if animated else None
+        
+        bar_width = max(2, width // (NUM_BANDS * 2))
+        for i, bar in enumerate(self.viz_bars):
+            x = i * (bar_width * 1.5) + 20
+            if levels is not None:
+                bar_height = max(2, int(levels[i] * height * 0.9))
+            else:
+                # Статичные столбики, пока ничего не играет
+                bar_height = int(height * 0.3 * 0.3 * (0.7 + 0.3 * (i % 3)))
+            self.viz_canvas.coords(bar, x, height - bar_height, x + bar_width, height)
+        
+        # Без воспроизведения кадр рисуется один раз
+        if animated:
+            self.viz_after_id = self.root.after(33, self.animate_visualizer)
 
 def main():
+    startup.mark('imports')
     root = tk.Tk()
+    startup.mark('tk')
     app = ModernMusicPlayer(root)
     
     # Центрируем окно
@@ -1649,15 +1924,29 @@ def main():
     x = (root.winfo_screenwidth() // 2) - (width // 2)
     y = (root.winfo_screenheight() // 2) - (height // 2)
     root.geometry(f'{width}x{height}+{x}+{y}')
+    startup.mark('window')
     
     # Сообщение при закрытии
     def on_closing():
-        # Сохраняем данные
-        app.save_playlists()
-        
-        # Останавливаем музыку
-        pygame.mixer.music.stop()
-        pygame.mixer.quit()
+        # Останавливаем сервер, сканирование и фоновый анализ звука
+        if app.control is not None:
+            app.control.stop()
+        if app.scanner is not None:
+            app.scanner.cancel()
+        if app.importer is not None:
+            app.importer.cancel()
+        if app.watcher is not None:
+            app.watcher.stop()
+        if app.duplicate_finder is not None:
+            app.duplicate_finder.cancel()
+        if app.spectrum is not None:
+            app.spectrum.stop()
+        if app.waveform_builder is not None:
+            app.waveform_builder.stop()
+        
+        # Останавливаем музыку и микс, сохраняем данные
+        app.engine.close()
+        app.library.close()
         root.destroy()
     
     root.protocol("WM_DELETE_WINDOW", on_closing)
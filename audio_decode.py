@@ -0,0 +1,72 @@
+import os
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# pygame импортируется при первом обращении: вместе с зависимостями это
+# около 0.3 с, которые иначе ушли бы на запуск окна
+pygame = None
+_pygame_lock = threading.Lock()
+
+
+def numpy_available():
+    return np is not None
+
+
+def load_pygame():
+    """Импортирует pygame (один раз, из любого потока) и возвращает модуль"""
+    global pygame
+    with _pygame_lock:
+        if pygame is None:
+            import pygame as module
+            pygame = module
+    return pygame
+
+
+def init_mixer():
+    """Открывает mixer, если он еще не открыт. Возвращает модуль pygame"""
+    module = load_pygame()
+    with _pygame_lock:
+        if not module.mixer.get_init():
+            module.mixer.init()
+    return module
+
+
+def init_decoder():
+    """Инициализирует mixer в отдельном процессе, где нет звукового устройства"""
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    init_mixer()
+
+
+def decode_pcm(path, mono=True):
+    """Декодирует файл в float32 [-1, 1]. Возвращает (samples, sample_rate).
+
+    Декодирование идет через pygame.mixer.Sound, поэтому поддерживаются те
+    же форматы, что и при воспроизведении, а частота совпадает с частотой
+    микшера. При mono=False samples имеет форму (сэмплы, каналы).
+    """
+    if np is None:
+        raise RuntimeError("Для анализа звука нужен numpy")
+
+    init_mixer()
+    sound = pygame.mixer.Sound(path)
+    samples = pygame.sndarray.array(sound)
+    sample_rate = pygame.mixer.get_init()[0]
+
+    if samples.dtype.kind in 'iu':
+        info = np.iinfo(samples.dtype)
+        scale = float(max(abs(info.min), info.max))
+        offset = 0.0 if info.min < 0 else scale / 2
+        samples = (samples.astype(np.float32) - offset) / scale
+    else:
+        samples = samples.astype(np.float32, copy=False)
+
+    if not mono:
+        if samples.ndim == 1:
+            samples = samples[:, np.newaxis]
+    elif samples.ndim > 1:
+        samples = samples.mean(axis=1, dtype=np.float32)
+    return samples, sample_rate
@@ -0,0 +1,173 @@
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from audio_decode import init_decoder
+
+
+# Через сколько секунд без работы процессы анализа завершаются
+IDLE_SHUTDOWN = 5.0
+
+
+def _spawn_pool(workers):
+    # spawn: дочерние процессы не наследуют потоки Tk и pygame
+    return ProcessPoolExecutor(max_workers=workers,
+                               mp_context=multiprocessing.get_context('spawn'),
+                               initializer=init_decoder)
+
+
+class DecodeWorker:
+    """Один процесс для декодирования по запросу (форма волны, спектр).
+
+    В процессе UI звук не декодируется: pygame там открывает настоящее
+    звуковое устройство и делит GIL с Tk. Процесс создается при первом
+    вызове и завершается после IDLE_SHUTDOWN секунд без работы.
+    """
+
+    def __init__(self, idle_shutdown=IDLE_SHUTDOWN):
+        self.idle_shutdown = idle_shutdown
+        self._lock = threading.Lock()
+        self._executor = None
+        self._busy = 0
+        self._timer = None
+        self._closed = False
+
+    def run(self, function, *args):
+        """function(*args) в процессе декодирования; ждет и возвращает результат"""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Процесс декодирования остановлен")
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._executor is None:
+                self._executor = _spawn_pool(1)
+            executor = self._executor
+            self._busy += 1
+        try:
+            return executor.submit(function, *args).result()
+        except BrokenProcessPool:
+            # Процесс упал (например, на битом файле) — следующий вызов создаст новый
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            raise
+        finally:
+            with self._lock:
+                self._busy -= 1
+                if not self._busy and self._executor is not None and not self._closed:
+                    self._timer = threading.Timer(self.idle_shutdown, self._shutdown_idle)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+    def _shutdown_idle(self):
+        with self._lock:
+            if self._busy or self._executor is None:
+                return
+            executor, self._executor = self._executor, None
+            self._timer = None
+        executor.shutdown(wait=True)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class BatchAnalyzer:
+    """Пакетный анализ треков библиотеки в пуле процессов.
+
+    analyze(path) выполняется в дочернем процессе и возвращает запись для
+    store (нужны is_current, put и flush). Пути принимаются через enqueue()
+    в любой момент. Треки, для которых в хранилище уже есть актуальная
+    запись, пропускаются — поэтому прерванный анализ при следующем запуске
+    продолжается с того же места. Процессы создаются только при наличии
+    работы и завершаются после простоя.
+    """
+
+    def __init__(self, store, analyze, workers=None, max_in_flight=None, name="batch-analyzer"):
+        self.store = store
+        self.analyze = analyze
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.analyzed = 0
+
+        # Подписчики на готовые записи: callback(entry), вызываются в потоке анализа
+        self.listeners = []
+
+        self._paths = queue.Queue()
+        self._slots = threading.BoundedSemaphore(max_in_flight or self.workers * 2)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def enqueue(self, paths):
+        for path in paths:
+            self._paths.put(path)
+
+    def stop(self):
+        self._stop.set()
+        self._paths.put(None)
+
+    def _run(self):
+        executor = None
+        seen = set()
+        while not self._stop.is_set():
+            try:
+                path = self._paths.get(timeout=IDLE_SHUTDOWN)
+            except queue.Empty:
+                # Простой: освобождаем процессы, когда все задачи завершены
+                if executor is not None and self._in_flight == 0:
+                    executor.shutdown(wait=True)
+                    executor = None
+                    self.store.flush()
+                continue
+            if path is None or path in seen:
+                continue
+
+            try:
+                if self.store.is_current(path, os.stat(path)):
+                    continue
+            except OSError:
+                continue
+            seen.add(path)
+
+            if executor is None:
+                executor = _spawn_pool(self.workers)
+            self._slots.acquire()
+            if self._stop.is_set():
+                self._slots.release()
+                break
+            with self._lock:
+                self._in_flight += 1
+            future = executor.submit(self.analyze, path)
+            future.add_done_callback(lambda f, path=path: self._on_analyzed(f, path))
+
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _on_analyzed(self, future, path):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+        # После stop() хранилище может быть уже закрыто
+        if future.cancelled() or self._stop.is_set():
+            return
+        try:
+            entry = future.result()
+        except Exception as e:
+            print(f"Не удалось проанализировать {path}: {e}")
+            return
+        self.store.put(entry)
+        self.analyzed += 1
+        for callback in self.listeners:
+            callback(entry)
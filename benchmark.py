@@ -0,0 +1,392 @@
+import argparse
+import gc
+import json
+import math
+import os
+import random
+import resource
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import wave
+
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+from library_store import LibraryStore
+from metadata_cache import probe_file
+from player_engine import PlayerEngine
+
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_REPEAT = 20
+
+# Сколько настоящих аудиофайлов генерируется для запуска треков
+AUDIO_FILES = 20
+AUDIO_SECONDS = 1.0
+AUDIO_RATE = 22050
+
+# Насколько может вырасти p50 относительно baseline, прежде чем это регрессия
+REGRESSION_THRESHOLD = 0.25
+# Операции быстрее этого порога не сравниваются: разница — шум таймера
+COMPARE_FLOOR_MS = 0.05
+
+WORDS = ("love night dance fire heart summer rain dream light road city star blue "
+         "wild gold river ocean shadow electric midnight morning home sky winter "
+         "echo silver paper storm lonely free young forever wave moon").split()
+
+SEARCH_QUERIES = ("love", "midnight city", "elec", "riv", "artist 42", "sumer", "zzzz")
+
+
+def percentile(sorted_values, q):
+    """Перцентиль с линейной интерполяцией"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q
+    low = math.floor(position)
+    high = math.ceil(position)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+def summarize(samples):
+    values = sorted(samples)
+    return {
+        'n': len(values),
+        'mean_ms': sum(values) / len(values) * 1000,
+        'p50_ms': percentile(values, 0.50) * 1000,
+        'p95_ms': percentile(values, 0.95) * 1000,
+        'p99_ms': percentile(values, 0.99) * 1000,
+        'max_ms': values[-1] * 1000,
+    }
+
+
+class BenchmarkRun:
+    """Результаты одного прогона: {размер библиотеки: {операция: статистика}}"""
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = {}
+        self.size = None
+
+    def measure(self, name, func, repeat=None, setup=None):
+        """Замеряет func() repeat раз; пиковая память — отдельным прогоном под tracemalloc.
+
+        setup() вызывается перед каждым замером вне таймера, его результат
+        передается в func.
+        """
+        repeat = repeat or self.repeat
+        samples = []
+        gc.collect()
+        for _ in range(repeat):
+            arg = setup() if setup is not None else None
+            start = time.perf_counter()
+            func(arg) if setup is not None else func()
+            samples.append(time.perf_counter() - start)
+
+        arg = setup() if setup is not None else None
+        tracemalloc.start()
+        func(arg) if setup is not None else func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stats = summarize(samples)
+        stats['peak_kb'] = peak / 1024
+        self.results.setdefault(str(self.size), {})[name] = stats
+        print(f"  {name:<28} p50 {stats['p50_ms']:9.3f} мс  p95 {stats['p95_ms']:9.3f} мс  "
+              f"p99 {stats['p99_ms']:9.3f} мс  пик {stats['peak_kb']:10.1f} КБ")
+        return stats
+
+
+def generate_audio(directory, count=AUDIO_FILES):
+    """Короткие WAV-файлы с синусом разной частоты (без numpy)"""
+    paths = []
+    frames = int(AUDIO_SECONDS * AUDIO_RATE)
+    for i in range(count):
+        path = os.path.join(directory, f"tone_{i:03d}.wav")
+        freq = 220 * 2 ** (i / 12)
+        samples = b''.join(struct.pack('<h', int(8000 * math.sin(2 * math.pi * freq * n / AUDIO_RATE)))
+                           for n in range(frames))
+        with wave.open(path, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(AUDIO_RATE)
+            f.writeframes(samples)
+        paths.append(path)
+    return paths
+
+
+def synthetic_entry(path, rng, number):
+    """Запись кэша метаданных для несуществующего трека"""
+    return {
+        'path': path,
+        'mtime': 0,
+        'size': 0,
+        'duration': rng.uniform(120, 360),
+        'bitrate': 320000,
+        'title': os.path.splitext(os.path.basename(path))[0],
+        'artist': f"Artist {number % 500}",
+        'album': f"Album {number % 2000}",
+        'ok': 1,
+    }
+
+
+def generate_library(data_dir, size, audio_paths, seed=1):
+    """Библиотека на size треков: main со всеми треками и плейлисты по ~10%"""
+    rng = random.Random(seed)
+    paths = []
+    for number in range(size):
+        title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+        paths.append(f"/bench/Artist {number % 500}/Album {number % 2000}/"
+                     f"{number:06d} - {title}.mp3")
+    # Часть треков — настоящие файлы, чтобы можно было запускать воспроизведение
+    paths[:len(audio_paths)] = audio_paths
+
+    library = LibraryStore(data_dir)
+    library.load()
+    # Анализ громкости при генерации не нужен и мешал бы замерам
+    if library.feature_analyzer is not None:
+        library.feature_analyzer.stop()
+    library.metadata_cache.put_many(
+        [synthetic_entry(path, rng, number) for number, path in enumerate(paths[len(audio_paths):])])
+    for path in audio_paths:
+        library.metadata_cache.put(probe_file(path))
+
+    library.create_playlist("main", paths)
+    for i in range(max(5, size // 2000)):
+        library.create_playlist(f"playlist {i}", rng.sample(paths, max(1, size // 10)))
+    library.close()
+    return paths
+
+
+def bench_library(run, data_dir, paths):
+    """Загрузка, сохранение, журнал, поиск и перемешивание"""
+    def open_library():
+        library = LibraryStore(data_dir)
+        library.load()
+        return library
+
+    # Загрузка: снимок плейлистов, журнал и кэш метаданных
+    opened = []
+    run.measure("load_playlists", lambda: opened.append(open_library()), repeat=min(run.repeat, 5))
+    for library in opened:
+        library.close()
+    library = open_library()
+
+    run.measure("save_playlists", library.compact, repeat=min(run.repeat, 5))
+    run.measure("journal_add_track",
+                lambda: library.add_tracks("избранное", [f"/bench/new/{time.perf_counter_ns()}.mp3"]))
+
+    # Поиск: построение индекса и запросы
+    def build_index():
+        library.start_indexing()
+        while library.index_step():
+            pass
+    run.measure("search_build_index", build_index, repeat=min(run.repeat, 3))
+    queries = iter(SEARCH_QUERIES * run.repeat * 2)
+    run.measure("search_query", lambda: library.search(next(queries)), repeat=len(SEARCH_QUERIES) * run.repeat)
+
+    # Перемешивание: выбор микса (как create_mix)
+    main = library.tracks("main")
+    run.measure("create_mix_sample", lambda: random.sample(main, min(20, len(main))))
+    return library
+
+
+def bench_startup(run, data_dir):
+    """Холодный запуск без окна: импорт модулей в новом процессе, библиотека и движок"""
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, '-c', 'import MusicApp']
+    run.measure("startup_import",
+                lambda: subprocess.run(command, cwd=app_dir, check=True, stdout=subprocess.DEVNULL),
+                repeat=min(run.repeat, 3))
+
+    opened = []
+
+    def open_app():
+        library = LibraryStore(data_dir)
+        library.load()
+        opened.append(library)
+        PlayerEngine(library)
+    run.measure("startup_library_engine", open_app, repeat=min(run.repeat, 5))
+    for library in opened:
+        library.close()
+
+
+def bench_smart_mix(run, paths, seed=1):
+    """Микс из 50 треков по синтетической матрице признаков размера библиотеки"""
+    from audio_features import MixBuilder
+    from audio_decode import np
+
+    if np is None:
+        print("  smart_mix пропущен: нет numpy")
+        return
+    rng = np.random.default_rng(seed)
+    size = len(paths)
+    matrix = np.column_stack([
+        rng.uniform(70, 180, size),             # темп
+        rng.integers(-1, 24, size),             # тональность
+        rng.normal(-12, 3, size),               # громкость
+        rng.gamma(2.0, 1.0, size),              # энергия
+        rng.uniform(120, 360, size),            # длительность
+    ])
+    builder = MixBuilder(list(paths), matrix)
+    seeds = iter(rng.integers(size, size=run.repeat * 2))
+    run.measure("smart_mix_50", lambda: builder.build(50, seed=paths[next(seeds)]))
+
+
+def bench_engine(run, library, audio_paths):
+    """Переключение плейлистов, выбор следующего трека и запуск трека"""
+    engine = PlayerEngine(library)
+    names = list(library.playlists)
+    cycle = iter(names * run.repeat * 2)
+    run.measure("switch_playlist", lambda: engine.select_playlist(next(cycle)))
+
+    engine.select_playlist("main")
+    engine.set_shuffle(True)
+    run.measure("shuffle_next_index", engine.choose_next_index, repeat=run.repeat * 10)
+    engine.set_shuffle(False)
+
+    tracks = iter(list(range(len(audio_paths))) * run.repeat * 2)
+    run.measure("play_song", lambda: engine.play_index(next(tracks)))
+    run.measure("next_song", engine.next_song)
+    engine.close()
+
+
+def bench_render(run, library):
+    """Отрисовка плейлиста (нужен дисплей, например Xvfb)"""
+    try:
+        import tkinter as tk
+        from tkinter import ttk
+        root = tk.Tk()
+    except Exception as e:
+        print(f"  render пропущен: {e}")
+        return
+
+    from playlist_view import VirtualPlaylistView
+
+    root.geometry("1000x700")
+    canvas = tk.Canvas(root, bg='#181818', highlightthickness=0)
+    scrollbar = ttk.Scrollbar(root, orient="vertical")
+    canvas.pack(side="left", fill="both", expand=True)
+    scrollbar.pack(side="right", fill="y")
+    view = VirtualPlaylistView(canvas, scrollbar, ('Segoe UI', 12), ('Segoe UI', 10),
+                               on_play=lambda index: None, on_remove=lambda path: None,
+                               get_info=library.metadata_cache.get)
+    root.update()
+
+    names = iter(list(library.playlists) * run.repeat * 2)
+
+    def render():
+        view.set_items(library.tracks(next(names)))
+        root.update_idletasks()
+    run.measure("refresh_playlist_display", render)
+
+    view.set_items(library.tracks("main"))
+    positions = iter([random.random() for _ in range(run.repeat * 2)])
+
+    def scroll():
+        canvas.yview_moveto(next(positions))
+        root.update_idletasks()
+    run.measure("scroll_playlist", scroll)
+    root.destroy()
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Печатает изменения p50 относительно baseline. Возвращает число регрессий"""
+    regressions = 0
+    for size, operations in results.items():
+        for name, stats in operations.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None or base['p50_ms'] < COMPARE_FLOOR_MS:
+                continue
+            change = stats['p50_ms'] / base['p50_ms'] - 1
+            marker = ""
+            if change > threshold:
+                marker = "  РЕГРЕССИЯ"
+                regressions += 1
+            print(f"  {size:>7} {name:<28} {base['p50_ms']:9.3f} -> {stats['p50_ms']:9.3f} мс "
+                  f"({change:+.0%}){marker}")
+    return regressions
+
+
+def main():
+    """Бенчмарки библиотеки и движка на синтетических данных.
+
+    Генерирует библиотеки на 1k/10k/100k треков с несколькими плейлистами и
+    набор коротких WAV-файлов, затем замеряет загрузку и сохранение
+    плейлистов, поиск, перемешивание, переключение плейлистов, запуск трека,
+    холодный запуск без окна и (если есть дисплей, например Xvfb) отрисовку
+    списка. Для каждой операции выводятся перцентили задержки и пиковая
+    память.
+
+        python benchmark.py --sizes 1000 10000 --save-baseline benchmark_baseline.json
+        python benchmark.py --compare benchmark_baseline.json
+
+    Работает без окна: звук и события pygame идут через драйверы dummy.
+    """
+    parser = argparse.ArgumentParser(description="Бенчмарки музыкального плеера")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--no-render', action='store_true', help="не замерять отрисовку Tk")
+    parser.add_argument('--json', help="сохранить результаты в файл")
+    parser.add_argument('--save-baseline', help="сохранить результаты как baseline")
+    parser.add_argument('--compare', help="сравнить с сохраненным baseline")
+    parser.add_argument('--keep', action='store_true', help="не удалять сгенерированные данные")
+    options = parser.parse_args()
+
+    run = BenchmarkRun(options.repeat)
+    work_dir = tempfile.mkdtemp(prefix="music-bench-")
+    try:
+        audio_dir = os.path.join(work_dir, "audio")
+        os.makedirs(audio_dir)
+        audio_paths = generate_audio(audio_dir)
+
+        for size in options.sizes:
+            print(f"Библиотека на {size} треков")
+            run.size = size
+            data_dir = os.path.join(work_dir, f"library_{size}")
+            start = time.perf_counter()
+            paths = generate_library(data_dir, size, audio_paths)
+            print(f"  сгенерирована за {time.perf_counter() - start:.1f} с")
+
+            bench_startup(run, data_dir)
+            library = bench_library(run, data_dir, paths)
+            bench_engine(run, library, audio_paths)
+            bench_smart_mix(run, paths)
+            if not options.no_render:
+                bench_render(run, library)
+            library.close()
+    finally:
+        if options.keep:
+            print(f"Данные: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    # ru_maxrss в КБ на Linux
+    report = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': sys.version.split()[0],
+        'repeat': options.repeat,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'results': run.results,
+    }
+    print(f"Пиковый RSS процесса: {report['max_rss_kb'] / 1024:.1f} МБ")
+
+    for path in (options.json, options.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if options.compare:
+        with open(options.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print("Сравнение с baseline")
+        if compare(run.results, baseline['results']):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,698 @@
+import asyncio
+import base64
+import concurrent.futures
+import hashlib
+import json
+import os
+import queue
+import re
+import secrets
+import struct
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs, unquote
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Ограничения на запрос
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+# Сколько событий может ждать отправки одному клиенту; медленный клиент отключается
+CLIENT_QUEUE_SIZE = 256
+
+# Как часто клиентам отправляется позиция во время воспроизведения, в секундах
+POSITION_INTERVAL = 0.5
+
+# Сколько ждать выполнения команды в потоке владельца
+COMMAND_TIMEOUT = 5.0
+
+# Файл с токеном доступа в папке данных (создается при первом запуске)
+TOKEN_FILE = "control_token"
+
+# Адреса, под которыми браузер видит сервер на этой машине
+LOOPBACK_HOSTS = ('127.0.0.1', 'localhost', '[::1]')
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+HTTP_REASONS = {
+    200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden', 404: 'Not Found',
+    405: 'Method Not Allowed', 413: 'Payload Too Large', 415: 'Unsupported Media Type',
+    500: 'Internal Server Error', 504: 'Gateway Timeout',
+}
+
+# Маршруты HTTP: (метод, шаблон пути, команда). Группы шаблона — аргументы команды
+ROUTES = [
+    ('GET', r'/state', 'state'),
+    ('POST', r'/play_pause', 'play_pause'),
+    ('POST', r'/next', 'next_song'),
+    ('POST', r'/prev', 'prev_song'),
+    ('POST', r'/seek', 'seek'),
+    ('POST', r'/volume', 'volume'),
+    ('GET', r'/search', 'search'),
+    ('GET', r'/history', 'history_stats'),
+    ('GET', r'/playlists', 'list_playlists'),
+    ('POST', r'/playlists', 'create_playlist'),
+    ('GET', r'/playlists/(?P<name>[^/]+)', 'get_playlist'),
+    ('DELETE', r'/playlists/(?P<name>[^/]+)', 'delete_playlist'),
+    ('POST', r'/playlists/(?P<name>[^/]+)/play', 'play_playlist'),
+    ('POST', r'/playlists/(?P<name>[^/]+)/tracks', 'add_tracks'),
+    ('DELETE', r'/playlists/(?P<name>[^/]+)/tracks', 'remove_track'),
+]
+ROUTES = [(method, re.compile(pattern + '$'), command) for method, pattern, command in ROUTES]
+
+
+def load_token(data_dir):
+    """Токен доступа из папки данных; при первом запуске создается случайный"""
+    path = os.path.join(data_dir, TOKEN_FILE)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            token = f.read().strip()
+        if token:
+            return token
+    except FileNotFoundError:
+        pass
+    token = secrets.token_urlsafe(24)
+    # Файл читает только владелец
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(token + "\n")
+    return token
+
+
+class CommandError(Exception):
+    """Ошибка в аргументах команды — клиент получает 400"""
+
+
+class BadRequest(Exception):
+    """Некорректный HTTP-запрос — клиент получает 400 и соединение закрывается"""
+
+
+def _require(args, key):
+    if key not in args:
+        raise CommandError(f"Не указан параметр '{key}'")
+    return args[key]
+
+
+def _number(args, key):
+    try:
+        return float(_require(args, key))
+    except (TypeError, ValueError):
+        raise CommandError(f"Параметр '{key}' должен быть числом")
+
+
+def engine_handlers(engine, library):
+    """Команды сервера для PlayerEngine и LibraryStore: имя -> callable(args).
+
+    Вызываются только в потоке владельца движка (см. ControlServer.process_pending).
+    """
+    def state(args):
+        return {
+            'playing': engine.playing,
+            'paused': engine.paused,
+            'track': engine.current_path,
+            'index': engine.current_song_index,
+            'playlist': engine.current_playlist,
+            'position': engine.position(),
+            'length': engine.song_length,
+            'volume': engine.volume,
+            'shuffle': engine.shuffle_mode,
+            'shuffle_weighting': engine.shuffle_weighting,
+            'repeat': engine.repeat_mode,
+            'mix': engine.mix_mode,
+        }
+
+    def seek(args):
+        if not engine.seek(_number(args, 'position')):
+            raise CommandError("Перемотка недоступна")
+        return state(args)
+
+    def volume(args):
+        engine.set_volume(_number(args, 'volume'))
+        return state(args)
+
+    def shuffle(args):
+        """enabled — вкл/выкл, weighting — null, plays или recent"""
+        if 'weighting' in args:
+            try:
+                engine.set_shuffle_weighting(args['weighting'])
+            except ValueError as e:
+                raise CommandError(str(e))
+        if 'enabled' in args:
+            engine.set_shuffle(bool(args['enabled']))
+        return state(args)
+
+    def repeat(args):
+        engine.set_repeat(bool(_require(args, 'enabled')))
+        return state(args)
+
+    def search(args):
+        query = str(args.get('q', '')).strip()
+        limit = int(_number(args, 'limit')) if 'limit' in args else 50
+        return {'query': query, 'results': library.search(query, limit=limit) if query else []}
+
+    def playlist_name(args):
+        name = _require(args, 'name')
+        if name not in library.playlists:
+            raise CommandError(f"Плейлист '{name}' не найден")
+        return name
+
+    def create_playlist(args):
+        name = str(_require(args, 'name')).strip()
+        if not name:
+            raise CommandError("Введите название плейлиста")
+        if name in library.playlists:
+            raise CommandError("Плейлист с таким названием уже существует")
+        library.create_playlist(name, [str(path) for path in args.get('tracks', [])])
+        return {'name': name, 'tracks': library.playlists[name].to_list()}
+
+    def delete_playlist(args):
+        name = playlist_name(args)
+        if name in ("main", "избранное"):
+            raise CommandError("Этот плейлист нельзя удалить")
+        library.delete_playlist(name)
+        return {'deleted': name}
+
+    def add_tracks(args):
+        name = playlist_name(args)
+        added = library.add_tracks(name, [str(path) for path in _require(args, 'tracks')])
+        return {'name': name, 'added': added}
+
+    def remove_track(args):
+        name = playlist_name(args)
+        track = _require(args, 'track')
+        if name == engine.current_playlist:
+            engine.remove_track(track)
+        else:
+            library.remove_track(name, track)
+        return {'name': name, 'removed': track}
+
+    def play_playlist(args):
+        if not engine.play_playlist(playlist_name(args)):
+            raise CommandError("Плейлист пуст")
+        return state(args)
+
+    def history_stats(args):
+        days = int(_number(args, 'days')) if 'days' in args else 30
+        limit = int(_number(args, 'limit')) if 'limit' in args else 10
+        history = library.history
+        return {
+            'total_plays': history.total_plays,
+            'skip_rate': history.skip_rate(),
+            'top_tracks': [{'track': path, 'plays': plays, 'skips': skips, 'listened': listened}
+                           for path, plays, skips, listened in history.top_tracks(limit, days=days)],
+            'plays_per_day': [{'day': day.isoformat(), 'plays': plays, 'skips': skips,
+                               'listened': listened}
+                              for day, plays, skips, listened in history.plays_per_day(days)],
+            'recent': [{'track': path, 'started': started, 'listened': listened, 'skipped': skipped}
+                       for path, started, listened, skipped in history.recent(limit)],
+        }
+
+    def control(method):
+        def handler(args):
+            method()
+            return state(args)
+        return handler
+
+    return {
+        'state': state,
+        'play_pause': control(engine.play_pause),
+        'next_song': control(engine.next_song),
+        'prev_song': control(engine.prev_song),
+        'seek': seek,
+        'volume': volume,
+        'shuffle': shuffle,
+        'repeat': repeat,
+        'search': search,
+        'list_playlists': lambda args: {
+            'current': engine.current_playlist,
+            'playlists': [{'name': name, 'count': len(tracks)}
+                          for name, tracks in library.playlists.items()],
+        },
+        'get_playlist': lambda args: {
+            'name': playlist_name(args), 'tracks': library.playlists[args['name']].to_list(),
+        },
+        'create_playlist': create_playlist,
+        'delete_playlist': delete_playlist,
+        'add_tracks': add_tracks,
+        'remove_track': remove_track,
+        'play_playlist': play_playlist,
+        'history_stats': history_stats,
+    }
+
+
+class ControlServer:
+    """Локальный сервер управления: HTTP API и события через WebSocket.
+
+    Сеть обслуживает цикл asyncio в отдельном потоке. Команды не трогают
+    движок напрямую: они ставятся в очередь, которую поток владельца (Tk)
+    разбирает через process_pending(), а сетевой поток ждет результат.
+    Поэтому сервер не блокирует главный цикл Tk, а движок, как и раньше,
+    меняется только из одного потока. События движка рассылаются всем
+    подключенным клиентам через publish().
+
+    Любая страница в браузере может слать запросы на localhost, поэтому
+    нужен токен (заголовок Authorization: Bearer или параметр token).
+    Работа без токена включается только явно (allow_anonymous). Кроме
+    того, отклоняются запросы с чужим Origin, а изменяющие запросы
+    принимаются только с Content-Type: application/json — такой запрос
+    браузер не отправит с чужой страницы без разрешения сервера.
+    """
+
+    def __init__(self, handlers, host=DEFAULT_HOST, port=DEFAULT_PORT, token=None,
+                 allow_anonymous=False):
+        if token is None and not allow_anonymous:
+            raise ValueError("Нужен токен доступа (или allow_anonymous=True)")
+        self.handlers = handlers
+        self.host = host
+        self.port = port
+        self.token = token
+        self.commands = queue.Queue()
+
+        self._clients = set()
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._started = threading.Event()
+        self._error = None
+        self._last_position = 0.0
+
+    @property
+    def client_count(self):
+        return len(self._clients)
+
+    def start(self):
+        """Запускает сервер. OSError — если порт занят"""
+        self._thread = threading.Thread(target=self._run, name="control-server", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        if self._error is not None:
+            raise self._error
+        # Порт мог быть выбран системой (port=0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def stop(self):
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle_connection, self.host, self.port))
+        except OSError as e:
+            self._error = e
+            self._started.set()
+            return
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            for client in list(self._clients):
+                client.close()
+            self._loop.close()
+
+    # Поток владельца
+
+    def process_pending(self, limit=50):
+        """Выполняет команды из сети. Вызывается в потоке владельца движка"""
+        for _ in range(limit):
+            try:
+                name, args, future = self.commands.get_nowait()
+            except queue.Empty:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.handlers[name](args))
+            except CommandError as e:
+                future.set_exception(e)
+            except Exception as e:
+                print(f"Ошибка команды {name}: {e}")
+                future.set_exception(e)
+
+    def publish(self, event, data):
+        """Рассылает событие клиентам (можно вызывать из любого потока)"""
+        if not self._clients or self._loop is None:
+            return
+        message = json.dumps({'event': event, 'data': data, 'time': time.time()},
+                             ensure_ascii=False)
+        self._loop.call_soon_threadsafe(self._broadcast, message)
+
+    def publish_playlists(self, kind, name, added, removed):
+        """Подписчик LibraryStore: изменения плейлистов для клиентов"""
+        self.publish('playlists', {'kind': kind, 'name': name,
+                                   'added': len(added), 'removed': len(removed)})
+
+    def publish_position(self, engine):
+        """Позиция воспроизведения не чаще POSITION_INTERVAL (вызывается из тикера)"""
+        now = time.monotonic()
+        if self._clients and engine.playing and now - self._last_position >= POSITION_INTERVAL:
+            self._last_position = now
+            self.publish('position', {'position': engine.position(), 'length': engine.song_length})
+
+    # Сетевой поток
+
+    def _broadcast(self, message):
+        for client in list(self._clients):
+            client.send(message)
+
+    async def _call(self, name, args):
+        future = concurrent.futures.Future()
+        self.commands.put((name, args, future))
+        return await asyncio.wait_for(asyncio.wrap_future(future), COMMAND_TIMEOUT)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            try:
+                request = await _read_request(reader)
+            except BadRequest as e:
+                await _send_json(writer, 400, {'error': str(e)})
+                return
+            if request is None:
+                return
+            method, target, headers, body = request
+            url = urlsplit(target)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+            if not self._same_origin(headers):
+                await _send_json(writer, 403, {'error': "Запрос с чужой страницы"})
+                return
+
+            if self.token is not None and not self._authorized(headers, query):
+                await _send_json(writer, 401, {'error': "Нужен токен доступа"})
+                return
+
+            if url.path == '/events':
+                if headers.get('upgrade', '').lower() != 'websocket':
+                    await _send_json(writer, 400, {'error': "Ожидается WebSocket"})
+                    return
+                await self._serve_websocket(reader, writer, headers)
+                return
+
+            await self._serve_http(writer, method, url.path, headers, query, body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _authorized(self, headers, query):
+        token = self.token.encode()
+        return (secrets.compare_digest(headers.get('authorization', '').encode(), b"Bearer " + token)
+                or secrets.compare_digest(query.get('token', '').encode(), token))
+
+    def _same_origin(self, headers):
+        """Запросы без Origin (не из браузера) допускаются, из браузера — только с этого сервера"""
+        origin = headers.get('origin')
+        if origin is None:
+            return True
+        parts = urlsplit(origin)
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            return False
+        hosts = {self.host}
+        if self.host in LOOPBACK_HOSTS or self.host in ('0.0.0.0', '::'):
+            hosts.update(LOOPBACK_HOSTS)
+        return parts.netloc.lower() in {f"{host}:{self.port}" for host in hosts}
+
+    async def _serve_http(self, writer, method, path, headers, query, body):
+        command, path_args, allowed = None, {}, False
+        for route_method, pattern, route_command in ROUTES:
+            match = pattern.match(path)
+            if match:
+                allowed = True
+                if route_method == method:
+                    command = route_command
+                    path_args = {key: unquote(value) for key, value in match.groupdict().items()}
+                    break
+        if command is None:
+            await _send_json(writer, 405 if allowed else 404, {'error': "Неизвестный запрос"})
+            return
+
+        if method != 'GET':
+            content_type = headers.get('content-type', '').split(';')[0].strip().lower()
+            if content_type != 'application/json':
+                await _send_json(writer, 415, {'error': "Ожидается Content-Type: application/json"})
+                return
+
+        args = dict(query)
+        if body:
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                await _send_json(writer, 400, {'error': "Тело запроса — не JSON"})
+                return
+            if isinstance(payload, dict):
+                args.update(payload)
+        args.update(path_args)
+
+        status, result = await self._execute(command, args)
+        await _send_json(writer, status, result)
+
+    async def _execute(self, command, args):
+        try:
+            return 200, await self._call(command, args)
+        except CommandError as e:
+            return 400, {'error': str(e)}
+        except asyncio.TimeoutError:
+            return 504, {'error': "Плеер не ответил"}
+        except Exception as e:
+            return 500, {'error': str(e)}
+
+    async def _serve_websocket(self, reader, writer, headers):
+        key = headers.get('sec-websocket-key')
+        if not key:
+            await _send_json(writer, 400, {'error': "Нет Sec-WebSocket-Key"})
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        await writer.drain()
+
+        client = _WebSocketClient(writer)
+        self._clients.add(client)
+        sender = asyncio.ensure_future(client.run_sender())
+        try:
+            # Новый клиент сразу получает текущее состояние
+            status, result = await self._execute('state', {})
+            if status == 200:
+                client.send(json.dumps({'event': 'state', 'data': result, 'time': time.time()},
+                                       ensure_ascii=False))
+
+            while not client.closed:
+                opcode, payload = await _read_frame(reader)
+                if opcode == 0x8:
+                    break
+                if opcode == 0x9:
+                    client.send_frame(0xA, payload)
+                elif opcode == 0x1:
+                    await self._handle_ws_message(client, payload)
+        finally:
+            self._clients.discard(client)
+            client.close()
+            await sender
+
+    async def _handle_ws_message(self, client, payload):
+        """Команда через WebSocket: {"id": ..., "cmd": "next_song", "args": {...}}"""
+        try:
+            message = json.loads(payload.decode('utf-8'))
+            command = message['cmd']
+            args = message.get('args') or {}
+        except (ValueError, KeyError, TypeError, AttributeError):
+            client.send(json.dumps({'error': "Ожидается {\"cmd\": ..., \"args\": {...}}"}))
+            return
+
+        if command not in self.handlers:
+            status, result = 404, {'error': f"Неизвестная команда '{command}'"}
+        else:
+            status, result = await self._execute(command, args)
+        client.send(json.dumps({'id': message.get('id'), 'status': status, 'result': result},
+                               ensure_ascii=False))
+
+
+class _WebSocketClient:
+    """Исходящая очередь клиента: рассылка не ждет медленных клиентов"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.closed = False
+        self._queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+
+    def send(self, text):
+        self.send_frame(0x1, text.encode('utf-8'))
+
+    def send_frame(self, opcode, payload):
+        if self.closed:
+            return
+        try:
+            self._queue.put_nowait(_encode_frame(opcode, payload))
+        except asyncio.QueueFull:
+            # Клиент не успевает читать — отключаем, чтобы не копить события
+            self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            # Будим отправителя; при полной очереди он и так проснется
+            if not self._queue.full():
+                self._queue.put_nowait(None)
+            self.writer.close()
+
+    async def run_sender(self):
+        try:
+            while not self.closed:
+                frame = await self._queue.get()
+                if frame is None:
+                    break
+                self.writer.write(frame)
+                await self.writer.drain()
+        except ConnectionError:
+            self.close()
+
+
+async def _read_request(reader):
+    """Строка запроса, заголовки и тело. None — если клиент закрыл соединение"""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        return None
+    if len(head) > MAX_HEADER_BYTES:
+        return None
+
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, _ = lines[0].split(' ', 2)
+    except ValueError:
+        return None
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length', 0) or 0)
+    except ValueError:
+        raise BadRequest("Некорректный Content-Length")
+    if length < 0 or length > MAX_BODY_BYTES:
+        raise BadRequest("Некорректный Content-Length")
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), target, headers, body
+
+
+async def _send_json(writer, status, data):
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    writer.write((
+        f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n\r\n").encode('latin-1') + body)
+    await writer.drain()
+
+
+def _encode_frame(opcode, payload):
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 1 << 16:
+        header += bytes([126]) + struct.pack('!H', length)
+    else:
+        header += bytes([127]) + struct.pack('!Q', length)
+    return header + payload
+
+
+async def _read_frame(reader):
+    """Читает сообщение клиента (с учетом фрагментации). Возвращает (opcode, payload)"""
+    message_opcode, chunks = None, []
+    while True:
+        first, second = await reader.readexactly(2)
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack('!H', await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', await reader.readexactly(8))[0]
+        if length > MAX_BODY_BYTES:
+            raise ConnectionError("Слишком большой кадр WebSocket")
+        mask = await reader.readexactly(4) if second & 0x80 else None
+        payload = await reader.readexactly(length)
+        if mask is not None:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+        # Управляющие кадры могут приходить между фрагментами
+        if opcode >= 0x8:
+            return opcode, payload
+        if opcode != 0x0:
+            message_opcode = opcode
+        chunks.append(payload)
+        if first & 0x80:
+            return message_opcode, b''.join(chunks)
+
+
+def main():
+    """Плеер без окна, управляемый только через сервер"""
+    import argparse
+
+    from library_store import LibraryStore
+    from player_engine import PlayerEngine
+
+    parser = argparse.ArgumentParser(description="Музыкальный плеер без интерфейса")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--token', default=None,
+                        help="токен доступа (по умолчанию — из папки данных)")
+    parser.add_argument('--no-token', action='store_true',
+                        help="работать без токена: управлять сможет любая программа и страница")
+    parser.add_argument('--data-dir', default="music_player_data")
+    options = parser.parse_args()
+
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    library = LibraryStore(options.data_dir)
+    library.load()
+    engine = PlayerEngine(library)
+    library.start_indexing()
+    while library.index_step():
+        pass
+    library.start_analysis()
+
+    if options.no_token:
+        token = None
+    else:
+        token = options.token or load_token(options.data_dir)
+    server = ControlServer(engine_handlers(engine, library),
+                           options.host, options.port, token,
+                           allow_anonymous=options.no_token)
+    engine.listeners.append(server.publish)
+    library.listeners.append(server.publish_playlists)
+    server.start()
+    print(f"Сервер управления: http://{options.host}:{server.port}")
+    if token is not None:
+        print(f"Токен доступа: {os.path.join(options.data_dir, TOKEN_FILE)}")
+
+    try:
+        while True:
+            engine.poll()
+            server.process_pending()
+            server.publish_position(engine)
+            time.sleep(0.02)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        engine.close()
+        library.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Насколько могут отличаться признаки звука у одной песни в разных файлах
+SIMILAR_DURATION = 1.0
+SIMILAR_TEMPO = 1.0
+SIMILAR_LOUDNESS = 1.5
+
+# Сколько файлов отдаем пулу за раз (не держим 100k future)
+CHUNK = 1024
+
+
+def _group(items, key):
+    """Группы из двух и больше элементов с одинаковым ключом (None пропускается)"""
+    groups = {}
+    for item in items:
+        value = key(item)
+        if value is not None:
+            groups.setdefault(value, []).append(item)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def _normalize(text):
+    return ' '.join(re.findall(r'\w+', text.lower()))
+
+
+def song_name(path, info):
+    """Название песни для сравнения: теги «исполнитель — название» или имя файла"""
+    if info is not None and info.get('title'):
+        return _normalize(f"{info.get('artist', '')} {info['title']}")
+    stem = os.path.splitext(os.path.basename(path))[0]
+    # Номер трека в начале имени файла не считаем
+    return _normalize(re.sub(r'^\s*\d+[\s.\-_]*', '', stem))
+
+
+class DuplicateFinder:
+    """Фоновый поиск одинаковых файлов в библиотеке.
+
+    Файлы сравниваются по шагам, каждый следующий дороже и касается
+    меньшего числа файлов: размер (stat), частичный хэш (начало и конец
+    файла) только у файлов одного размера, полный хэш только при
+    совпадении частичных. Хэши берутся из FileHashStore и кэшируются по
+    mtime, поэтому повторный поиск читает лишь изменившиеся файлы. stat и
+    хэши считаются пулом потоков.
+
+    Если переданы features (FeatureStore) и info (запись метаданных по
+    пути), дополнительно ищутся похожие по звучанию треки в разных файлах
+    (другой битрейт или формат): совпадают тональность, длительность,
+    темп и громкость в пределах допусков и название песни. Такие группы
+    только сообщаются в similar — одинаковые по содержимому файлы в groups.
+
+    UI следит за done и забирает groups/similar после завершения — как у
+    LibraryScanner, сам поиск библиотеку не меняет.
+    """
+
+    def __init__(self, paths, hashes, workers=None, features=None, info=None):
+        self.paths = list(dict.fromkeys(paths))
+        self.hashes = hashes
+        self.workers = workers or min(16, (os.cpu_count() or 2) * 2)
+        self.features = features
+        self.info = info
+
+        # Текущий шаг и прогресс в нем
+        self.stage = None
+        self.checked = 0
+        self.stage_total = 0
+        self.groups = []
+        self.similar = []
+        self.done = False
+
+        self._cancelled = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="duplicate-finder", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def total(self):
+        return len(self.paths)
+
+    def _run(self):
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers,
+                                    thread_name_prefix="duplicate-hash") as executor:
+                self.groups = self._find_identical(executor)
+            if self.features is not None and self.info is not None and not self._cancelled.is_set():
+                self.stage = 'similar'
+                self.similar = self._find_similar()
+        finally:
+            self.done = True
+
+    def _map(self, executor, function, items):
+        """function по элементам в пуле порциями; при отмене возвращает то, что успели"""
+        self.checked = 0
+        self.stage_total = len(items)
+        results = []
+        for start in range(0, len(items), CHUNK):
+            if self._cancelled.is_set():
+                break
+            results.extend(executor.map(function, items[start:start + CHUNK]))
+            self.checked = len(results)
+        return results
+
+    def _find_identical(self, executor):
+        self.stage = 'size'
+        stats = dict(zip(self.paths, self._map(executor, self._stat, self.paths)))
+        # Пустые и пропавшие файлы не сравниваем
+        candidates = [path for group in _group(
+            stats, lambda p: stats[p].st_size or None if stats[p] is not None else None)
+            for path in group]
+
+        if self._cancelled.is_set():
+            return []
+
+        self.stage = 'partial'
+        partial = dict(zip(candidates, self._map(
+            executor, lambda p: self.hashes.partial(p, stats[p]), candidates)))
+        candidates = [path for group in _group(
+            candidates, lambda p: partial.get(p) and (stats[p].st_size, partial[p]))
+            for path in group]
+
+        if self._cancelled.is_set():
+            return []
+
+        self.stage = 'full'
+        full = dict(zip(candidates, self._map(
+            executor, lambda p: self.hashes.full(p, stats[p]), candidates)))
+        self.hashes.flush()
+        if self._cancelled.is_set():
+            return []
+        groups = _group(candidates, full.get)
+        return sorted(sorted(group) for group in groups)
+
+    @staticmethod
+    def _stat(path):
+        try:
+            return os.stat(path)
+        except OSError:
+            return None
+
+    def _find_similar(self):
+        """Группы похожих по звучанию треков, которые не совпали по содержимому"""
+        identical = {path for group in self.groups for path in group[1:]}
+        tracks = []
+        for path in self.paths:
+            if path in identical:
+                continue
+            entry = self.features.get(path)
+            if entry is not None and entry['duration']:
+                tracks.append((entry['duration'], path, entry))
+        tracks.sort(key=lambda track: track[0])
+        self.checked = 0
+        self.stage_total = len(tracks)
+
+        # Кандидаты — соседи по длительности в окне SIMILAR_DURATION
+        parent = {}
+
+        def find(path):
+            while parent.get(path, path) != path:
+                path = parent[path]
+            return path
+
+        names = {}
+        linked = []
+        for i, (duration, path, entry) in enumerate(tracks):
+            if self._cancelled.is_set():
+                return []
+            self.checked = i
+            for j in range(i + 1, len(tracks)):
+                other_duration, other, other_entry = tracks[j]
+                if other_duration - duration > SIMILAR_DURATION:
+                    break
+                if not self._sounds_alike(entry, other_entry):
+                    continue
+                for p in (path, other):
+                    if p not in names:
+                        names[p] = song_name(p, self.info(p))
+                if names[path] and names[path] == names[other]:
+                    parent[find(other)] = find(path)
+                    linked += (path, other)
+
+        groups = _group(dict.fromkeys(linked), find)
+        return sorted(sorted(group) for group in groups)
+
+    @staticmethod
+    def _sounds_alike(a, b):
+        if a['key'] != b['key'] or abs(a['tempo'] - b['tempo']) > SIMILAR_TEMPO:
+            return False
+        if a['loudness'] is None or b['loudness'] is None:
+            return a['loudness'] is b['loudness']
+        return abs(a['loudness'] - b['loudness']) <= SIMILAR_LOUDNESS
@@ -0,0 +1,170 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+
+# Частичный хэш: размер файла, начало и конец
+HASH_BLOCK = 64 * 1024
+# Полный хэш читается такими кусками
+READ_CHUNK = 1024 * 1024
+
+# Сколько записей копим в транзакции перед автоматическим commit
+AUTOCOMMIT_PENDING = 200
+
+
+def partial_hash(path, size=None):
+    """Быстрый хэш файла по размеру и первым/последним HASH_BLOCK байтам.
+
+    Совпадение не доказывает, что файлы одинаковые, но разные хэши —
+    точно разные файлы. OSError пробрасывается.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        if size is None:
+            size = os.fstat(f.fileno()).st_size
+        digest.update(size.to_bytes(8, 'little'))
+        digest.update(f.read(HASH_BLOCK))
+        if size > 2 * HASH_BLOCK:
+            f.seek(-HASH_BLOCK, os.SEEK_END)
+            digest.update(f.read(HASH_BLOCK))
+        elif size > HASH_BLOCK:
+            digest.update(f.read())
+    return digest.digest()
+
+
+def full_hash(path):
+    """Хэш всего содержимого файла. OSError пробрасывается"""
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.digest()
+
+
+class FileHashStore:
+    """Кэш хэшей содержимого файлов в SQLite (music_player_data/hashes.db).
+
+    Хэш считается актуальным, пока у файла совпадают mtime и размер.
+    Частичный хэш считается для каждого файла, полный — только по запросу
+    (при совпадении частичных). Записи держатся в памяти, как в
+    MetadataCache; переименованный файл переносит хэши на новый путь без
+    перечитывания.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._pending = 0
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            " path TEXT PRIMARY KEY,"
+            " mtime INTEGER NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " partial BLOB NOT NULL,"
+            " full BLOB)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(hashes)")}
+        if 'full' not in columns:
+            self._conn.execute("ALTER TABLE hashes ADD COLUMN full BLOB")
+        self._conn.commit()
+
+        # путь -> (mtime, размер, частичный хэш, полный хэш или None)
+        self._entries = {row[0]: row[1:] for row in self._conn.execute(
+            "SELECT path, mtime, size, partial, full FROM hashes")}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def peek(self, path):
+        """Сохраненный частичный хэш без проверки актуальности или None"""
+        entry = self._entries.get(path)
+        return entry[2] if entry is not None else None
+
+    def partial(self, path, stat=None):
+        """Актуальный частичный хэш файла (из кэша или прочитанный заново).
+
+        None, если файл не читается.
+        """
+        try:
+            st = stat if stat is not None else os.stat(path)
+        except OSError:
+            return None
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return entry[2]
+        try:
+            value = partial_hash(path, st.st_size)
+        except OSError:
+            return None
+        self._store(path, (st.st_mtime_ns, st.st_size, value, None))
+        return value
+
+    def full(self, path, stat=None):
+        """Актуальный хэш всего файла (из кэша или прочитанный заново) или None"""
+        try:
+            st = stat if stat is not None else os.stat(path)
+        except OSError:
+            return None
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            if entry[3] is not None:
+                return entry[3]
+            partial = entry[2]
+        else:
+            partial = self.partial(path, st)
+            if partial is None:
+                return None
+        try:
+            value = full_hash(path)
+        except OSError:
+            return None
+        self._store(path, (st.st_mtime_ns, st.st_size, partial, value))
+        return value
+
+    def _store(self, path, entry):
+        with self._lock:
+            self._entries[path] = entry
+            self._conn.execute("INSERT OR REPLACE INTO hashes (path, mtime, size, partial, full) "
+                               "VALUES (?, ?, ?, ?, ?)", (path,) + entry)
+            self._touch(1)
+
+    def rename(self, old_path, new_path):
+        with self._lock:
+            entry = self._entries.pop(old_path, None)
+            if entry is None:
+                return
+            self._entries[new_path] = entry
+            self._conn.execute("DELETE FROM hashes WHERE path = ?", (new_path,))
+            self._conn.execute("UPDATE hashes SET path = ? WHERE path = ?", (new_path, old_path))
+            self._touch(1)
+
+    def discard(self, paths):
+        with self._lock:
+            gone = [(path,) for path in paths if self._entries.pop(path, None) is not None]
+            if gone:
+                self._conn.executemany("DELETE FROM hashes WHERE path = ?", gone)
+                self._touch(len(gone))
+
+    def flush(self):
+        with self._lock:
+            if self._pending:
+                self._commit()
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._conn.close()
+
+    def _touch(self, count):
+        self._pending += count
+        if self._pending >= AUTOCOMMIT_PENDING:
+            self._commit()
+
+    def _commit(self):
+        self._conn.commit()
+        self._pending = 0
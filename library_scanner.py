@@ -0,0 +1,104 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metadata_cache import probe_file
+
+
+AUDIO_EXTENSIONS = ('.mp3', '.ogg', '.flac', '.wav')
+
+
+def is_audio_file(name):
+    """Проверяет расширение файла"""
+    return name.lower().endswith(AUDIO_EXTENSIONS)
+
+
+def walk_audio_files(root_dir, cancelled=None):
+    """Рекурсивно обходит папку и возвращает пути к аудиофайлам (генератор)"""
+    stack = [root_dir]
+    while stack:
+        if cancelled is not None and cancelled.is_set():
+            return
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file() and is_audio_file(entry.name):
+                    yield entry.path
+            except OSError:
+                continue
+        # Обходим подпапки в алфавитном порядке
+        stack.extend(reversed(subdirs))
+
+
+class LibraryScanner:
+    """Фоновое сканирование папки с музыкой.
+
+    Обход дерева идет в отдельном потоке, заголовки файлов читаются пулом
+    потоков. Результаты накапливаются в буфере, который UI забирает пачками
+    через take_results() из главного цикла Tk — сам сканер с Tk не работает.
+    """
+
+    def __init__(self, root_dir, workers=None, max_in_flight=256):
+        self.root_dir = root_dir
+        self.workers = workers or min(16, (os.cpu_count() or 2) * 2)
+        self.found = 0
+        self.probed = 0
+        self.done = False
+
+        self._lock = threading.Lock()
+        self._results = []
+        self._cancelled = threading.Event()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="library-scanner", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def take_results(self):
+        """Забирает накопленные записи метаданных (вызывается из потока UI)"""
+        with self._lock:
+            results, self._results = self._results, []
+        return results
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=self.workers,
+                                thread_name_prefix="library-probe") as executor:
+            for path in walk_audio_files(self.root_dir, self._cancelled):
+                # Ограничиваем число задач в очереди, чтобы не держать 50k future
+                self._slots.acquire()
+                if self._cancelled.is_set():
+                    self._slots.release()
+                    break
+                with self._lock:
+                    self.found += 1
+                future = executor.submit(probe_file, path)
+                future.add_done_callback(self._on_probed)
+        self.done = True
+
+    def _on_probed(self, future):
+        self._slots.release()
+        try:
+            entry = future.result()
+        except Exception:
+            entry = None
+        with self._lock:
+            self.probed += 1
+            if entry is not None:
+                self._results.append(entry)
@@ -0,0 +1,342 @@
+import json
+import os
+
+from file_hash import FileHashStore
+from metadata_cache import MetadataCache
+from play_history import PlayHistory
+from playlist_store import PlaylistStore, atomic_write_json
+from search_index import SearchIndex
+from audio_decode import numpy_available
+from loudness import LoudnessStore
+from audio_features import FeatureStore, FeatureAnalyzer, MixBuilder
+
+
+class LibraryStore:
+    """Библиотека без UI: плейлисты, метаданные, поиск, история, громкость и признаки треков.
+
+    Все изменения плейлистов идут через этот класс (и пишутся в журнал
+    PlaylistStore), а поисковый индекс и анализ громкости обновляются по
+    подписке. Подписчики получают callback(kind, name, added, removed)
+    в том потоке, который изменил плейлист.
+    """
+
+    def __init__(self, data_dir="music_player_data"):
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+
+        # Кэш метаданных треков (длительность, битрейт, теги)
+        self.metadata_cache = MetadataCache(os.path.join(data_dir, "metadata.db"))
+        self.playlist_store = PlaylistStore(os.path.join(data_dir, "playlists.json"),
+                                            os.path.join(data_dir, "playlists.journal"))
+        self.playlists = {}
+        self.recovered_from = None
+        self.listeners = []
+
+        # Хэши содержимого (узнать перенесенный файл) и папки библиотеки,
+        # за которыми следит LibraryWatcher: папка -> плейлист для новых треков
+        self.hashes = FileHashStore(os.path.join(data_dir, "hashes.db"))
+        self.roots_path = os.path.join(data_dir, "library_roots.json")
+        self.roots = {}
+
+        # История прослушиваний (пишется пачками в своем потоке)
+        self.history = PlayHistory(os.path.join(data_dir, "history.db"))
+
+        # Поисковый индекс строится порциями через index_step()
+        self.search_index = SearchIndex()
+        self.indexing = False
+        self._index_paths = []
+        self._index_pos = 0
+        self._search_events = []
+
+        # Громкость треков для нормализации и признаки для миксов (нужен numpy)
+        if numpy_available():
+            self.loudness = LoudnessStore(os.path.join(data_dir, "loudness.db"))
+            self.features = FeatureStore(os.path.join(data_dir, "features.db"))
+            # Громкость и признаки считаются из одного декодирования файла
+            self.feature_analyzer = FeatureAnalyzer(self.features, self.loudness)
+            self.feature_analyzer.listeners.append(self._on_features_updated)
+        else:
+            self.loudness = None
+            self.features = None
+            self.feature_analyzer = None
+        self._mix_builder = None
+
+    def load(self):
+        """Загружает плейлисты из снимка и журнала изменений"""
+        self.playlists = self.playlist_store.load()
+        self.recovered_from = self.playlist_store.recovered_from
+        self.playlist_store.listeners.append(self._on_playlists_changed)
+        self.metadata_cache.listeners.append(self._on_metadata_updated)
+        self.roots = self._read_roots()
+        return self.playlists
+
+    def _read_roots(self):
+        try:
+            with open(self.roots_path, 'r', encoding='utf-8') as f:
+                roots = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Не удалось прочитать папки библиотеки: {e}")
+            return {}
+        return roots if isinstance(roots, dict) else {}
+
+    def library_paths(self):
+        """Все треки библиотеки без повторов"""
+        return list(dict.fromkeys(
+            path for tracks in self.playlists.values() for path in tracks))
+
+    def start_analysis(self):
+        """Фоновый анализ громкости и признаков всей библиотеки (продолжает прерванный)"""
+        if self.feature_analyzer is not None:
+            self.feature_analyzer.enqueue(self.library_paths())
+
+    def tracks(self, name):
+        return self.playlists.get(name, ())
+
+    def track_info(self, path):
+        """Актуальная запись метаданных или None, если файла нет"""
+        return self.metadata_cache.get(path)
+
+    def gain_for(self, path):
+        return self.loudness.gain_for(path) if self.loudness is not None else 1.0
+
+    def record_play(self, path, started, listened, length, completed=False, segment=False):
+        """Прослушивание трека для истории и статистики"""
+        self.history.record(path, started, listened, length, completed, segment)
+
+    def find_playlist(self, path, prefer=None):
+        """Имя плейлиста с треком; плейлист prefer проверяется первым"""
+        if prefer is not None and path in self.playlists.get(prefer, ()):
+            return prefer
+        return next((name for name, tracks in self.playlists.items() if path in tracks), None)
+
+    # Изменение плейлистов
+
+    def create_playlist(self, name, tracks=()):
+        return self.playlist_store.create(name, tracks)
+
+    def delete_playlist(self, name):
+        self.playlist_store.delete(name)
+
+    def add_tracks(self, name, paths):
+        return self.playlist_store.add_tracks(name, paths)
+
+    def remove_track(self, name, path):
+        self.playlist_store.remove_track(name, path)
+
+    def remove_tracks(self, name, paths):
+        return self.playlist_store.remove_tracks(name, paths)
+
+    def replace_tracks(self, name, pairs):
+        return self.playlist_store.replace_tracks(name, pairs)
+
+    def clear_playlist(self, name):
+        self.playlist_store.clear(name)
+
+    def rename_track(self, old_path, new_path):
+        """Файл переименован или перенесен — путь меняется во всех плейлистах"""
+        store = self.playlist_store
+        if store.table.id_of(old_path) is None or store.is_referenced(new_path):
+            return False
+        # Метаданные переносим первыми: поиск переиндексирует новый путь по событию
+        self.metadata_cache.rename(old_path, new_path)
+        self.hashes.rename(old_path, new_path)
+        return self.playlist_store.rename_track(old_path, new_path)
+
+    # Папки библиотеки
+
+    def add_root(self, folder, playlist):
+        """Папка, за которой следит наблюдатель; новые треки из нее идут в playlist"""
+        folder = os.path.abspath(folder)
+        if self.roots.get(folder) == playlist:
+            return False
+        self.roots[folder] = playlist
+        atomic_write_json(self.roots_path, self.roots)
+        return True
+
+    def root_playlist(self, path):
+        """Плейлист для нового трека — по самой вложенной папке библиотеки"""
+        best = None
+        for folder in self.roots:
+            if path.startswith(folder.rstrip(os.sep) + os.sep):
+                if best is None or len(folder) > len(best):
+                    best = folder
+        return self.roots[best] if best is not None else None
+
+    def apply_fs_changes(self, batch):
+        """Применяет пачку изменений от LibraryWatcher (в потоке UI).
+
+        Переносы меняют путь во всех плейлистах, удаленные файлы убираются
+        из плейлистов, новые треки добавляются в плейлист своей папки,
+        метаданные измененных обновляются. Возвращает (перенесено,
+        удалено, добавлено).
+        """
+        moved = 0
+        for old, new in batch['moved']:
+            if self.rename_track(old, new):
+                moved += 1
+            elif self.playlist_store.is_referenced(new):
+                # Файл перенесли поверх другого трека библиотеки — остается один
+                if sum(self.replace_tracks(name, [(old, new)]) for name in list(self.playlists)):
+                    moved += 1
+                self.metadata_cache.invalidate(old)
+                self.hashes.discard([old])
+
+        gone = set(batch['deleted'])
+        for folder in batch['deleted_dirs']:
+            prefix = folder.rstrip(os.sep) + os.sep
+            gone.update(path for path in self.playlist_store.table.paths
+                        if path.startswith(prefix))
+        removed = set()
+        if gone:
+            for name in list(self.playlists):
+                removed.update(self.remove_tracks(name, gone))
+            for path in gone:
+                self.metadata_cache.invalidate(path)
+            self.hashes.discard(gone)
+
+        self.metadata_cache.put_many(batch['entries'])
+        new_tracks = {}
+        for entry in batch['entries']:
+            path = entry['path']
+            if self.find_playlist(path) is not None:
+                continue
+            name = self.root_playlist(path)
+            if name in self.playlists:
+                new_tracks.setdefault(name, []).append(path)
+        added = sum(len(self.add_tracks(name, paths)) for name, paths in new_tracks.items())
+        return moved, len(removed), added
+
+    def _on_playlists_changed(self, kind, name, added, removed):
+        if kind == 'rename':
+            self.history.rename(removed[0], added[0])
+        if self.indexing:
+            self._search_events.append((kind, added, removed))
+        else:
+            self._apply_search_changes(kind, added, removed)
+        if added and self.feature_analyzer is not None:
+            self.feature_analyzer.enqueue(added)
+        self._mix_builder = None
+
+        for callback in self.listeners:
+            callback(kind, name, added, removed)
+
+    # Дубликаты
+
+    def merge_duplicates(self, groups):
+        """Оставляет во всех плейлистах по одному файлу из каждой группы одинаковых.
+
+        Копия заменяется оставленным файлом на своем месте (или убирается,
+        если он уже есть в плейлисте). Остается файл, который есть в
+        большем числе плейлистов, при равенстве — с большим битрейтом.
+        Файлы на диске не трогаются. Возвращает число замененных треков.
+        """
+        def rank(path):
+            entry = self.metadata_cache.peek(path)
+            return (sum(path in tracks for tracks in self.playlists.values()),
+                    entry['bitrate'] if entry is not None else 0)
+
+        pairs = []
+        for group in groups:
+            keeper = max(group, key=rank)
+            pairs.extend((path, keeper) for path in group if path != keeper)
+        return sum(self.replace_tracks(name, pairs) for name in list(self.playlists))
+
+    # Поиск
+
+    def start_indexing(self):
+        """Строит индекс заново: ссылки, добавленные до этого, иначе посчитались бы дважды"""
+        self.search_index = SearchIndex()
+        self._search_events = []
+        self._index_paths = [path for tracks in self.playlists.values() for path in tracks]
+        self._index_pos = 0
+        self.indexing = True
+
+    def index_step(self, chunk_size=2000):
+        """Индексирует следующую порцию треков. Возвращает True, пока работа не закончена"""
+        if not self.indexing:
+            return False
+
+        end = min(self._index_pos + chunk_size, len(self._index_paths))
+        for path in self._index_paths[self._index_pos:end]:
+            self.search_index.add(path, self.metadata_cache.peek(path))
+        self._index_pos = end
+        if end < len(self._index_paths):
+            return True
+
+        # Применяем изменения, которые случились во время построения
+        self.indexing = False
+        self._index_paths = []
+        events, self._search_events = self._search_events, []
+        for kind, added, removed in events:
+            self._apply_search_changes(kind, added, removed)
+        return False
+
+    def search(self, query, limit=200):
+        return self.search_index.search(query, limit=limit)
+
+    def _apply_search_changes(self, kind, added, removed):
+        if kind == 'rename':
+            # Документ переезжает вместе со ссылками из всех плейлистов
+            self.search_index.rename(removed[0], added[0], self.metadata_cache.peek(added[0]))
+            return
+        for path in added:
+            self.search_index.add(path, self.metadata_cache.peek(path))
+        for path in removed:
+            self.search_index.discard(path)
+
+    def _on_metadata_updated(self, entries):
+        """Переиндексирует треки, для которых появились теги"""
+        for entry in entries:
+            self.search_index.update(entry['path'], entry)
+
+    # Миксы
+
+    def can_smart_mix(self):
+        return self.features is not None and len(self.features) > 0
+
+    def smart_mix(self, count, seed=None):
+        """Микс из треков всей библиотеки с плавными переходами по признакам звука.
+
+        seed — первый трек (если для него есть признаки). Пустой список,
+        если признаков еще нет.
+        """
+        if not self.can_smart_mix():
+            return []
+        builder = self._mix_builder
+        if builder is None:
+            paths, matrix = self.features.matrix()
+            library = set(self.library_paths())
+            rows = [i for i, path in enumerate(paths) if path in library]
+            builder = self._mix_builder = MixBuilder([paths[i] for i in rows], matrix[rows])
+        return builder.build(count, seed=seed)
+
+    def _on_features_updated(self, entry):
+        # Вызывается в потоке анализа: набор кандидатов соберется заново
+        self._mix_builder = None
+
+    # Сохранение
+
+    def flush(self):
+        """Записывает накопленные метаданные на диск"""
+        self.metadata_cache.flush()
+        self.hashes.flush()
+
+    def compact(self):
+        """Сворачивает журнал изменений в полный снимок плейлистов и чистит кэш метаданных"""
+        self.playlist_store.compact()
+        self.metadata_cache.prune(set(self.library_paths()))
+
+    def close(self):
+        if self.feature_analyzer is not None:
+            self.feature_analyzer.stop()
+        # Журнал плейлистов сворачивается в playlist_store.close()
+        self.metadata_cache.prune(set(self.library_paths()))
+        self.playlist_store.close()
+        self.metadata_cache.close()
+        self.hashes.close()
+        self.history.close()
+        if self.loudness is not None:
+            self.loudness.close()
+            self.features.close()
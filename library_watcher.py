@@ -0,0 +1,494 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from library_scanner import is_audio_file
+from metadata_cache import probe_file
+
+
+# События копятся, пока файловая система не затихнет на BATCH_DELAY секунд,
+# но пачка отдается не реже, чем раз в BATCH_MAX_DELAY
+BATCH_DELAY = 0.5
+BATCH_MAX_DELAY = 5.0
+
+# Период опроса папок, если inotify недоступен
+POLL_INTERVAL = 5.0
+
+# Флаги inotify (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR)
+
+_EVENT = struct.Struct('iIII')
+
+
+def _load_inotify():
+    """libc с inotify или None (не Linux, нет libc)"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+    return libc
+
+
+def _walk_dirs(root):
+    """Папка и все вложенные папки (симлинки не раскрываются)"""
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        yield current
+        try:
+            with os.scandir(current) as it:
+                stack.extend(entry.path for entry in it
+                             if entry.is_dir(follow_symlinks=False))
+        except OSError:
+            continue
+
+
+def _is_under(path, directory):
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+class Changes:
+    """Накопленные изменения файлов за одну пачку.
+
+    Повторные события по одному пути схлопываются: файл, созданный и
+    удаленный внутри пачки, не попадает никуда, цепочка переименований
+    a -> b -> c дает одно a -> c.
+    """
+
+    def __init__(self):
+        self.changed = set()
+        self.deleted = set()
+        self.deleted_dirs = set()
+        self.moved = {}
+
+    def __bool__(self):
+        return bool(self.changed or self.deleted or self.deleted_dirs or self.moved)
+
+    def change(self, path):
+        self.deleted.discard(path)
+        self.changed.add(path)
+
+    def delete(self, path):
+        if path in self.changed:
+            self.changed.discard(path)
+        for old, new in list(self.moved.items()):
+            if new == path:
+                del self.moved[old]
+                path = old
+        self.deleted.add(path)
+
+    def delete_dir(self, path):
+        self.changed = {p for p in self.changed if not _is_under(p, path)}
+        self.deleted_dirs.add(path)
+
+    def move(self, old_path, new_path):
+        if old_path in self.changed:
+            # Файл появился внутри этой же пачки — для библиотеки он новый
+            self.changed.discard(old_path)
+            self.changed.add(new_path)
+            return
+        for old, new in self.moved.items():
+            if new == old_path:
+                old_path = old
+                break
+        self.deleted.discard(new_path)
+        if old_path == new_path:
+            self.moved.pop(old_path, None)
+        else:
+            self.moved[old_path] = new_path
+
+
+class LibraryWatcher:
+    """Следит за папками библиотеки и отдает изменения пачками.
+
+    На Linux работает через inotify (ctypes, без зависимостей), иначе — или
+    если не хватило лимита наблюдений — опрашивает папки: каждые
+    POLL_INTERVAL секунд проверяется только mtime папок, файлы
+    перечитываются лишь в изменившихся папках.
+
+    События копятся и схлопываются (Changes), потом пачка разбирается в
+    фоновом потоке: заголовки новых и измененных треков читаются там же,
+    а удаленный файл и появившийся файл того же размера считаются
+    переносом, если совпал хэш содержимого (или, если старого хэша нет,
+    имя файла). UI забирает пачки через take_results() — как у
+    LibraryScanner, сам наблюдатель библиотеку не меняет.
+
+    known(path) — запись метаданных известного трека или None (размер и
+    mtime для сравнения), hashes — FileHashStore.
+    """
+
+    def __init__(self, roots, known, hashes, poll_interval=POLL_INTERVAL, use_inotify=True):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.known = known
+        self.hashes = hashes
+        self.poll_interval = poll_interval
+        self.backend = None
+
+        self._libc = _load_inotify() if use_inotify else None
+        self._lock = threading.Lock()
+        self._results = []
+        self._new_roots = []
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="library-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def add_root(self, root):
+        """Начинает следить за новой папкой (из любого потока)"""
+        root = os.path.abspath(root)
+        with self._lock:
+            if root not in self.roots:
+                self.roots.append(root)
+                self._new_roots.append(root)
+
+    def watches(self, path):
+        """Следит ли inotify за файлом: тогда его изменения придут событием и stat не нужен"""
+        return self.backend == 'inotify' and any(_is_under(path, root) for root in self.roots)
+
+    def take_results(self):
+        """Забирает готовые пачки изменений (вызывается из потока UI)"""
+        with self._lock:
+            results, self._results = self._results, []
+        return results
+
+    def _take_new_roots(self):
+        with self._lock:
+            roots, self._new_roots = self._new_roots, []
+        return roots
+
+    def _run(self):
+        if self._libc is not None:
+            try:
+                if self._run_inotify():
+                    return
+            except OSError as e:
+                print(f"inotify недоступен ({e}), папки будут опрашиваться")
+        self._run_polling()
+
+    # inotify
+
+    def _run_inotify(self):
+        """Цикл inotify. False — нужно перейти на опрос"""
+        libc = self._libc
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self.backend = 'inotify'
+        watches = {}
+        try:
+            for root in self.roots:
+                if not self._watch_tree(fd, watches, root):
+                    return False
+
+            changes = Changes()
+            moves_from = {}
+            first_event = last_event = None
+            while not self._stopped.is_set():
+                for root in self._take_new_roots():
+                    if not self._watch_tree(fd, watches, root):
+                        return False
+
+                timeout = BATCH_DELAY / 2 if first_event is not None else 1.0
+                ready, _, _ = select.select([fd], [], [], timeout)
+                now = time.monotonic()
+                if ready:
+                    try:
+                        data = os.read(fd, 64 * 1024)
+                    except BlockingIOError:
+                        data = b''
+                    if not self._handle_events(fd, watches, data, changes, moves_from):
+                        print("Очередь inotify переполнена, папки будут опрашиваться")
+                        return False
+                    if data:
+                        last_event = now
+                        if first_event is None:
+                            first_event = now
+
+                if first_event is not None and (now - last_event >= BATCH_DELAY
+                                                or now - first_event >= BATCH_MAX_DELAY):
+                    # Перенос без пары (из библиотеки наружу) — удаление
+                    for path, is_dir in moves_from.values():
+                        if is_dir:
+                            self._unwatch_under(fd, watches, path)
+                            changes.delete_dir(path)
+                        else:
+                            changes.delete(path)
+                    moves_from.clear()
+                    self._emit(changes)
+                    changes = Changes()
+                    first_event = last_event = None
+            return True
+        finally:
+            os.close(fd)
+
+    def _watch_tree(self, fd, watches, root):
+        """Ставит наблюдение на папку и все вложенные. False — кончился лимит"""
+        for directory in _walk_dirs(root):
+            wd = self._libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOSPC:
+                    print("Не хватает лимита inotify (fs.inotify.max_user_watches)")
+                    return False
+                continue
+            watches[wd] = directory
+        return True
+
+    def _unwatch_under(self, fd, watches, directory):
+        for wd, path in list(watches.items()):
+            if _is_under(path, directory):
+                self._libc.inotify_rm_watch(fd, wd)
+                del watches[wd]
+
+    def _handle_events(self, fd, watches, data, changes, moves_from):
+        """Разбирает события из буфера inotify. False — очередь переполнена"""
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                return False
+            directory = watches.get(wd)
+            if mask & IN_IGNORED:
+                watches.pop(wd, None)
+                continue
+            if directory is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_UNMOUNT):
+                # Корень пропал (например, отключили диск) — треки не трогаем
+                continue
+
+            path = os.path.join(directory, name)
+            is_dir = bool(mask & IN_ISDIR)
+            if mask & IN_MOVED_FROM:
+                moves_from[cookie] = (path, is_dir)
+            elif mask & IN_MOVED_TO:
+                source = moves_from.pop(cookie, None)
+                if is_dir:
+                    self._dir_moved_in(fd, watches, changes, source, path)
+                elif source is not None:
+                    changes.move(source[0], path)
+                else:
+                    changes.change(path)
+            elif is_dir:
+                if mask & IN_CREATE:
+                    self._dir_moved_in(fd, watches, changes, None, path)
+                elif mask & IN_DELETE:
+                    changes.delete_dir(path)
+            elif mask & (IN_CREATE | IN_CLOSE_WRITE):
+                changes.change(path)
+            elif mask & IN_DELETE:
+                changes.delete(path)
+        return True
+
+    def _dir_moved_in(self, fd, watches, changes, source, path):
+        """Папка появилась или переименована внутри библиотеки"""
+        if source is not None:
+            # Переименование: наблюдения остаются, меняются их пути
+            old_dir = source[0]
+            for wd, watched in list(watches.items()):
+                if _is_under(watched, old_dir):
+                    watches[wd] = path + watched[len(old_dir):]
+        else:
+            self._watch_tree(fd, watches, path)
+        for directory in _walk_dirs(path):
+            try:
+                with os.scandir(directory) as it:
+                    files = [entry.path for entry in it if entry.is_file()]
+            except OSError:
+                continue
+            for file_path in files:
+                if source is not None:
+                    changes.move(source[0] + file_path[len(path):], file_path)
+                else:
+                    changes.change(file_path)
+
+    # Опрос
+
+    def _run_polling(self):
+        self.backend = 'polling'
+        # папка -> (mtime, {имя файла: (размер, mtime)}, [вложенные папки])
+        state = {}
+        for root in self.roots:
+            self._poll_tree(state, root, None)
+        while not self._stopped.wait(self.poll_interval):
+            changes = Changes()
+            for root in self._take_new_roots():
+                self._poll_tree(state, root, None)
+            for root in list(self.roots):
+                self._poll_tree(state, root, changes)
+            self._emit(changes)
+
+    def _poll_tree(self, state, root, changes):
+        """Сверяет дерево папок с прошлым обходом.
+
+        changes=None — только запомнить состояние (первый обход). Папка,
+        которой нет (корень на отключенном диске), пропускается без
+        удаления треков.
+        """
+        if not os.path.isdir(root):
+            return
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            old = state.get(directory)
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            if old is not None and old[0] == mtime:
+                stack.extend(old[2])
+                continue
+
+            files = {}
+            subdirs = []
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append(entry.path)
+                            elif entry.is_file() and is_audio_file(entry.name):
+                                st = entry.stat()
+                                files[entry.name] = (st.st_size, st.st_mtime_ns)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+            state[directory] = (mtime, files, subdirs)
+            stack.extend(subdirs)
+
+            if changes is None:
+                continue
+            old_files = old[1] if old is not None else {}
+            for name, signature in files.items():
+                if old_files.get(name) != signature:
+                    changes.change(os.path.join(directory, name))
+            for name in old_files.keys() - files.keys():
+                changes.delete(os.path.join(directory, name))
+            if old is not None:
+                for subdir in set(old[2]) - set(subdirs):
+                    self._forget_tree(state, subdir, changes)
+
+    def _forget_tree(self, state, directory, changes):
+        """Папка исчезла: все известные файлы в ней удалены"""
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            old = state.pop(current, None)
+            if old is None:
+                continue
+            for name in old[1]:
+                changes.delete(os.path.join(current, name))
+            stack.extend(old[2])
+
+    # Разбор пачки
+
+    def _emit(self, changes):
+        if not changes:
+            return
+        batch = self._resolve(changes)
+        if batch['moved'] or batch['deleted'] or batch['deleted_dirs'] or batch['entries']:
+            with self._lock:
+                self._results.append(batch)
+
+    def _resolve(self, changes):
+        """Пачка для UI: переносы, удаления и записи метаданных новых треков"""
+        moved = {old: new for old, new in changes.moved.items()
+                 if is_audio_file(old) and is_audio_file(new)}
+        deleted = {path for path in changes.deleted if is_audio_file(path)}
+        created = {}
+        for path in changes.changed:
+            if not is_audio_file(path):
+                continue
+            try:
+                created[path] = os.stat(path)
+            except OSError:
+                continue
+
+        self._match_moves(moved, deleted, created)
+
+        entries = []
+        for path, st in created.items():
+            entry = self.known(path)
+            if entry is not None and entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size:
+                continue
+            entry = probe_file(path, stat=st)
+            if entry is not None:
+                entries.append(entry)
+                # Хэш нового трека пригодится, когда его перенесут
+                self.hashes.partial(path, st)
+
+        return {
+            'moved': list(moved.items()),
+            'deleted': sorted(deleted),
+            'deleted_dirs': sorted(changes.deleted_dirs),
+            'entries': entries,
+        }
+
+    def _match_moves(self, moved, deleted, created):
+        """Удаление + появление файла того же размера и содержимого — перенос"""
+        by_size = {}
+        for path in deleted:
+            entry = self.known(path)
+            if entry is not None:
+                by_size.setdefault(entry['size'], []).append(path)
+        if not by_size:
+            return
+
+        for path, st in list(created.items()):
+            if self.known(path) is not None:
+                continue
+            candidates = by_size.get(st.st_size)
+            if not candidates:
+                continue
+            value = self.hashes.partial(path, st)
+            match = [old for old in candidates
+                     if value is not None and self.hashes.peek(old) == value]
+            if not match:
+                # Хэша старого файла нет — годится только единственный файл с тем же именем
+                name = os.path.basename(path)
+                match = [old for old in candidates
+                         if self.hashes.peek(old) is None and os.path.basename(old) == name]
+                if len(match) != 1:
+                    continue
+            old = match[0]
+            candidates.remove(old)
+            deleted.discard(old)
+            del created[path]
+            moved[old] = path
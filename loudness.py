@@ -0,0 +1,187 @@
+import sqlite3
+import threading
+
+from audio_decode import np
+
+
+# Целевая громкость (как в ReplayGain 2.0), LUFS
+REFERENCE_LUFS = -18.0
+
+# Стробирование по ITU-R BS.1770: блоки 400 мс с шагом 100 мс
+BLOCK_SECONDS = 0.4
+HOP_SECONDS = 0.1
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+
+# Сколько 100-мс отрезков обрабатывается за один вызов FFT (ограничивает память)
+FFT_CHUNK = 256
+
+# Сколько результатов копим перед commit
+AUTOCOMMIT_PENDING = 50
+
+LOUDNESS_FIELDS = ('path', 'mtime', 'size', 'integrated', 'peak')
+
+
+def _biquad_response(b, a, freqs, sample_rate):
+    """Квадрат АЧХ биквадратного фильтра на частотах freqs"""
+    z = np.exp(-2j * np.pi * freqs / sample_rate)
+    numerator = b[0] + b[1] * z + b[2] * z * z
+    denominator = a[0] + a[1] * z + a[2] * z * z
+    return np.abs(numerator / denominator) ** 2
+
+
+def k_weighting(freqs, sample_rate):
+    """Квадрат АЧХ K-фильтра BS.1770 (полка +4 дБ и фильтр RLB) для любой частоты дискретизации.
+
+    Коэффициенты выводятся через билинейное преобразование так, что на
+    48 кГц совпадают с таблицей BS.1770 (997 Гц усиливаются на 0,691 дБ).
+    """
+    # Высокочастотная полка
+    gain_db, fc, q = 3.999843853973347, 1681.974450955533, 0.7071752369554196
+    k = np.tan(np.pi * fc / sample_rate)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.4996667741545416
+    shelf = _biquad_response(
+        (vh + vb * k / q + k * k, 2 * (k * k - vh), vh - vb * k / q + k * k),
+        (1 + k / q + k * k, 2 * (k * k - 1), 1 - k / q + k * k),
+        freqs, sample_rate)
+
+    # Фильтр верхних частот RLB (числитель 1, -2, 1 без нормировки, как в BS.1770)
+    fc, q = 38.13547087602444, 0.5003270373238773
+    k = np.tan(np.pi * fc / sample_rate)
+    a0 = 1 + k / q + k * k
+    highpass = _biquad_response(
+        (1.0, -2.0, 1.0),
+        (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0),
+        freqs, sample_rate)
+
+    return shelf * highpass
+
+
+def _hop_energies(pcm, sample_rate):
+    """Средняя K-взвешенная мощность каждого 100-мс отрезка (сумма по каналам).
+
+    Фильтрация делается в частотной области: по теореме Парсеваля мощность
+    отфильтрованного отрезка равна сумме |X(f)|^2 * |H(f)|^2.
+    """
+    hop = int(round(HOP_SECONDS * sample_rate))
+    count = len(pcm) // hop
+    if count == 0:
+        return np.zeros(0)
+
+    weights = k_weighting(np.fft.rfftfreq(hop, 1 / sample_rate), sample_rate)
+    # Бины, кроме постоянной составляющей и частоты Найквиста, входят в rfft дважды
+    weights[1:(hop + 1) // 2] *= 2
+
+    frames = pcm[:count * hop].reshape(count, hop, -1)
+    energies = np.empty(count)
+    for start in range(0, count, FFT_CHUNK):
+        spectrum = np.fft.rfft(frames[start:start + FFT_CHUNK], axis=1)
+        power = np.square(np.abs(spectrum)).sum(axis=2)
+        energies[start:start + FFT_CHUNK] = power @ weights / (hop * hop)
+    return energies
+
+
+def measure_loudness(pcm, sample_rate):
+    """Интегральная громкость (LUFS) и пиковый уровень сэмпла.
+
+    pcm — массив (сэмплы, каналы). Для тишины громкость равна None.
+    """
+    peak = float(np.abs(pcm).max()) if len(pcm) else 0.0
+    energies = _hop_energies(pcm, sample_rate)
+
+    hops_per_block = int(round(BLOCK_SECONDS / HOP_SECONDS))
+    if len(energies) < hops_per_block:
+        return None, peak
+
+    # Блоки 400 мс с перекрытием 75% — скользящее среднее по четырем отрезкам
+    cumulative = np.concatenate(([0.0], np.cumsum(energies)))
+    blocks = (cumulative[hops_per_block:] - cumulative[:-hops_per_block]) / hops_per_block
+
+    with np.errstate(divide='ignore'):
+        block_lufs = -0.691 + 10 * np.log10(blocks)
+    gated = blocks[block_lufs > ABSOLUTE_GATE_LUFS]
+    if len(gated) == 0:
+        return None, peak
+
+    relative_gate = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE_LU
+    gated = blocks[block_lufs > max(relative_gate, ABSOLUTE_GATE_LUFS)]
+    return float(-0.691 + 10 * np.log10(gated.mean())), peak
+
+
+def track_gain(integrated, peak, reference=REFERENCE_LUFS):
+    """Множитель громкости трека; не поднимает пик выше полной шкалы"""
+    if integrated is None:
+        return 1.0
+    gain = 10 ** ((reference - integrated) / 20)
+    if peak > 0:
+        gain = min(gain, 1.0 / peak)
+    return gain
+
+
+class LoudnessStore:
+    """Громкость треков в SQLite (music_player_data/loudness.db).
+
+    Как и MetadataCache, держит все записи в памяти, поэтому gain_for()
+    при запуске трека — это поиск в словаре без чтения диска.
+    """
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS loudness ("
+            " path TEXT PRIMARY KEY,"
+            " mtime INTEGER NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " integrated REAL,"
+            " peak REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+        self._entries = {}
+        for row in self._conn.execute(f"SELECT {', '.join(LOUDNESS_FIELDS)} FROM loudness"):
+            entry = dict(zip(LOUDNESS_FIELDS, row))
+            self._entries[entry['path']] = entry
+
+    def __len__(self):
+        return len(self._entries)
+
+    def is_current(self, path, stat):
+        entry = self._entries.get(path)
+        return (entry is not None and entry['mtime'] == stat.st_mtime_ns
+                and entry['size'] == stat.st_size)
+
+    def gain_for(self, path):
+        """Множитель громкости трека; 1.0, если трек еще не проанализирован"""
+        entry = self._entries.get(path)
+        if entry is None:
+            return 1.0
+        return track_gain(entry['integrated'], entry['peak'])
+
+    def put(self, entry):
+        with self._lock:
+            self._entries[entry['path']] = entry
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO loudness ({', '.join(LOUDNESS_FIELDS)}) "
+                f"VALUES ({', '.join('?' for _ in LOUDNESS_FIELDS)})",
+                tuple(entry[f] for f in LOUDNESS_FIELDS)
+            )
+            self._pending += 1
+            if self._pending >= AUTOCOMMIT_PENDING:
+                self._commit()
+
+    def flush(self):
+        with self._lock:
+            if self._pending:
+                self._commit()
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._conn.close()
+
+    def _commit(self):
+        self._conn.commit()
+        self._pending = 0
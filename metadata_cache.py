@@ -0,0 +1,208 @@
+import os
+import sqlite3
+import threading
+
+from perf_trace import tracer
+
+
+# Сколько записей копим в транзакции перед автоматическим commit
+AUTOCOMMIT_PENDING = 200
+
+TRACK_FIELDS = ('path', 'mtime', 'size', 'duration', 'bitrate',
+                'title', 'artist', 'album', 'ok')
+
+
+def _first_tag(tags, key):
+    """Возвращает первое значение тега или пустую строку"""
+    if not tags:
+        return ''
+    try:
+        values = tags.get(key)
+    except Exception:
+        return ''
+    if not values:
+        return ''
+    if isinstance(values, (list, tuple)):
+        return str(values[0])
+    return str(values)
+
+
+def probe_file(path, stat=None):
+    """Читает заголовки аудиофайла и возвращает запись для кэша.
+
+    Возвращает None, если файла нет. Если файл есть, но mutagen не смог
+    его разобрать, запись всё равно возвращается (ok=0), чтобы не
+    перечитывать битый файл при каждой отрисовке.
+    """
+    try:
+        st = stat if stat is not None else os.stat(path)
+    except OSError:
+        return None
+
+    entry = {
+        'path': path,
+        'mtime': st.st_mtime_ns,
+        'size': st.st_size,
+        'duration': 0.0,
+        'bitrate': 0,
+        'title': '',
+        'artist': '',
+        'album': '',
+        'ok': 0,
+    }
+
+    # mutagen нужен только для файлов не из кэша — не импортируем его при запуске
+    import mutagen
+
+    try:
+        with tracer.span('metadata_read', path=path):
+            audio = mutagen.File(path, easy=True)
+    except Exception:
+        audio = None
+
+    if audio is not None and audio.info is not None:
+        entry['duration'] = float(getattr(audio.info, 'length', 0) or 0)
+        entry['bitrate'] = int(getattr(audio.info, 'bitrate', 0) or 0)
+        entry['title'] = _first_tag(audio.tags, 'title')
+        entry['artist'] = _first_tag(audio.tags, 'artist')
+        entry['album'] = _first_tag(audio.tags, 'album')
+        entry['ok'] = 1
+
+    return entry
+
+
+class MetadataCache:
+    """Дисковый кэш метаданных треков (длительность, битрейт, теги).
+
+    Запись считается актуальной, пока у файла совпадают mtime и размер.
+    Устаревшие записи перечитываются лениво — при первом обращении через
+    get(). Все записи держатся в памяти, SQLite используется как хранилище
+    между запусками.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._pending = 0
+        # Подписчики на обновление записей: callback(entries).
+        # Вызываются в том потоке, который записал данные
+        self.listeners = []
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            " path TEXT PRIMARY KEY,"
+            " mtime INTEGER NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " duration REAL NOT NULL,"
+            " bitrate INTEGER NOT NULL,"
+            " title TEXT NOT NULL,"
+            " artist TEXT NOT NULL,"
+            " album TEXT NOT NULL,"
+            " ok INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+        self._entries = {}
+        for row in self._conn.execute(f"SELECT {', '.join(TRACK_FIELDS)} FROM tracks"):
+            entry = dict(zip(TRACK_FIELDS, row))
+            self._entries[entry['path']] = entry
+
+    def __len__(self):
+        return len(self._entries)
+
+    def peek(self, path):
+        """Возвращает запись без проверки актуальности (без обращения к диску)"""
+        return self._entries.get(path)
+
+    def get(self, path):
+        """Возвращает актуальную запись для файла или None, если файла нет.
+
+        Если файл изменился (mtime/размер) или ещё не встречался,
+        заголовки перечитываются и запись обновляется.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        entry = self._entries.get(path)
+        if entry is not None and entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size:
+            return entry
+
+        entry = probe_file(path, stat=st)
+        if entry is not None:
+            self.put(entry)
+        return entry
+
+    def put(self, entry):
+        """Сохраняет одну запись"""
+        self.put_many([entry])
+
+    def put_many(self, entries):
+        """Сохраняет пачку записей (например, от сканера библиотеки)"""
+        entries = [e for e in entries if e is not None]
+        if not entries:
+            return
+        with self._lock:
+            for entry in entries:
+                self._entries[entry['path']] = entry
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO tracks ({', '.join(TRACK_FIELDS)}) "
+                f"VALUES ({', '.join('?' for _ in TRACK_FIELDS)})",
+                [tuple(e[f] for f in TRACK_FIELDS) for e in entries]
+            )
+            self._pending += len(entries)
+            if self._pending >= AUTOCOMMIT_PENDING:
+                self._commit()
+
+        for callback in self.listeners:
+            callback(entries)
+
+    def rename(self, old_path, new_path):
+        """Файл переименован: запись переходит на новый путь без перечитывания"""
+        with self._lock:
+            entry = self._entries.pop(old_path, None)
+            if entry is None:
+                return
+            entry = dict(entry, path=new_path)
+            self._entries[new_path] = entry
+            self._conn.execute("DELETE FROM tracks WHERE path = ?", (old_path,))
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO tracks ({', '.join(TRACK_FIELDS)}) "
+                f"VALUES ({', '.join('?' for _ in TRACK_FIELDS)})",
+                tuple(entry[f] for f in TRACK_FIELDS))
+            self._pending += 1
+
+    def invalidate(self, path):
+        """Удаляет запись — при следующем get() файл будет перечитан"""
+        with self._lock:
+            if self._entries.pop(path, None) is not None:
+                self._conn.execute("DELETE FROM tracks WHERE path = ?", (path,))
+                self._pending += 1
+
+    def prune(self, live_paths):
+        """Удаляет записи о файлах, которых нет среди live_paths (ушли из библиотеки)"""
+        with self._lock:
+            missing = [path for path in self._entries if path not in live_paths]
+            for path in missing:
+                self._entries.pop(path, None)
+            self._conn.executemany("DELETE FROM tracks WHERE path = ?",
+                                   [(path,) for path in missing])
+            self._pending += len(missing)
+            self._commit()
+        return len(missing)
+
+    def flush(self):
+        """Записывает накопленные изменения на диск"""
+        with self._lock:
+            if self._pending:
+                self._commit()
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._conn.close()
+
+    def _commit(self):
+        self._conn.commit()
+        self._pending = 0
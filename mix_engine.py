@@ -0,0 +1,246 @@
+import math
+import queue
+import random
+import threading
+
+import pygame
+
+from playback_clock import PlaybackClock
+from shuffle import ShuffleOrder
+
+
+def _linear(x):
+    return 1 - x, x
+
+
+def _equal_power(x):
+    return math.cos(x * math.pi / 2), math.sin(x * math.pi / 2)
+
+
+def _s_curve(x):
+    fade_in = x * x * (3 - 2 * x)
+    return 1 - fade_in, fade_in
+
+
+# Кривая кроссфейда: доля перехода (0..1) -> (громкость уходящего, входящего)
+CROSSFADE_CURVES = {
+    'linear': _linear,
+    'equal_power': _equal_power,
+    's_curve': _s_curve,
+}
+
+# Каналы микшера, которые резервируются под микс
+MIX_CHANNELS = (0, 1)
+
+
+class MixEngine:
+    """Движок микса с плавными переходами между треками.
+
+    Работает в отдельном аудиопотоке: следующий трек заранее декодируется
+    в pygame.mixer.Sound (в памяти одновременно не больше двух треков —
+    уходящего и входящего), а переход сводится на двух зарезервированных
+    каналах микшера по выбранной кривой кроссфейда. UI получает события
+    из очереди events и не блокируется.
+    """
+
+    def __init__(self, tracks, crossfade=4.0, segment=(8.0, 15.0),
+                 curve='equal_power', volume=0.7, step=0.02, gain_for=None):
+        self.tracks = list(tracks)
+        self.crossfade = crossfade
+        self.segment = segment
+        self.curve = CROSSFADE_CURVES[curve]
+        self.volume = volume
+        self.step = step
+        # Множитель нормализации громкости для трека: gain_for(path)
+        self.gain_for = gain_for
+
+        # События для UI: ('track', path, сколько секунд играл прошлый трек
+        # или None для первого) или ('error', path, message)
+        self.events = queue.Queue()
+
+        self._stop = threading.Event()
+        self._skip = threading.Event()
+        self._paused = False
+        # Общее время микса без учета пауз
+        self._timeline = PlaybackClock()
+        self._track_started = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+        # Порядок треков без повторов, пока не сыграны все
+        self._order = ShuffleOrder(self.tracks)
+
+        pygame.mixer.set_reserved(len(MIX_CHANNELS))
+        self._channels = [pygame.mixer.Channel(i) for i in MIX_CHANNELS]
+        self._gains = [1.0, 1.0]
+        self._active = 0
+
+    def start(self):
+        self._timeline.start()
+        self._thread = threading.Thread(target=self._run, name="mix-engine", daemon=True)
+        self._thread.start()
+
+    def stop(self, fadeout_ms=300):
+        # Под замком: после этого _play уже не запустит звук
+        with self._lock:
+            self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        for channel in self._channels:
+            channel.fadeout(fadeout_ms)
+
+    def skip(self):
+        """Начать переход к следующему треку сейчас"""
+        self._skip.set()
+
+    def pause(self):
+        with self._lock:
+            if not self._paused:
+                self._paused = True
+                self._timeline.pause()
+                for channel in self._channels:
+                    channel.pause()
+
+    def resume(self):
+        with self._lock:
+            if self._paused:
+                self._paused = False
+                self._timeline.resume()
+                for channel in self._channels:
+                    channel.unpause()
+
+    def set_volume(self, volume):
+        self.volume = volume
+        # Во время кроссфейда громкость выставит сам переход
+        self._channels[self._active].set_volume(self._level(self._active))
+
+    def _level(self, index, fade=1.0):
+        return min(self.volume * self._gains[index] * fade, 1.0)
+
+    def _gain(self, path):
+        return self.gain_for(path) if self.gain_for is not None else 1.0
+
+    def _clock(self):
+        """Время воспроизведения без учета пауз"""
+        with self._lock:
+            return self._timeline.position()
+
+    def track_position(self):
+        """Позиция в текущем треке в секундах"""
+        return max(self._clock() - self._track_started, 0.0)
+
+    def _pick_track(self):
+        """Случайный трек; повторы — только после того, как сыграны все"""
+        return self._order.next()
+
+    def _decode_next(self):
+        """Декодирует следующий трек; пропускает файлы, которые не читаются"""
+        for _ in range(len(self.tracks)):
+            if self._stop.is_set():
+                return None, None
+            path = self._pick_track()
+            try:
+                sound = pygame.mixer.Sound(path)
+            except Exception as e:
+                self.events.put(('error', path, str(e)))
+                continue
+            # Пока декодировали, микс могли выключить — звук не нужен
+            if self._stop.is_set():
+                return None, None
+            return path, sound
+        return None, None
+
+    def _play(self, channel, sound):
+        """Запускает звук на канале, если микс не остановлен. False — остановлен"""
+        with self._lock:
+            if self._stop.is_set():
+                return False
+            channel.play(sound)
+            if self._paused:
+                channel.pause()
+            return True
+
+    def _wait_until(self, deadline):
+        """Ждет момента deadline по часам без пауз. False — если остановлены"""
+        while not self._stop.is_set():
+            if self._skip.is_set():
+                self._skip.clear()
+                return True
+            remaining = deadline - self._clock()
+            if remaining <= 0:
+                return True
+            self._stop.wait(min(remaining, 0.05))
+        return False
+
+    def _segment_length(self, sound):
+        low, high = self.segment
+        length = random.uniform(low, high)
+        return max(min(length, sound.get_length() - self.crossfade), self.crossfade)
+
+    def _run(self):
+        path, sound = self._decode_next()
+        if sound is None:
+            return
+
+        channel = self._channels[self._active]
+        self._gains[self._active] = self._gain(path)
+        channel.set_volume(self._level(self._active))
+        if not self._play(channel, sound):
+            return
+        self._track_started = self._clock()
+        self.events.put(('track', path, None))
+
+        while not self._stop.is_set():
+            # Следующий трек декодируется, пока играет текущий
+            next_path, next_sound = self._decode_next()
+            if next_sound is None:
+                return
+
+            fade_start = self._track_started + self._segment_length(sound)
+            if not self._wait_until(fade_start):
+                return
+
+            fade_began = self._clock()
+            if not self._crossfade(next_sound, self._gain(next_path)):
+                return
+
+            path, sound = next_path, next_sound
+            # Уходящий трек звучал до конца перехода, входящий — с его начала
+            listened = self._clock() - self._track_started
+            self._track_started = fade_began
+            self.events.put(('track', path, listened))
+
+    def _crossfade(self, incoming_sound, incoming_gain):
+        """Переход на входящий трек. False — микс остановлен"""
+        out_index = self._active
+        in_index = 1 - out_index
+        outgoing = self._channels[out_index]
+        incoming = self._channels[in_index]
+        self._gains[in_index] = incoming_gain
+        self._active = in_index
+
+        incoming.set_volume(0)
+        if not self._play(incoming, incoming_sound):
+            return False
+
+        fade_start = self._clock()
+        while not self._stop.is_set():
+            if self._skip.is_set():
+                # Пропуск во время перехода завершает его сейчас, а не
+                # переносится на следующий трек
+                self._skip.clear()
+                break
+            progress = (self._clock() - fade_start) / self.crossfade
+            if progress >= 1:
+                break
+            out_gain, in_gain = self.curve(progress)
+            outgoing.set_volume(self._level(out_index, out_gain))
+            incoming.set_volume(self._level(in_index, in_gain))
+            self._stop.wait(self.step)
+
+        if self._stop.is_set():
+            # Каналы затушит stop()
+            return False
+        outgoing.stop()
+        incoming.set_volume(self._level(in_index))
+        return True
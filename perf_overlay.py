@@ -0,0 +1,144 @@
+import time
+import tkinter as tk
+from tkinter import filedialog, messagebox
+
+from perf_trace import tracer
+
+
+# Период замера задержки цикла событий Tk, мс
+LAG_INTERVAL = 100
+# Виджеты пересчитываются раз в столько замеров задержки
+WIDGET_COUNT_EVERY = 5
+# Сколько строк сводки показывает оверлей
+OVERLAY_ROWS = 12
+
+
+def count_widgets(widget):
+    """Число виджетов в дереве, включая сам widget"""
+    return 1 + sum(count_widgets(child) for child in widget.winfo_children())
+
+
+class PerfOverlay:
+    """Оверлей производительности поверх окна (переключается F12).
+
+    Пока оверлей открыт, включена трассировка: задержка цикла событий Tk
+    замеряется таймером, созданные и удаленные виджеты считаются, а
+    сводка по замерам обновляется на экране. Кнопка «Экспорт» сохраняет
+    трассу в JSON (Chrome Trace) или CSV.
+    """
+
+    def __init__(self, root, font=('Consolas', 9)):
+        self.root = root
+        self.visible = False
+        self.tick_after_id = None
+        self.ticks = 0
+        self.expected = 0.0
+        self.widgets_base = 0
+        self.destroyed_base = 0
+
+        # Удаление ловим для всех виджетов сразу; создание считаем по разнице
+        self.root.bind_all('<Destroy>', self.on_destroy, add='+')
+
+        self.frame = tk.Frame(root, bg='#000000', highlightbackground='#1DB954',
+                              highlightthickness=1)
+        self.text = tk.Label(self.frame, font=font, bg='#000000', fg='#1DB954',
+                             justify=tk.LEFT, anchor='nw')
+        self.text.pack(fill=tk.BOTH, padx=6, pady=4)
+
+        buttons = tk.Frame(self.frame, bg='#000000')
+        buttons.pack(fill=tk.X, padx=6, pady=(0, 4))
+        for text, command in (("Экспорт", self.export), ("Сброс", self.reset)):
+            tk.Button(buttons, text=text, font=font, bg='#282828', fg='white',
+                      relief='flat', cursor='hand2', command=command).pack(side=tk.LEFT, padx=(0, 4))
+
+        # Трассировка включена из окружения — замеры идут и без оверлея
+        self.always_on = tracer.enabled
+        if self.always_on:
+            self.start_monitoring()
+
+    def toggle(self):
+        if self.visible:
+            self.frame.place_forget()
+            self.visible = False
+            if not self.always_on:
+                tracer.enabled = False
+                self.stop_monitoring()
+            return
+
+        tracer.enabled = True
+        self.start_monitoring()
+        self.frame.place(relx=1.0, x=-10, y=10, anchor='ne')
+        self.frame.lift()
+        self.visible = True
+        self.count_widgets()
+        self.render()
+
+    def start_monitoring(self):
+        if self.tick_after_id is not None:
+            return
+        self.widgets_base = count_widgets(self.root)
+        self.destroyed_base = tracer.counters.get('tk.widgets_destroyed', 0)
+        self.ticks = 0
+        self.expected = time.perf_counter() + LAG_INTERVAL / 1000
+        self.tick_after_id = self.root.after(LAG_INTERVAL, self.tick)
+
+    def stop_monitoring(self):
+        if self.tick_after_id is not None:
+            self.root.after_cancel(self.tick_after_id)
+            self.tick_after_id = None
+
+    def on_destroy(self, event):
+        tracer.count('tk.widgets_destroyed')
+
+    def tick(self):
+        """Задержка цикла событий: насколько позже срока сработал таймер"""
+        now = time.perf_counter()
+        tracer.sample('tk.loop_lag', max(0.0, (now - self.expected) * 1000))
+
+        self.ticks += 1
+        if self.ticks % WIDGET_COUNT_EVERY == 0:
+            self.count_widgets()
+            if self.visible:
+                self.render()
+
+        self.expected = time.perf_counter() + LAG_INTERVAL / 1000
+        self.tick_after_id = self.root.after(LAG_INTERVAL, self.tick)
+
+    def count_widgets(self):
+        live = count_widgets(self.root)
+        destroyed = tracer.counters.get('tk.widgets_destroyed', 0) - self.destroyed_base
+        tracer.set_counter('tk.widgets_live', live)
+        tracer.set_counter('tk.widgets_created', live - self.widgets_base + destroyed)
+
+    def render(self):
+        counters = tracer.counters
+        lines = [f"{'замер':<26}{'n':>6}{'сред':>8}{'p95':>8}{'макс':>8}  мс"]
+        for name, count, mean, p95, peak in tracer.summary()[:OVERLAY_ROWS]:
+            lines.append(f"{name[:25]:<26}{count:>6}{mean:>8.2f}{p95:>8.2f}{peak:>8.1f}")
+        lines.append("")
+        lines.append(f"виджеты: {counters.get('tk.widgets_live', 0)} живых, "
+                     f"+{counters.get('tk.widgets_created', 0)} "
+                     f"-{counters.get('tk.widgets_destroyed', 0) - self.destroyed_base}")
+        lines.append(f"событий в трассе: {len(tracer.events)}")
+        self.text.config(text="\n".join(lines))
+
+    def reset(self):
+        tracer.reset()
+        self.stop_monitoring()
+        self.start_monitoring()
+        self.render()
+
+    def export(self):
+        path = filedialog.asksaveasfilename(
+            title="Сохранить трассу",
+            defaultextension=".json",
+            filetypes=[("Chrome Trace", "*.json"), ("CSV", "*.csv")]
+        )
+        if not path:
+            return
+        try:
+            count = tracer.export(path)
+        except OSError as e:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить трассу:\n{e}")
+            return
+        print(f"Трасса сохранена: {path} ({count} событий)")
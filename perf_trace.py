@@ -0,0 +1,224 @@
+import collections
+import csv
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+
+# Сколько последних событий хранится для экспорта
+MAX_EVENTS = 50000
+# По скольким последним замерам считаются перцентили в сводке
+RECENT_SAMPLES = 256
+
+
+class Stat:
+    """Сводка по одному имени: число, сумма, максимум и последние значения"""
+
+    __slots__ = ('count', 'total', 'max', 'recent')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = collections.deque(maxlen=RECENT_SAMPLES)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.recent.append(value)
+
+    def percentile(self, q):
+        values = sorted(self.recent)
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class Tracer:
+    """Замеры горячих путей из любых потоков: интервалы (span), значения
+    (sample) и счетчики.
+
+    Трассировка по умолчанию выключена и почти ничего не стоит; включается
+    из оверлея производительности или переменной окружения MUSIC_TRACE=1.
+    События копятся в кольцевом буфере и выгружаются в JSON (формат Chrome
+    Trace Event — открывается в chrome://tracing, Perfetto, speedscope)
+    или в CSV.
+
+    Времена событий — в микросекундах от создания трассировщика, значения
+    сводок — в миллисекундах.
+    """
+
+    def __init__(self, enabled=False, max_events=MAX_EVENTS):
+        self.enabled = enabled
+        self.events = collections.deque(maxlen=max_events)
+        self.stats = {}
+        self.counters = {}
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def now_us(self):
+        return (time.perf_counter() - self._origin) * 1e6
+
+    @contextmanager
+    def span(self, name, **args):
+        """Замеряет длительность блока with"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._record({
+                'name': name, 'ph': 'X',
+                'ts': (start - self._origin) * 1e6,
+                'dur': (end - start) * 1e6,
+                'tid': threading.get_ident(),
+                'args': args,
+            }, name, (end - start) * 1000)
+
+    def traced(self, name=None):
+        """Декоратор: оборачивает вызов функции в span"""
+        def decorator(func):
+            span_name = name or func.__name__
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def sample(self, name, value):
+        """Значение в миллисекундах (например, задержка цикла событий)"""
+        if not self.enabled:
+            return
+        self._record({
+            'name': name, 'ph': 'C', 'ts': self.now_us(),
+            'tid': threading.get_ident(),
+            'args': {'ms': round(value, 3)},
+        }, name, value)
+
+    def count(self, name, delta=1):
+        """Увеличивает счетчик (ведется и при выключенной трассировке)"""
+        with self._lock:
+            self._set_counter(name, self.counters.get(name, 0) + delta)
+
+    def set_counter(self, name, value):
+        with self._lock:
+            self._set_counter(name, value)
+
+    def _set_counter(self, name, value):
+        self.counters[name] = value
+        if self.enabled:
+            self.events.append({
+                'name': name, 'ph': 'C', 'ts': self.now_us(),
+                'tid': threading.get_ident(), 'args': {'value': value},
+            })
+
+    def _record(self, event, name, value):
+        with self._lock:
+            self.events.append(event)
+            stat = self.stats.get(name)
+            if stat is None:
+                stat = self.stats[name] = Stat()
+            stat.add(value)
+
+    def summary(self):
+        """Список (имя, число, среднее, p95, максимум) по убыванию суммарного времени"""
+        with self._lock:
+            items = [(name, stat.count, stat.total / stat.count,
+                      stat.percentile(0.95), stat.max, stat.total)
+                     for name, stat in self.stats.items() if stat.count]
+        items.sort(key=lambda item: item[5], reverse=True)
+        return [item[:5] for item in items]
+
+    def reset(self):
+        with self._lock:
+            self.events.clear()
+            self.stats.clear()
+
+    # Экспорт
+
+    def export_json(self, path):
+        """Сохраняет события в формате Chrome Trace Event"""
+        with self._lock:
+            events = list(self.events)
+        pid = os.getpid()
+        trace = [dict(event, pid=pid) for event in events]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+        return len(trace)
+
+    def export_csv(self, path):
+        """Сохраняет события таблицей: имя, тип, начало и длительность в мс, аргументы"""
+        with self._lock:
+            events = list(self.events)
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['name', 'type', 'start_ms', 'duration_ms', 'thread', 'args'])
+            for event in events:
+                writer.writerow([
+                    event['name'],
+                    'span' if event['ph'] == 'X' else 'counter',
+                    f"{event['ts'] / 1000:.3f}",
+                    f"{event['dur'] / 1000:.3f}" if 'dur' in event else '',
+                    event['tid'],
+                    json.dumps(event['args'], ensure_ascii=False),
+                ])
+        return len(events)
+
+    def export(self, path):
+        """Выбирает формат по расширению файла (.csv или JSON)"""
+        if path.lower().endswith('.csv'):
+            return self.export_csv(path)
+        return self.export_json(path)
+
+
+class StartupProfile:
+    """Этапы запуска приложения: сколько миллисекунд занял каждый.
+
+    Отсчет идет от создания профиля (импорт этого модуля), mark(name)
+    закрывает этап, начатый предыдущей отметкой. Этапы попадают и в
+    трассировку как значения startup.<этап>.
+    """
+
+    def __init__(self, tracer):
+        self.tracer = tracer
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.steps = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        ms = (now - self.last) * 1000
+        self.last = now
+        self.steps.append((name, ms))
+        self.tracer.sample(f'startup.{name}', ms)
+        return ms
+
+    @property
+    def total_ms(self):
+        return (self.last - self.started) * 1000
+
+    def report(self):
+        """Таблица этапов с долей от общего времени"""
+        total = self.total_ms or 1.0
+        lines = [f"Запуск: {self.total_ms:.0f} мс"]
+        for name, ms in self.steps:
+            lines.append(f"  {name:<24}{ms:>8.1f} мс {ms / total:>5.0%}")
+        return "\n".join(lines)
+
+
+# Общий трассировщик процесса
+tracer = Tracer(enabled=os.environ.get('MUSIC_TRACE') == '1')
+# Профиль запуска окна
+startup = StartupProfile(tracer)
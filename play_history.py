@@ -0,0 +1,297 @@
+import datetime
+import queue
+import sqlite3
+import threading
+import time
+
+
+# Сколько секунд копятся прослушивания перед записью одной транзакцией
+FLUSH_INTERVAL = 2.0
+# Больше событий за одну транзакцию не пишем
+MAX_BATCH = 500
+
+# Трек пропущен, если его переключили раньше, чем сыграна эта доля
+SKIP_FRACTION = 0.5
+
+# Маркер в очереди записи: записать накопленное сразу
+_FLUSH = object()
+
+
+def day_number(timestamp):
+    """Номер местного календарного дня (порядковый номер даты)"""
+    return datetime.date.fromtimestamp(timestamp).toordinal()
+
+
+class PlayHistory:
+    """История прослушиваний в SQLite (music_player_data/history.db).
+
+    Каждое прослушивание — строка plays: трек, время начала, сколько
+    секунд сыграно и флаг пропуска. Рядом ведутся сводки, которые
+    обновляются при записи: track_totals (всего по треку) и daily (по дням
+    и трекам). Поэтому топ треков, прослушивания по дням и доля пропусков
+    читаются из сводок по индексам и не зависят от числа событий.
+
+    record() только ставит событие в очередь: запись идет пачками в
+    отдельном потоке со своим соединением (WAL), запросы из потока UI не
+    ждут ее. Пути хранятся один раз в таблице tracks, события ссылаются
+    на id трека.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            " id INTEGER PRIMARY KEY,"
+            " path TEXT NOT NULL UNIQUE);"
+            "CREATE TABLE IF NOT EXISTS plays ("
+            " id INTEGER PRIMARY KEY,"
+            " track_id INTEGER NOT NULL,"
+            " started REAL NOT NULL,"
+            " listened REAL NOT NULL,"
+            " length REAL NOT NULL,"
+            " skipped INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS plays_started ON plays (started);"
+            "CREATE INDEX IF NOT EXISTS plays_track ON plays (track_id, started);"
+            "CREATE TABLE IF NOT EXISTS track_totals ("
+            " track_id INTEGER PRIMARY KEY,"
+            " plays INTEGER NOT NULL,"
+            " skips INTEGER NOT NULL,"
+            " listened REAL NOT NULL,"
+            " last_played REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS track_totals_plays ON track_totals (plays);"
+            "CREATE TABLE IF NOT EXISTS daily ("
+            " day INTEGER NOT NULL,"
+            " track_id INTEGER NOT NULL,"
+            " plays INTEGER NOT NULL,"
+            " skips INTEGER NOT NULL,"
+            " listened REAL NOT NULL,"
+            " PRIMARY KEY (day, track_id)) WITHOUT ROWID;"
+        )
+        self._conn.commit()
+
+        # Итоги за всё время держим в памяти: счетчики на странице
+        # библиотеки не обращаются к базе
+        plays, skips = self._conn.execute(
+            "SELECT COALESCE(SUM(plays), 0), COALESCE(SUM(skips), 0) FROM track_totals").fetchone()
+        self.total_plays = plays
+        self.total_skips = skips
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="play-history", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # Запись
+
+    def record(self, path, started, listened, length, completed=False, segment=False):
+        """Прослушивание трека: начало (unix-время), сколько сыграно, длительность.
+
+        Трек, доигранный до конца (completed), и фрагмент микса (segment),
+        который звучал отмеренное время, не считаются пропущенными.
+        """
+        skipped = not (completed or segment) and listened < length * SKIP_FRACTION
+        with self._lock:
+            self.total_plays += 1
+            self.total_skips += skipped
+        self._queue.put(('play', path, started, listened, length, int(skipped)))
+
+    def rename(self, old_path, new_path):
+        """Файл переименован: история остается за треком"""
+        self._queue.put(('rename', old_path, new_path))
+
+    def flush(self):
+        """Дожидается записи всех поставленных событий"""
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        with self._lock:
+            self._conn.close()
+
+    def _run(self):
+        conn = self._connect()
+        track_ids = {}
+        running = True
+        while running:
+            item = self._queue.get()
+            batch = [item]
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            # Копим пачку, пока не истек интервал или не попросили записать
+            while item is not None and item is not _FLUSH and len(batch) < MAX_BATCH:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            try:
+                self._write(conn, track_ids, batch)
+            except sqlite3.Error as e:
+                print(f"Не удалось записать историю прослушиваний: {e}")
+                # Пачка потеряна целиком: откатываем и ее, и счетчики record()
+                conn.rollback()
+                track_ids.clear()
+                self._forget(batch)
+            finally:
+                for item in batch:
+                    if item is None:
+                        running = False
+                    self._queue.task_done()
+        conn.close()
+
+    def _write(self, conn, track_ids, batch):
+        """Пишет пачку событий и обновляет сводки одной транзакцией"""
+        plays = []
+        for item in batch:
+            if item is None or item is _FLUSH:
+                continue
+            if item[0] == 'rename':
+                _, old_path, new_path = item
+                self._rename(conn, old_path, new_path)
+                track_ids.pop(old_path, None)
+                track_ids.pop(new_path, None)
+                continue
+            _, path, started, listened, length, skipped = item
+            plays.append((self._track_id(conn, track_ids, path), started, listened, length, skipped))
+
+        if plays:
+            conn.executemany(
+                "INSERT INTO plays (track_id, started, listened, length, skipped) "
+                "VALUES (?, ?, ?, ?, ?)", plays)
+            conn.executemany(
+                "INSERT INTO track_totals (track_id, plays, skips, listened, last_played) "
+                "VALUES (?, 1, ?, ?, ?) "
+                "ON CONFLICT (track_id) DO UPDATE SET"
+                " plays = plays + 1,"
+                " skips = skips + excluded.skips,"
+                " listened = listened + excluded.listened,"
+                " last_played = MAX(last_played, excluded.last_played)",
+                [(track_id, skipped, listened, started)
+                 for track_id, started, listened, _, skipped in plays])
+            conn.executemany(
+                "INSERT INTO daily (day, track_id, plays, skips, listened) "
+                "VALUES (?, ?, 1, ?, ?) "
+                "ON CONFLICT (day, track_id) DO UPDATE SET"
+                " plays = plays + 1,"
+                " skips = skips + excluded.skips,"
+                " listened = listened + excluded.listened",
+                [(day_number(started), track_id, skipped, listened)
+                 for track_id, started, listened, _, skipped in plays])
+        conn.commit()
+
+    def _rename(self, conn, old_path, new_path):
+        """Переносит историю трека на новый путь; если у пути уже есть история — сливает"""
+        row = conn.execute("SELECT id FROM tracks WHERE path = ?", (old_path,)).fetchone()
+        if row is None:
+            return
+        old_id = row[0]
+        row = conn.execute("SELECT id FROM tracks WHERE path = ?", (new_path,)).fetchone()
+        if row is None:
+            conn.execute("UPDATE tracks SET path = ? WHERE id = ?", (new_path, old_id))
+            return
+
+        new_id = row[0]
+        conn.execute("UPDATE plays SET track_id = ? WHERE track_id = ?", (new_id, old_id))
+        conn.execute(
+            "INSERT INTO track_totals (track_id, plays, skips, listened, last_played) "
+            "SELECT ?, plays, skips, listened, last_played FROM track_totals WHERE track_id = ? "
+            "ON CONFLICT (track_id) DO UPDATE SET"
+            " plays = plays + excluded.plays,"
+            " skips = skips + excluded.skips,"
+            " listened = listened + excluded.listened,"
+            " last_played = MAX(last_played, excluded.last_played)", (new_id, old_id))
+        conn.execute(
+            "INSERT INTO daily (day, track_id, plays, skips, listened) "
+            "SELECT day, ?, plays, skips, listened FROM daily WHERE track_id = ? "
+            "ON CONFLICT (day, track_id) DO UPDATE SET"
+            " plays = plays + excluded.plays,"
+            " skips = skips + excluded.skips,"
+            " listened = listened + excluded.listened", (new_id, old_id))
+        conn.execute("DELETE FROM track_totals WHERE track_id = ?", (old_id,))
+        conn.execute("DELETE FROM daily WHERE track_id = ?", (old_id,))
+        conn.execute("DELETE FROM tracks WHERE id = ?", (old_id,))
+
+    def _forget(self, batch):
+        """Вычитает из итогов в памяти прослушивания, которые не попали в базу"""
+        plays = [item for item in batch
+                 if item is not None and item is not _FLUSH and item[0] == 'play']
+        with self._lock:
+            self.total_plays -= len(plays)
+            self.total_skips -= sum(item[5] for item in plays)
+
+    def _track_id(self, conn, track_ids, path):
+        track_id = track_ids.get(path)
+        if track_id is None:
+            conn.execute("INSERT OR IGNORE INTO tracks (path) VALUES (?)", (path,))
+            track_id = conn.execute("SELECT id FROM tracks WHERE path = ?", (path,)).fetchone()[0]
+            track_ids[path] = track_id
+        return track_id
+
+    # Запросы
+
+    def skip_rate(self, days=None):
+        """Доля пропущенных прослушиваний (за последние days дней или за всё время)"""
+        if days is None:
+            plays, skips = self.total_plays, self.total_skips
+        else:
+            with self._lock:
+                plays, skips = self._conn.execute(
+                    "SELECT COALESCE(SUM(plays), 0), COALESCE(SUM(skips), 0) "
+                    "FROM daily WHERE day > ?", (day_number(time.time()) - days,)).fetchone()
+        return skips / plays if plays else 0.0
+
+    def top_tracks(self, limit=10, days=None):
+        """Самые слушаемые треки: список (путь, прослушивания, пропуски, секунды)"""
+        with self._lock:
+            if days is None:
+                rows = self._conn.execute(
+                    "SELECT path, plays, skips, listened FROM track_totals"
+                    " JOIN tracks ON tracks.id = track_totals.track_id"
+                    " ORDER BY plays DESC LIMIT ?", (limit,)).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT path, SUM(plays) AS total, SUM(skips), SUM(listened) FROM daily"
+                    " JOIN tracks ON tracks.id = daily.track_id"
+                    " WHERE day > ? GROUP BY daily.track_id ORDER BY total DESC LIMIT ?",
+                    (day_number(time.time()) - days, limit)).fetchall()
+        return rows
+
+    def plays_per_day(self, days=30):
+        """Прослушивания по дням: список (дата, прослушивания, пропуски, секунды)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT day, SUM(plays), SUM(skips), SUM(listened) FROM daily"
+                " WHERE day > ? GROUP BY day ORDER BY day",
+                (day_number(time.time()) - days,)).fetchall()
+        return [(datetime.date.fromordinal(day), plays, skips, listened)
+                for day, plays, skips, listened in rows]
+
+    def recent(self, limit=10):
+        """Последние прослушивания: список (путь, начало, секунды, пропущен)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, started, listened, skipped FROM plays"
+                " JOIN tracks ON tracks.id = plays.track_id"
+                " ORDER BY started DESC LIMIT ?", (limit,)).fetchall()
+        return [(path, started, listened, bool(skipped)) for path, started, listened, skipped in rows]
+
+    def track_stats(self, path):
+        """Итоги по треку: (прослушивания, пропуски, секунды, последнее) или None"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT plays, skips, listened, last_played FROM track_totals"
+                " JOIN tracks ON tracks.id = track_totals.track_id"
+                " WHERE path = ?", (path,)).fetchone()
@@ -0,0 +1,45 @@
+import time
+
+
+class PlaybackClock:
+    """Позиция воспроизведения по монотонным часам.
+
+    В отличие от pygame.mixer.music.get_pos() учитывает перемотку, паузы
+    и переход на трек из очереди.
+    """
+
+    def __init__(self):
+        self._offset = 0.0
+        self._started = None
+
+    @property
+    def running(self):
+        return self._started is not None
+
+    def start(self, position=0.0):
+        """Запускает отсчет с позиции position (в секундах)"""
+        self._offset = position
+        self._started = time.monotonic()
+
+    def pause(self):
+        if self._started is not None:
+            self._offset = self.position()
+            self._started = None
+
+    def resume(self):
+        if self._started is None:
+            self._started = time.monotonic()
+
+    def seek(self, position):
+        self._offset = position
+        if self._started is not None:
+            self._started = time.monotonic()
+
+    def stop(self):
+        self._offset = 0.0
+        self._started = None
+
+    def position(self):
+        if self._started is None:
+            return self._offset
+        return self._offset + time.monotonic() - self._started
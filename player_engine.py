@@ -0,0 +1,648 @@
+import queue
+import threading
+import time
+
+from audio_decode import init_mixer
+from playback_clock import PlaybackClock
+from perf_trace import tracer
+from shuffle import ShuffleOrder
+
+
+# pygame и звуковое устройство открываются при первом воспроизведении
+# (PlayerEngine.open_audio), чтобы не задерживать запуск окна
+pygame = None
+# Событие pygame об окончании трека (в том числе о старте трека из очереди)
+TRACK_END_EVENT = None
+
+# Размер блока при упреждающем чтении следующего трека
+PREFETCH_CHUNK = 1024 * 1024
+
+# Длительность по умолчанию, если метаданные прочитать не удалось
+DEFAULT_SONG_LENGTH = 300
+
+# Взвешенное перемешивание: режимы и сколько треков «недавно» играл трек
+SHUFFLE_WEIGHTINGS = (None, 'plays', 'recent')
+RECENT_WINDOW = 50
+
+
+def prefetch_file(path):
+    """Читает файл целиком, чтобы к началу воспроизведения он был в кэше ОС"""
+    try:
+        with open(path, 'rb') as f:
+            while f.read(PREFETCH_CHUNK):
+                pass
+    except OSError:
+        pass
+
+
+class PlayerEngine:
+    """Воспроизведение без UI: очередь, play/pause/next/prev/seek, микс.
+
+    Состояние меняется только в потоке владельца: он вызывает методы
+    управления и периодически poll(), который обрабатывает окончание трека
+    и события движка микса. Подписчики получают callback(event, data),
+    где data — словарь:
+
+        'track'    — path, index, playlist, length
+        'state'    — playing, paused
+        'seek'     — position
+        'volume'   — volume
+        'modes'    — shuffle, weighting, repeat, mix
+        'playlist' — name
+        'error'    — message, path
+
+    Для работы без дисплея достаточно SDL_VIDEODRIVER=dummy (события
+    pygame нужны для сигнала об окончании трека). Звуковое устройство
+    открывается при первом воспроизведении.
+    """
+
+    def __init__(self, library, volume=0.7):
+        self.library = library
+        self.listeners = []
+        self.audio_open = False
+
+        # Очередь воспроизведения — текущий плейлист
+        self.current_playlist = "main"
+        self.playlist = library.tracks(self.current_playlist)
+        self.current_song_index = 0
+        self.current_path = None
+        self.paused = False
+        self.playing = False
+        self.volume = volume
+        self.song_length = 0
+        self.shuffle_mode = False
+        self.repeat_mode = False
+
+        # Порядок перемешивания текущего плейлиста (пока включен shuffle)
+        self.shuffle = None
+        self.shuffle_weighting = None
+
+        # Нормализация громкости: множитель текущего трека
+        self.track_gain = 1.0
+
+        # Следующий трек, заранее поставленный в очередь (без паузы между треками)
+        self.queued_index = None
+        self.queued_path = None
+        self.pygame_queued = None
+        self.prefetched = None
+        self.lookahead_token = 0
+
+        # Позиция в треке (get_pos() не учитывает перемотку и очередь)
+        self.clock = PlaybackClock()
+
+        # Микширование
+        self.mix_mode = False
+        self.mix_engine = None
+        self.mix_crossfade = 4.0  # длительность кроссфейда в секундах
+        self.mix_curve = 'equal_power'  # linear, equal_power или s_curve
+
+        # Текущее прослушивание для истории: (путь, unix-время начала)
+        self.play_started = None
+        # Счетчики за сессию для взвешенного перемешивания
+        self.play_counts = {}
+        self.last_played = {}
+        self.plays_total = 0
+
+        library.listeners.append(self._on_playlists_changed)
+
+    def open_audio(self):
+        """Импортирует pygame и открывает звуковое устройство (один раз).
+
+        Вызывается перед первым воспроизведением: импорт и инициализация
+        mixer занимают сотни миллисекунд, окну они при запуске не нужны.
+        """
+        if self.audio_open:
+            return
+        global pygame, TRACK_END_EVENT
+        pygame = init_mixer()
+        TRACK_END_EVENT = pygame.USEREVENT + 1
+
+        # Очередь событий pygame нужна для сигнала об окончании трека
+        pygame.display.init()
+        pygame.mixer.music.set_endevent(TRACK_END_EVENT)
+        pygame.mixer.music.set_volume(self.track_volume(self.volume))
+        self.audio_open = True
+
+    def _emit(self, event, **data):
+        for callback in self.listeners:
+            callback(event, data)
+
+    def _emit_state(self):
+        self._emit('state', playing=self.playing, paused=self.paused)
+
+    def _emit_modes(self):
+        self._emit('modes', shuffle=self.shuffle_mode, weighting=self.shuffle_weighting,
+                   repeat=self.repeat_mode, mix=self.mix_mode)
+
+    # Плейлисты
+
+    def select_playlist(self, name):
+        """Делает плейлист текущей очередью (воспроизведение не прерывается)"""
+        if name not in self.library.playlists:
+            return False
+        self.current_playlist = name
+        self.playlist = self.library.playlists[name]
+        # Индекс прошлого плейлиста к новому не относится
+        self.current_song_index = 0
+        self._sync_index()
+        self.reset_shuffle()
+        self.prepare_next_track()
+        self._emit('playlist', name=name)
+        return True
+
+    def _sync_index(self):
+        """Индекс играющего трека, если он в плейлисте; иначе — в пределах плейлиста"""
+        if self.current_path is not None and self.current_path in self.playlist:
+            self.current_song_index = self.playlist.index(self.current_path)
+        elif self.current_song_index >= len(self.playlist):
+            self.current_song_index = 0
+
+    def play_playlist(self, name):
+        """Начинает воспроизведение плейлиста с первого трека"""
+        if not self.select_playlist(name) or not self.playlist:
+            return False
+        self.play_index(0)
+        return True
+
+    def play_path(self, path):
+        """Воспроизводит трек из плейлиста, где он есть (сначала текущий)"""
+        name = self.library.find_playlist(path, prefer=self.current_playlist)
+        if name is None:
+            return False
+        if name != self.current_playlist:
+            self.select_playlist(name)
+        self.play_index(self.playlist.index(path))
+        return True
+
+    def remove_track(self, path):
+        """Удаляет трек из текущего плейлиста"""
+        if path not in self.playlist:
+            return
+        # Если этот трек сейчас играет, останавливаем
+        current = (self.playlist[self.current_song_index]
+                   if self.current_song_index < len(self.playlist) else None)
+        if self.playing and current == path:
+            self.stop()
+
+        self.library.remove_track(self.current_playlist, path)
+
+        # Треки после удаленного сдвинулись: индекс берем заново по пути
+        if current is not None and current != path:
+            self.current_song_index = self.playlist.index(current)
+        elif self.current_song_index >= len(self.playlist):
+            self.current_song_index = 0
+
+        # Заранее выбранный следующий трек мог сместиться
+        if self.playing or self.paused:
+            self.prepare_next_track()
+
+    def clear_playlist(self):
+        """Очищает текущий плейлист и останавливает воспроизведение"""
+        self.set_mix(False)
+        self.stop()
+        self.library.clear_playlist(self.current_playlist)
+        self.current_song_index = 0
+        self.prepare_next_track()
+
+    def _on_playlists_changed(self, kind, name, added, removed):
+        if kind == 'rename':
+            # Путь сменился во всех плейлистах сразу (трек остался на месте)
+            old_path, new_path = removed[0], added[0]
+            if self.current_path == old_path:
+                self.current_path = new_path
+            if self.shuffle is not None and old_path in self.shuffle:
+                self.shuffle.discard(old_path)
+                self.shuffle.add(new_path)
+            return
+        if name != self.current_playlist:
+            return
+        # Удалили текущий плейлист — переключаемся на main
+        if kind == 'delete':
+            self.select_playlist("main")
+        elif kind == 'create':
+            # Плейлист пересоздан новым списком
+            self.select_playlist(name)
+        else:
+            # Играющий трек мог сместиться (удаления из наблюдателя, замены)
+            self._sync_index()
+            if self.shuffle is not None:
+                for path in added:
+                    self.shuffle.add(path)
+                for path in removed:
+                    self.shuffle.discard(path)
+            # Заранее выбранный следующий трек мог сместиться или пропасть
+            queued = self.queued_index
+            if queued is not None and (queued >= len(self.playlist)
+                                       or self.playlist[queued] != self.queued_path):
+                self.prepare_next_track()
+
+    # Воспроизведение
+
+    def play_index(self, index):
+        """Воспроизводит трек текущего плейлиста по индексу"""
+        self.set_mix(False)
+        self.current_song_index = index
+        self.play_song()
+
+    @tracer.traced()
+    def play_song(self):
+        if not self.playlist:
+            return
+
+        song_path = self.playlist[self.current_song_index]
+
+        # Прошлый трек прерван — позиция в нем еще известна
+        self._finish_play()
+
+        try:
+            self.open_audio()
+            pygame.mixer.music.load(song_path)
+            pygame.mixer.music.play()
+            # Остановка предыдущего трека тоже присылает TRACK_END_EVENT
+            pygame.event.clear(TRACK_END_EVENT)
+            self.pygame_queued = None
+            self.clock.start()
+            self.playing = True
+            self.paused = False
+        except Exception as e:
+            print(f"Ошибка воспроизведения: {e}")
+            self._emit('error', message="Ошибка воспроизведения файла", path=song_path)
+            return
+
+        self._emit_state()
+        self.start_track(song_path)
+
+        # Готовим следующий трек заранее
+        self.prepare_next_track()
+
+    def start_track(self, song_path):
+        """Обновляет состояние под заигравший трек и сообщает подписчикам"""
+        self.current_path = song_path
+
+        # Громкость трека, измеренная заранее (без декодирования здесь)
+        self.track_gain = self.library.gain_for(song_path)
+        pygame.mixer.music.set_volume(self.track_volume(self.volume))
+
+        # Длительность из кэша метаданных
+        info = self.library.track_info(song_path)
+        if info is not None and info['ok'] and info['duration'] > 0:
+            self.song_length = info['duration']
+        else:
+            self.song_length = DEFAULT_SONG_LENGTH
+
+        # Прослушивание попадет в историю, когда трек сменится или остановится
+        self.play_started = (song_path, time.time())
+        self.plays_total += 1
+        self.play_counts[song_path] = self.play_counts.get(song_path, 0) + 1
+        self.last_played[song_path] = self.plays_total
+        if self.shuffle is not None:
+            self.shuffle.jump(song_path)
+
+        self._emit('track', path=song_path, index=self.current_song_index,
+                   playlist=self.current_playlist, length=self.song_length)
+
+    def _finish_play(self, completed=False, segment_played=None):
+        """Записывает в историю прослушивание текущего трека.
+
+        completed — трек доигран до конца; иначе сыгранное время берется
+        по позиции и короткое прослушивание считается пропуском.
+        segment_played — сколько звучал фрагмент микса: это не пропуск
+        и не доигранный трек.
+        """
+        if self.play_started is None:
+            return
+        path, started = self.play_started
+        self.play_started = None
+        if segment_played is not None:
+            listened = min(segment_played, self.song_length)
+            self.library.record_play(path, started, listened, self.song_length, segment=True)
+            return
+        if completed:
+            listened = self.song_length
+        else:
+            listened = min(self.position(), self.song_length)
+        self.library.record_play(path, started, listened, self.song_length, completed)
+
+    def stop(self):
+        """Останавливает воспроизведение (не микс)"""
+        if self.playing or self.paused:
+            self._finish_play()
+            pygame.mixer.music.stop()
+            self.clock.stop()
+            self.playing = False
+            self.paused = False
+            self.current_path = None
+            self.prepare_next_track()
+            self._emit_state()
+
+    def play_pause(self):
+        if not self.playlist:
+            self._emit('error', message="Плейлист пуст. Добавьте музыку.", path=None)
+            return
+
+        if not self.playing:
+            if self.paused:
+                if self.mix_engine is not None:
+                    self.mix_engine.resume()
+                else:
+                    pygame.mixer.music.unpause()
+                    self.clock.resume()
+                self.paused = False
+                self.playing = True
+                self._emit_state()
+            else:
+                self.play_song()
+        else:
+            if self.mix_engine is not None:
+                self.mix_engine.pause()
+            else:
+                pygame.mixer.music.pause()
+                self.clock.pause()
+            self.playing = False
+            self.paused = True
+            self._emit_state()
+
+    def next_song(self):
+        if not self.playlist:
+            return
+
+        # В миксе — сразу переход к следующему треку с кроссфейдом
+        if self.mix_engine is not None:
+            self._finish_play()
+            self.mix_engine.skip()
+            return
+
+        if self.shuffle is not None:
+            self.current_song_index = self.playlist.index(self.shuffle.next())
+        else:
+            self.current_song_index = (self.current_song_index + 1) % len(self.playlist)
+
+        self.play_song()
+
+    def prev_song(self):
+        if not self.playlist:
+            return
+
+        if self.mix_engine is not None:
+            self._finish_play()
+            self.mix_engine.skip()
+            return
+
+        if self.shuffle is not None:
+            # Назад по истории перемешивания; в начале истории — тот же трек
+            path = self.shuffle.prev()
+            if path is not None:
+                self.current_song_index = self.playlist.index(path)
+        else:
+            self.current_song_index = (self.current_song_index - 1) % len(self.playlist)
+        self.play_song()
+
+    def seek(self, position):
+        """Перематывает текущий трек на position секунд. False — если перемотка недоступна"""
+        if self.mix_engine is not None or not (self.playing or self.paused):
+            return False
+        position = min(max(position, 0.0), self.song_length)
+        try:
+            pygame.mixer.music.set_pos(position)
+        except pygame.error as e:
+            # Например, WAV не поддерживает перемотку
+            print(f"Перемотка недоступна: {e}")
+            return False
+        self.clock.seek(position)
+        self._emit('seek', position=position)
+        return True
+
+    def position(self):
+        """Текущая позиция в треке в секундах"""
+        if self.mix_engine is not None:
+            return self.mix_engine.track_position()
+        return self.clock.position()
+
+    def track_volume(self, volume):
+        """Громкость для pygame с учетом нормализации текущего трека"""
+        return min(volume * self.track_gain, 1.0)
+
+    def set_volume(self, volume):
+        """Громкость 0..1"""
+        self.volume = min(max(volume, 0.0), 1.0)
+        if self.audio_open:
+            pygame.mixer.music.set_volume(self.track_volume(self.volume))
+        if self.mix_engine is not None:
+            self.mix_engine.set_volume(self.volume)
+        self._emit('volume', volume=self.volume)
+
+    # Режимы
+
+    def set_shuffle(self, enabled):
+        self.shuffle_mode = enabled
+        self.reset_shuffle()
+        # Следующий трек зависит от режима
+        if self.playing or self.paused:
+            self.prepare_next_track()
+        self._emit_modes()
+
+    def set_shuffle_weighting(self, weighting):
+        """Веса перемешивания: None, 'plays' (реже часто игравшие) или 'recent' (реже недавние)"""
+        if weighting not in SHUFFLE_WEIGHTINGS:
+            raise ValueError(f"Неизвестный режим весов: {weighting}")
+        self.shuffle_weighting = weighting
+        if self.shuffle is not None:
+            self.shuffle.weight = self._shuffle_weight if weighting else None
+            # Выбор следующего трека уже сделан без новых весов
+            if self.playing or self.paused:
+                self.prepare_next_track()
+        self._emit_modes()
+
+    def reset_shuffle(self):
+        """Новый порядок перемешивания для текущего плейлиста; играющий трек — первый в истории"""
+        if not self.shuffle_mode:
+            self.shuffle = None
+            return
+        self.shuffle = ShuffleOrder(self.playlist, current=self.current_path,
+                                    weight=self._shuffle_weight if self.shuffle_weighting else None)
+
+    def _shuffle_weight(self, path):
+        if self.shuffle_weighting == 'plays':
+            return 1.0 / (1 + self.play_counts.get(path, 0))
+        last = self.last_played.get(path)
+        if last is None:
+            return 1.0
+        return min((self.plays_total - last) / RECENT_WINDOW, 1.0)
+
+    def set_repeat(self, enabled):
+        self.repeat_mode = enabled
+        if self.playing or self.paused:
+            self.prepare_next_track()
+        self._emit_modes()
+
+    def set_mix(self, enabled):
+        """Включает или выключает режим микширования"""
+        if enabled == self.mix_mode:
+            return
+        self.mix_mode = enabled
+        if enabled:
+            self.start_mix_mode()
+        else:
+            self.stop_mix_mode()
+        self._emit_modes()
+
+    def start_mix_mode(self):
+        """Запускает режим микширования"""
+        if self.mix_mode and self.playlist:
+            # Останавливаем текущее воспроизведение
+            if self.playing or self.paused:
+                self._finish_play()
+                pygame.mixer.music.stop()
+                self.clock.stop()
+
+            # Сбрасываем заранее выбранный следующий трек
+            self.prepare_next_track()
+
+            # Запускаем микс в отдельном аудиопотоке
+            from mix_engine import MixEngine
+            self.open_audio()
+            self.mix_engine = MixEngine(self.playlist,
+                                        crossfade=self.mix_crossfade,
+                                        curve=self.mix_curve,
+                                        volume=self.volume,
+                                        gain_for=self.library.gain_for)
+            self.mix_engine.start()
+            self.playing = True
+            self.paused = False
+            self._emit_state()
+
+    def stop_mix_mode(self):
+        """Останавливает режим микширования"""
+        if self.mix_engine is not None:
+            self._finish_play()
+            self.mix_engine.stop()
+            self.mix_engine = None
+            self.playing = False
+            self.paused = False
+            self.current_path = None
+            self._emit_state()
+
+    def poll_mix_events(self):
+        """Забирает события движка микса"""
+        while self.mix_engine is not None:
+            try:
+                event = self.mix_engine.events.get_nowait()
+            except queue.Empty:
+                break
+
+            if event[0] == 'track':
+                # Фрагмент прошлого трека отыграл (пропуск уже записан в next_song)
+                if event[2] is not None:
+                    self._finish_play(segment_played=event[2])
+                path = event[1]
+                if path in self.playlist:
+                    self.current_song_index = self.playlist.index(path)
+                self.start_track(path)
+            elif event[0] == 'error':
+                print(f"Ошибка воспроизведения в миксе: {event[2]}")
+                self._emit('error', message="Ошибка воспроизведения в миксе", path=event[1])
+
+    # Следующий трек
+
+    def choose_next_index(self):
+        """Индекс трека, который заиграет после текущего"""
+        if self.repeat_mode:
+            return self.current_song_index
+        if self.shuffle is not None:
+            # Выбор фиксируется: next_song() и очередь получат тот же трек
+            return self.playlist.index(self.shuffle.peek())
+        return (self.current_song_index + 1) % len(self.playlist)
+
+    def prepare_next_track(self):
+        """Выбирает следующий трек и заранее читает его в фоне.
+
+        Когда файл прочитан, poll() ставит его в очередь pygame, и после
+        окончания текущего трека он начинается без паузы.
+        """
+        self.lookahead_token += 1
+        self.queued_index = None
+        self.queued_path = None
+        self.prefetched = None
+        if not self.playlist or self.mix_mode or not (self.playing or self.paused):
+            return
+
+        self.queued_index = self.choose_next_index()
+        self.queued_path = self.playlist[self.queued_index]
+
+        # Метаданные понадобятся в момент перехода
+        self.library.track_info(self.queued_path)
+
+        token = self.lookahead_token
+        path = self.queued_path
+
+        def prefetch():
+            prefetch_file(path)
+            self.prefetched = (token, path)
+
+        threading.Thread(target=prefetch, name="track-prefetch", daemon=True).start()
+
+    def queue_prefetched_track(self):
+        """Ставит прочитанный заранее трек в очередь pygame"""
+        prefetched = self.prefetched
+        if prefetched is None:
+            return
+        self.prefetched = None
+        token, path = prefetched
+        if token != self.lookahead_token or not self.playing:
+            return
+        try:
+            pygame.mixer.music.queue(path)
+            self.pygame_queued = path
+        except Exception as e:
+            print(f"Не удалось поставить трек в очередь: {e}")
+
+    def on_track_end(self):
+        """Обработка окончания трека (событие pygame)"""
+        if not self.playing:
+            return
+
+        # Трек доигран до конца
+        self._finish_play(completed=True)
+
+        queued_path = self.pygame_queued
+        self.pygame_queued = None
+
+        if queued_path is not None and pygame.mixer.music.get_busy():
+            # pygame уже играет трек из очереди — только обновляем состояние.
+            # То, насколько часы ушли за длительность прошлого трека, уже
+            # сыграно из нового
+            overshoot = min(max(self.clock.position() - self.song_length, 0.0), 1.0)
+            self.clock.start(overshoot)
+            if queued_path in self.playlist:
+                if self.queued_path == queued_path:
+                    self.current_song_index = self.queued_index
+                else:
+                    self.current_song_index = self.playlist.index(queued_path)
+            self.start_track(queued_path)
+            self.prepare_next_track()
+        elif self.repeat_mode:
+            self.play_song()
+        else:
+            self.next_song()
+
+    def poll(self):
+        """Обрабатывает окончание трека, очередь и события микса.
+
+        Вызывается владельцем периодически (в Tk — из тикера позиции).
+        """
+        if not self.audio_open:
+            return
+
+        # Окончание трека приходит событием от pygame
+        for event in pygame.event.get(TRACK_END_EVENT):
+            self.on_track_end()
+
+        self.queue_prefetched_track()
+        self.poll_mix_events()
+
+    def close(self):
+        self.stop_mix_mode()
+        self._finish_play()
+        if self.audio_open:
+            pygame.mixer.music.stop()
+            pygame.mixer.quit()
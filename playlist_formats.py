@@ -0,0 +1,303 @@
+import collections
+import os
+import threading
+from urllib.parse import quote, unquote, urlsplit
+from urllib.request import pathname2url, url2pathname
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+
+PLAYLIST_EXTENSIONS = ('.m3u', '.m3u8', '.pls', '.xspf')
+
+# Кодировка старых M3U/PLS, если строка не в UTF-8
+LEGACY_ENCODING = 'cp1251'
+
+XSPF_NS = '{http://xspf.org/ns/0/}'
+
+# Сколько треков импортер отдает за раз и сколько папок помнит при проверке
+IMPORT_BATCH = 1000
+DIR_CACHE_SIZE = 256
+
+
+def is_playlist_file(name):
+    return name.lower().endswith(PLAYLIST_EXTENSIONS)
+
+
+def _decode_line(raw):
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode(LEGACY_ENCODING, errors='replace')
+
+
+def _text_lines(path):
+    """Строки файла без перевода строки; файл читается потоково"""
+    with open(path, 'rb') as f:
+        first = True
+        for raw in f:
+            if first:
+                raw = raw.removeprefix(b'\xef\xbb\xbf')
+                first = False
+            line = _decode_line(raw).strip()
+            if line:
+                yield line
+
+
+def resolve_location(location, base_dir, uri=False):
+    """Путь к файлу из строки плейлиста: путь, относительный путь или file:// URI.
+
+    uri — относительные пути закодированы как в URI (XSPF). Потоки (http
+    и т.п.) не поддерживаются — для них возвращается None.
+    """
+    parts = urlsplit(location)
+    if parts.scheme == 'file':
+        # url2pathname сам раскодирует %XX — второй unquote испортил бы «%25»
+        path = url2pathname(parts.path)
+    elif len(parts.scheme) > 1:
+        return None
+    else:
+        # Обычный путь (буква диска Windows дает схему из одной буквы)
+        path = unquote(location) if uri else location
+        if os.sep == '/' and '\\' in path:
+            path = path.replace('\\', '/')
+    if not os.path.isabs(path):
+        path = os.path.join(base_dir, path)
+    return os.path.normpath(path)
+
+
+def iter_m3u(path):
+    """Пути треков из M3U/M3U8 по одной строке (комментарии и #EXTINF пропускаются)"""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    for line in _text_lines(path):
+        if line.startswith('#'):
+            continue
+        track = resolve_location(line, base_dir)
+        if track is not None:
+            yield track
+
+
+def iter_pls(path):
+    """Пути треков из PLS (строки FileN=...) в порядке файла"""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    for line in _text_lines(path):
+        key, sep, value = line.partition('=')
+        if sep and key.strip().lower().startswith('file'):
+            track = resolve_location(value.strip(), base_dir)
+            if track is not None:
+                yield track
+
+
+def iter_xspf(path):
+    """Пути треков из XSPF; разобранные треки сразу удаляются из дерева"""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    parents = []
+    for event, element in ElementTree.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            parents.append(element)
+            continue
+        parents.pop()
+        if element.tag == XSPF_NS + 'location':
+            track = resolve_location((element.text or '').strip(), base_dir, uri=True)
+            if track is not None:
+                yield track
+        elif element.tag == XSPF_NS + 'track' and parents:
+            # Разобранный трек — первый ребенок trackList, удаление дешевое
+            parents[-1].remove(element)
+
+
+def iter_playlist(path):
+    """Пути треков плейлиста любого поддерживаемого формата (генератор)"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.m3u', '.m3u8'):
+        return iter_m3u(path)
+    if ext == '.pls':
+        return iter_pls(path)
+    if ext == '.xspf':
+        return iter_xspf(path)
+    raise ValueError(f"Неизвестный формат плейлиста: {ext}")
+
+
+class ExistenceChecker:
+    """Проверка существования файлов по спискам папок.
+
+    Вместо stat на каждый трек папка читается один раз, а имена хранятся
+    в небольшом LRU — треки в плейлистах обычно идут по папкам подряд.
+    """
+
+    def __init__(self, cache_size=DIR_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._dirs = collections.OrderedDict()
+
+    def _names(self, directory):
+        names = self._dirs.get(directory)
+        if names is not None:
+            self._dirs.move_to_end(directory)
+            return names
+        try:
+            with os.scandir(directory) as it:
+                names = {entry.name for entry in it}
+        except OSError:
+            names = frozenset()
+        self._dirs[directory] = names
+        if len(self._dirs) > self.cache_size:
+            self._dirs.popitem(last=False)
+        return names
+
+    def exists(self, path):
+        directory, name = os.path.split(path)
+        return name in self._names(directory)
+
+    def filter(self, paths):
+        """Разделяет пачку путей на существующие и отсутствующие"""
+        found, missing = [], []
+        for path in paths:
+            (found if self.exists(path) else missing).append(path)
+        return found, missing
+
+
+class PlaylistImporter:
+    """Фоновый импорт файла плейлиста.
+
+    Файл разбирается потоково в отдельном потоке, существование треков
+    проверяется пачками. Найденные треки копятся в буфере, который UI
+    забирает через take_results() и добавляет в плейлист — как у
+    LibraryScanner, сам импортер библиотеку не меняет.
+    """
+
+    def __init__(self, path, batch_size=IMPORT_BATCH):
+        self.path = path
+        self.batch_size = batch_size
+        self.read = 0
+        self.missing = 0
+        self.error = None
+        self.done = False
+
+        self._lock = threading.Lock()
+        self._results = []
+        self._cancelled = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="playlist-import", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def take_results(self):
+        """Забирает найденные треки (вызывается из потока UI)"""
+        with self._lock:
+            results, self._results = self._results, []
+        return results
+
+    def _run(self):
+        checker = ExistenceChecker()
+        batch = []
+        try:
+            for track in iter_playlist(self.path):
+                if self._cancelled.is_set():
+                    break
+                batch.append(track)
+                if len(batch) >= self.batch_size:
+                    self._take_batch(checker, batch)
+                    batch = []
+            self._take_batch(checker, batch)
+        except (OSError, ValueError, ElementTree.ParseError) as e:
+            self.error = e
+        self.done = True
+
+    def _take_batch(self, checker, batch):
+        found, missing = checker.filter(batch)
+        with self._lock:
+            self.read += len(batch)
+            self.missing += len(missing)
+            self._results.extend(found)
+
+
+# Экспорт
+
+def _location(track, base_dir, relative):
+    """Путь трека относительно папки плейлиста, если это возможно"""
+    if relative:
+        try:
+            return os.path.relpath(track, base_dir)
+        except ValueError:
+            # Другой диск Windows
+            pass
+    return track
+
+
+def _atomic_write_lines(path, lines):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+        for line in lines:
+            f.write(line)
+            f.write('\n')
+    os.replace(tmp_path, path)
+
+
+def _m3u_lines(tracks, base_dir, relative, info):
+    yield '#EXTM3U'
+    for track in tracks:
+        entry = info(track) if info is not None else None
+        if entry is not None and entry['ok']:
+            title = entry['title'] or os.path.splitext(os.path.basename(track))[0]
+            if entry['artist']:
+                title = f"{entry['artist']} - {title}"
+            yield f"#EXTINF:{int(entry['duration'])},{title}"
+        yield _location(track, base_dir, relative)
+
+
+def _pls_lines(tracks, base_dir, relative, info):
+    yield '[playlist]'
+    count = 0
+    for count, track in enumerate(tracks, 1):
+        yield f"File{count}={_location(track, base_dir, relative)}"
+        entry = info(track) if info is not None else None
+        if entry is not None and entry['ok']:
+            if entry['title']:
+                yield f"Title{count}={entry['title']}"
+            yield f"Length{count}={int(entry['duration'])}"
+    # Число записей известно только в конце — PLS это допускает
+    yield f"NumberOfEntries={count}"
+    yield 'Version=2'
+
+
+def _xspf_lines(tracks, base_dir, relative, info):
+    yield '<?xml version="1.0" encoding="UTF-8"?>'
+    yield '<playlist version="1" xmlns="http://xspf.org/ns/0/">'
+    yield '  <trackList>'
+    for track in tracks:
+        location = _location(track, base_dir, relative)
+        if os.path.isabs(location):
+            location = 'file://' + pathname2url(location)
+        else:
+            location = quote(location.replace(os.sep, '/'))
+        yield '    <track>'
+        yield f"      <location>{escape(location)}</location>"
+        entry = info(track) if info is not None else None
+        if entry is not None and entry['ok']:
+            if entry['title']:
+                yield f"      <title>{escape(entry['title'])}</title>"
+            if entry['artist']:
+                yield f"      <creator>{escape(entry['artist'])}</creator>"
+            if entry['duration']:
+                yield f"      <duration>{int(entry['duration'] * 1000)}</duration>"
+        yield '    </track>'
+    yield '  </trackList>'
+    yield '</playlist>'
+
+
+def write_playlist(path, tracks, info=None, relative=True):
+    """Сохраняет треки в M3U/M3U8, PLS или XSPF (формат по расширению).
+
+    info(path) — запись метаданных или None (для #EXTINF, названий и
+    длительностей). Пути пишутся относительно папки плейлиста, если
+    relative. Файл пишется построчно и заменяется атомарно.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    writers = {'.m3u': _m3u_lines, '.m3u8': _m3u_lines, '.pls': _pls_lines, '.xspf': _xspf_lines}
+    if ext not in writers:
+        raise ValueError(f"Неизвестный формат плейлиста: {ext}")
+    base_dir = os.path.dirname(os.path.abspath(path))
+    _atomic_write_lines(path, writers[ext](tracks, base_dir, relative, info))
@@ -0,0 +1,337 @@
+import json
+import os
+import time
+
+from perf_trace import tracer
+from track_list import TrackTable, TrackList, encode_ids, decode_ids
+
+
+# Версия формата снимка (1 — старый playlists.json без обертки,
+# 2 — списки путей, 3 — таблица путей и массивы id в base64)
+SNAPSHOT_VERSION = 3
+
+# Когда журнал сворачивается в новый снимок
+COMPACT_EVERY_OPS = 500
+COMPACT_JOURNAL_BYTES = 4 * 1024 * 1024
+
+DEFAULT_PLAYLISTS = ("main", "избранное")
+
+
+def _fsync_dir(path):
+    """Сбрасывает на диск запись каталога (после os.replace)"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write_json(path, data):
+    """Атомарно записывает JSON: временный файл + fsync + os.replace"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+
+
+class PlaylistStore:
+    """Хранилище плейлистов: снимок в playlists.json + журнал операций.
+
+    Каждое изменение дописывается одной строкой в журнал, поэтому удаление
+    одного трека не переписывает весь файл. Периодически журнал
+    сворачивается в новый снимок, который пишется атомарно. Снимок и журнал
+    связаны номером поколения: журнал от предыдущего снимка (сбой между
+    записью снимка и очисткой журнала) при загрузке игнорируется. Старый
+    формат playlists.json (просто словарь) переносится в новый при первой
+    загрузке.
+
+    Пути хранятся один раз в общей таблице треков, плейлисты — массивы id.
+    Журнал пишется путями, снимок — таблицей путей и id, перенумерованными
+    без пропусков.
+    """
+
+    def __init__(self, snapshot_path, journal_path=None):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path or os.path.splitext(snapshot_path)[0] + ".journal"
+        self.playlists = {}
+        self.table = TrackTable()
+        self.recovered_from = None
+        self.migrated = False
+        self.generation = 0
+        # Подписчики на изменения: callback(kind, name, added, removed)
+        self.listeners = []
+        self._journal = None
+        self._journal_ops = 0
+
+    def load(self):
+        """Загружает снимок и применяет журнал. Возвращает словарь плейлистов"""
+        self.playlists = self._read_snapshot()
+        replayed = self._replay_journal()
+
+        for name in DEFAULT_PLAYLISTS:
+            self.playlists.setdefault(name, TrackList(table=self.table))
+
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._journal_ops = replayed or 0
+
+        # Разовая миграция старого формата, сворачивание длинного журнала
+        # и новый журнал, если старый относился к другому снимку
+        if (self.migrated or self.recovered_from or replayed is None
+                or self._journal_is_large()):
+            self.compact()
+
+        return self.playlists
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return {}
+
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            # Не затираем поврежденный файл молча — откладываем его в сторону
+            backup = f"{self.snapshot_path}.corrupt-{time.strftime('%Y%m%d-%H%M%S')}"
+            try:
+                os.replace(self.snapshot_path, backup)
+            except OSError:
+                backup = self.snapshot_path
+            print(f"Не удалось прочитать плейлисты ({e}), файл сохранен как {backup}")
+            self.recovered_from = backup
+            return {}
+
+        if isinstance(data, dict) and data.get('version') == SNAPSHOT_VERSION:
+            self.generation = data.get('generation', 0)
+            self.table = TrackTable(data.get('tracks', []))
+            return {name: TrackList.from_ids(decode_ids(ids), self.table)
+                    for name, ids in data.get('playlists', {}).items()}
+
+        if isinstance(data, dict) and data.get('version') == 2:
+            # Списки путей; журнал этого поколения по-прежнему подходит
+            self.generation = data.get('generation', 0)
+            self.migrated = True
+            return {name: TrackList(tracks, self.table)
+                    for name, tracks in data.get('playlists', {}).items()}
+
+        # Старый формат: {"имя": [пути]}
+        self.migrated = True
+        return {name: TrackList(tracks, self.table) for name, tracks in data.items()
+                if isinstance(tracks, list)}
+
+    def _replay_journal(self):
+        """Применяет журнал к снимку. Оборванная последняя строка отбрасывается.
+
+        Возвращает число примененных операций или None, если журнала нет
+        или он относится к другому поколению снимка.
+        """
+        if not os.path.exists(self.journal_path):
+            return None
+
+        replayed = 0
+        good_offset = 0
+        with open(self.journal_path, 'rb') as f:
+            for raw_line in f:
+                if not raw_line.endswith(b'\n'):
+                    break
+                try:
+                    op = json.loads(raw_line.decode('utf-8'))
+                except ValueError:
+                    break
+                if good_offset == 0:
+                    # Первая строка — заголовок с поколением снимка
+                    if op.get('op') != 'base' or op.get('generation') != self.generation:
+                        return None
+                else:
+                    self._apply(op)
+                    replayed += 1
+                good_offset += len(raw_line)
+
+        if good_offset == 0:
+            return None
+
+        # Обрезаем хвост, записанный не до конца (например, при сбое)
+        if good_offset != os.path.getsize(self.journal_path):
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(good_offset)
+        return replayed
+
+    def _apply(self, op):
+        kind = op.get('op')
+        name = op.get('name')
+        if kind == 'create':
+            self.playlists[name] = TrackList(op.get('tracks', []), self.table)
+        elif kind == 'delete':
+            self.playlists.pop(name, None)
+        elif kind == 'add':
+            self.playlists.setdefault(name, TrackList(table=self.table)).extend(op['tracks'])
+        elif kind == 'remove':
+            tracks = self.playlists.get(name)
+            if tracks is not None and op['track'] in tracks:
+                tracks.remove(op['track'])
+        elif kind == 'remove_many':
+            if name in self.playlists:
+                self.playlists[name].remove_many(op['tracks'])
+        elif kind == 'clear':
+            if name in self.playlists:
+                self.playlists[name].clear()
+        elif kind == 'replace':
+            tracks = self.playlists.get(name)
+            if tracks is None:
+                return
+            for old_path, new_path in op['tracks']:
+                if old_path not in tracks:
+                    continue
+                # Замена уже есть в плейлисте — копия просто убирается
+                if not tracks.replace(old_path, new_path):
+                    tracks.remove(old_path)
+        elif kind == 'rename':
+            # Путь мог остаться в таблице от удаленного трека — он свободен
+            if not self.is_referenced(op['new']):
+                self.table.forget(op['new'])
+            self.table.rename(op['old'], op['new'])
+
+    def _diff(self, op):
+        """Какие треки операция добавит и уберет (для подписчиков)"""
+        kind = op['op']
+        if kind == 'rename':
+            return [op['new']], [op['old']]
+        current = self.playlists.get(op['name'], [])
+        if kind == 'create':
+            return op['tracks'], list(current)
+        if kind == 'add':
+            return op['tracks'], []
+        if kind == 'remove':
+            return [], [op['track']]
+        if kind == 'remove_many':
+            return [], op['tracks']
+        if kind == 'replace':
+            return (list(dict.fromkeys(new for _, new in op['tracks'] if new not in current)),
+                    [old for old, _ in op['tracks']])
+        return [], list(current)
+
+    def _write(self, op):
+        added, removed = self._diff(op)
+        self._apply(op)
+        with tracer.span('playlist_journal', op=op['op']):
+            self._journal.write(json.dumps(op, ensure_ascii=False, separators=(',', ':')) + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        self._journal_ops += 1
+
+        if self._journal_is_large():
+            self.compact()
+
+        for callback in self.listeners:
+            callback(op['op'], op.get('name'), added, removed)
+
+    def _journal_is_large(self):
+        if self._journal_ops >= COMPACT_EVERY_OPS:
+            return True
+        try:
+            return os.path.getsize(self.journal_path) >= COMPACT_JOURNAL_BYTES
+        except OSError:
+            return False
+
+    def create(self, name, tracks=()):
+        """Создает (или заменяет) плейлист"""
+        self._write({'op': 'create', 'name': name, 'tracks': list(tracks)})
+        return self.playlists[name]
+
+    def delete(self, name):
+        if name in self.playlists:
+            self._write({'op': 'delete', 'name': name})
+
+    def add_tracks(self, name, paths):
+        """Добавляет треки, которых еще нет в плейлисте. Возвращает добавленные"""
+        tracks = self.playlists.setdefault(name, TrackList(table=self.table))
+        added = [path for path in dict.fromkeys(paths) if path not in tracks]
+        if added:
+            self._write({'op': 'add', 'name': name, 'tracks': added})
+        return added
+
+    def remove_track(self, name, path):
+        if path in self.playlists.get(name, ()):
+            self._write({'op': 'remove', 'name': name, 'track': path})
+
+    def remove_tracks(self, name, paths):
+        """Удаляет несколько треков одной операцией. Возвращает удаленные"""
+        tracks = self.playlists.get(name, ())
+        removed = [path for path in dict.fromkeys(paths) if path in tracks]
+        if removed:
+            self._write({'op': 'remove_many', 'name': name, 'tracks': removed})
+        return removed
+
+    def replace_tracks(self, name, pairs):
+        """Заменяет треки на месте (пары старый, новый) одной операцией.
+
+        Если новый трек уже есть в плейлисте, старый просто удаляется.
+        Возвращает число замененных треков.
+        """
+        tracks = self.playlists.get(name, ())
+        pairs = [[old, new] for old, new in pairs if old != new and old in tracks]
+        if pairs:
+            self._write({'op': 'replace', 'name': name, 'tracks': pairs})
+        return len(pairs)
+
+    def clear(self, name):
+        if self.playlists.get(name):
+            self._write({'op': 'clear', 'name': name})
+
+    def is_referenced(self, path):
+        """Есть ли трек хотя бы в одном плейлисте"""
+        return any(tracks.id_of(path) is not None for tracks in self.playlists.values())
+
+    def rename_track(self, old_path, new_path):
+        """Файл переименован или перенесен: путь меняется сразу во всех плейлистах.
+
+        False, если трека нет или новый путь уже есть в каком-то плейлисте.
+        Путь, который остался в таблице только от удаленных треков, занять можно.
+        """
+        if self.table.id_of(old_path) is None or self.is_referenced(new_path):
+            return False
+        self._write({'op': 'rename', 'old': old_path, 'new': new_path})
+        return True
+
+    @tracer.traced('save_playlists')
+    def compact(self):
+        """Записывает полный снимок и начинает новый журнал"""
+        self.generation += 1
+        atomic_write_json(self.snapshot_path, self._snapshot())
+        if self._journal is not None:
+            self._journal.truncate(0)
+            self._journal.write(json.dumps({'op': 'base', 'generation': self.generation}) + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        self._journal_ops = 0
+        self.migrated = False
+
+    def _snapshot(self):
+        """Снимок: только используемые пути, id перенумерованы по порядку"""
+        remap = {}
+        playlists = {}
+        for name, tracks in self.playlists.items():
+            playlists[name] = encode_ids(remap.setdefault(track_id, len(remap))
+                                         for track_id in tracks.ids)
+        paths = self.table.paths
+        return {
+            'version': SNAPSHOT_VERSION,
+            'generation': self.generation,
+            'tracks': [paths[track_id] for track_id in remap],
+            'playlists': playlists,
+        }
+
+    def close(self):
+        if self._journal is not None:
+            self.compact()
+            self._journal.close()
+            self._journal = None
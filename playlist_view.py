@@ -0,0 +1,263 @@
+import math
+import os
+import time
+import tkinter as tk
+
+from perf_trace import tracer
+
+
+ROW_BG = '#181818'
+ROW_HOVER_BG = '#282828'
+
+# Сколько строк проверяется с диска за один проход простоя Tk
+RESOLVE_ROWS = 4
+
+
+class _PlaylistRow:
+    """Строка плейлиста, которая переиспользуется при прокрутке"""
+
+    def __init__(self, view):
+        self.view = view
+        self.index = None
+        self.info = None
+        canvas = view.canvas
+
+        self.frame = tk.Frame(canvas, bg=ROW_BG, height=view.row_height)
+        self.frame.pack_propagate(False)
+
+        # Номер трека
+        self.num_label = tk.Label(self.frame,
+                                  font=view.time_font,
+                                  bg=ROW_BG,
+                                  fg='#b3b3b3',
+                                  width=3)
+        self.num_label.pack(side=tk.LEFT, padx=10)
+
+        # Иконка воспроизведения
+        self.play_icon = tk.Label(self.frame,
+                                  text="▶",
+                                  font=('Arial', 10),
+                                  bg=ROW_BG,
+                                  fg=ROW_BG)
+        self.play_icon.pack(side=tk.LEFT)
+
+        # Кнопка удаления из плейлиста
+        self.delete_btn = tk.Button(self.frame,
+                                    text="🗑️",
+                                    font=('Arial', 8),
+                                    bg=ROW_BG,
+                                    fg='#b3b3b3',
+                                    relief='flat',
+                                    width=2,
+                                    cursor='hand2',
+                                    command=self.on_delete)
+        self.delete_btn.pack(side=tk.RIGHT, padx=5)
+
+        # Длительность
+        self.dur_label = tk.Label(self.frame,
+                                  font=view.time_font,
+                                  bg=ROW_BG,
+                                  fg='#b3b3b3')
+        self.dur_label.pack(side=tk.RIGHT, padx=20)
+
+        # Информация о треке
+        self.info_frame = tk.Frame(self.frame, bg=ROW_BG)
+        self.info_frame.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=10)
+
+        self.track_label = tk.Label(self.info_frame,
+                                    font=view.song_font,
+                                    bg=ROW_BG,
+                                    fg='white',
+                                    anchor='w')
+        self.track_label.pack(fill=tk.X)
+
+        self.artist_label = tk.Label(self.info_frame,
+                                     font=view.time_font,
+                                     bg=ROW_BG,
+                                     fg='#b3b3b3',
+                                     anchor='w')
+        self.artist_label.pack(fill=tk.X)
+
+        self.widgets = [self.frame, self.num_label, self.play_icon, self.info_frame,
+                        self.track_label, self.artist_label, self.dur_label, self.delete_btn]
+
+        # Обработчики привязываются один раз на всё время жизни строки
+        self.frame.bind("<Enter>", self.on_enter)
+        self.frame.bind("<Leave>", self.on_leave)
+        for widget in self.widgets[:-1]:
+            widget.bind("<Button-1>", self.on_click)
+        for widget in self.widgets:
+            view.bind_mousewheel(widget)
+
+        self.item = canvas.create_window(0, 0, window=self.frame, anchor='nw',
+                                         width=view.row_width, height=view.row_height,
+                                         state='hidden')
+
+    def bind(self, index, file_path, info, pending=False):
+        """Привязывает строку к треку плейлиста.
+
+        pending — метаданные еще не проверены с диска (их может не быть в кэше)
+        """
+        self.index = index
+        self.info = info
+        self.set_bg(ROW_BG)
+        self.num_label.config(text=str(index + 1))
+        self.track_label.config(text=os.path.basename(file_path))
+
+        if info is None and pending:
+            artist_info = ""
+            duration = ""
+        elif info is None:
+            artist_info = "Файл не найден"
+            duration = "--:--"
+        elif info['ok']:
+            duration = time.strftime('%M:%S', time.gmtime(info['duration']))
+            bitrate = f"{info['bitrate'] // 1000} kbps"
+            artist_info = f"{duration} • {bitrate}"
+            if info['artist']:
+                artist_info = f"{info['artist']} • {artist_info}"
+        else:
+            artist_info = "Неизвестный артист"
+            duration = "--:--"
+
+        self.artist_label.config(text=artist_info)
+        self.dur_label.config(text=duration)
+
+    def set_bg(self, color):
+        for widget in self.widgets:
+            widget.config(bg=color)
+        self.play_icon.config(fg='white' if color == ROW_HOVER_BG else color)
+
+    def on_enter(self, event):
+        self.set_bg(ROW_HOVER_BG)
+
+    def on_leave(self, event):
+        self.set_bg(ROW_BG)
+
+    def on_click(self, event):
+        if self.index is not None:
+            self.view.on_play(self.index)
+
+    def on_delete(self):
+        if self.index is not None and self.index < len(self.view.items):
+            self.view.on_remove(self.view.items[self.index])
+
+
+class VirtualPlaylistView:
+    """Виртуализированный список треков на Canvas.
+
+    Виджеты создаются только для видимых строк: небольшой пул строк по
+    размеру окна переставляется и перепривязывается к данным при прокрутке,
+    поэтому память и время перерисовки не зависят от длины плейлиста.
+
+    Если задан peek_info (метаданные из кэша без обращения к диску), строки
+    сначала рисуются по нему, а проверка файлов и чтение заголовков идут
+    порциями в простое Tk — первый кадр не ждет диска.
+    """
+
+    def __init__(self, canvas, scrollbar, song_font, time_font,
+                 on_play, on_remove, get_info, row_height=48, peek_info=None):
+        self.canvas = canvas
+        self.scrollbar = scrollbar
+        self.song_font = song_font
+        self.time_font = time_font
+        self.on_play = on_play
+        self.on_remove = on_remove
+        self.get_info = get_info
+        self.peek_info = peek_info
+        self.row_height = row_height
+        self.row_width = 1
+
+        self.items = []
+        self.rows = []
+        # Строки, метаданные которых еще не проверены (упорядоченное множество)
+        self.unresolved = {}
+        self.resolve_after_id = None
+
+        self.canvas.configure(yscrollcommand=self.on_canvas_scroll,
+                              yscrollincrement=1)
+        self.scrollbar.configure(command=self.canvas.yview)
+        self.canvas.bind("<Configure>", self.on_configure)
+        self.bind_mousewheel(self.canvas)
+
+    def bind_mousewheel(self, widget):
+        widget.bind("<MouseWheel>", self.on_mousewheel)
+        widget.bind("<Button-4>", lambda e: self.scroll_rows(-3))
+        widget.bind("<Button-5>", lambda e: self.scroll_rows(3))
+
+    def on_mousewheel(self, event):
+        self.scroll_rows(-3 if event.delta > 0 else 3)
+
+    def scroll_rows(self, rows):
+        self.canvas.yview_scroll(rows * self.row_height, 'units')
+
+    def set_items(self, items):
+        """Задает список треков и перерисовывает видимые строки"""
+        self.items = items
+        self.update_scrollregion()
+        self.update_rows(force=True)
+
+    def update_scrollregion(self):
+        total_height = max(len(self.items) * self.row_height, 1)
+        self.canvas.configure(scrollregion=(0, 0, self.row_width, total_height))
+
+    def on_configure(self, event):
+        self.row_width = max(event.width, 1)
+        for row in self.rows:
+            self.canvas.itemconfigure(row.item, width=self.row_width)
+
+        # Пул строк по высоте окна (+1 для частично видимой строки)
+        needed = math.ceil(event.height / self.row_height) + 1
+        while len(self.rows) < needed:
+            self.rows.append(_PlaylistRow(self))
+
+        self.update_scrollregion()
+        self.update_rows(force=True)
+
+    def on_canvas_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.update_rows()
+
+    @tracer.traced('playlist_rows')
+    def update_rows(self, force=False):
+        """Переставляет строки пула под текущую позицию прокрутки"""
+        first_index = max(int(self.canvas.canvasy(0)) // self.row_height, 0)
+
+        for offset, row in enumerate(self.rows):
+            index = first_index + offset
+            if index < len(self.items):
+                self.canvas.coords(row.item, 0, index * self.row_height)
+                if force or row.index != index:
+                    file_path = self.items[index]
+                    if self.peek_info is None:
+                        row.bind(index, file_path, self.get_info(file_path))
+                    else:
+                        row.bind(index, file_path, self.peek_info(file_path), pending=True)
+                        self.unresolved[row] = None
+                self.canvas.itemconfigure(row.item, state='normal')
+            else:
+                row.index = None
+                self.canvas.itemconfigure(row.item, state='hidden')
+
+        if self.unresolved and self.resolve_after_id is None:
+            self.resolve_after_id = self.canvas.after_idle(self.resolve_rows)
+
+    @tracer.traced('playlist_rows_resolve')
+    def resolve_rows(self):
+        """Проверяет метаданные нескольких строк с диска и перерисовывает изменившиеся"""
+        self.resolve_after_id = None
+        for _ in range(RESOLVE_ROWS):
+            if not self.unresolved:
+                break
+            row = next(iter(self.unresolved))
+            del self.unresolved[row]
+            if row.index is None or row.index >= len(self.items):
+                continue
+            file_path = self.items[row.index]
+            info = self.get_info(file_path)
+            if info is not row.info or info is None:
+                row.bind(row.index, file_path, info)
+
+        # Остальные строки — в следующем простое, после событий ввода
+        if self.unresolved:
+            self.resolve_after_id = self.canvas.after_idle(self.resolve_rows)
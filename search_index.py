@@ -0,0 +1,235 @@
+import bisect
+import heapq
+import os
+import re
+
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Сколько слов словаря разворачиваем для одного префикса
+MAX_PREFIX_EXPANSION = 256
+
+# Веса совпадений
+SCORE_EXACT = 3
+SCORE_PREFIX = 2
+SCORE_FUZZY = 1
+
+
+def tokenize(text):
+    """Разбивает текст на слова в нижнем регистре"""
+    return _TOKEN_RE.findall(text.lower()) if text else []
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def within_distance(a, b, limit):
+    """Проверяет, что расстояние Левенштейна между a и b не больше limit"""
+    if abs(len(a) - len(b)) > limit:
+        return False
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        row_min = i
+        for j, cb in enumerate(b, 1):
+            value = min(previous[j] + 1,
+                        current[j - 1] + 1,
+                        previous[j - 1] + (ca != cb))
+            current.append(value)
+            row_min = min(row_min, value)
+        if row_min > limit:
+            return False
+        previous = current
+    return previous[-1] <= limit
+
+
+def document_text(path, info):
+    """Текст трека для индексации: имя файла, название, артист, альбом"""
+    parts = [os.path.splitext(os.path.basename(path))[0]]
+    if info is not None:
+        parts.extend((info['title'], info['artist'], info['album']))
+    return " ".join(part for part in parts if part)
+
+
+class SearchIndex:
+    """Инвертированный индекс по трекам всех плейлистов.
+
+    Слово -> множество id документов, отсортированный словарь для поиска по
+    префиксу и триграммный индекс слов для нечеткого поиска. Документ —
+    уникальный путь; счетчик ссылок позволяет держать один документ для
+    трека, который лежит в нескольких плейлистах. Новые слова попадают в
+    словарь и триграммы пачкой перед ближайшим поиском, поэтому массовое
+    добавление не сортирует словарь на каждом треке.
+    """
+
+    def __init__(self):
+        self._next_id = 0
+        self._ids = {}
+        self._paths = {}
+        self._refs = {}
+        self._doc_tokens = {}
+        self._postings = {}
+        self._vocab = []
+        self._trigrams = {}
+        self._pending = set()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, path):
+        return path in self._ids
+
+    def add(self, path, info=None):
+        """Добавляет ссылку на трек (повторное добавление увеличивает счетчик)"""
+        if path in self._ids:
+            self._refs[path] += 1
+            return
+        doc_id = self._next_id
+        self._next_id += 1
+        self._ids[path] = doc_id
+        self._paths[doc_id] = path
+        self._refs[path] = 1
+        self._index_tokens(doc_id, set(tokenize(document_text(path, info))))
+
+    def discard(self, path):
+        """Убирает одну ссылку; документ удаляется, когда ссылок не осталось"""
+        if path not in self._ids:
+            return
+        self._refs[path] -= 1
+        if self._refs[path] > 0:
+            return
+        doc_id = self._ids.pop(path)
+        del self._refs[path]
+        del self._paths[doc_id]
+        self._unindex_tokens(doc_id)
+
+    def rename(self, old_path, new_path, info=None):
+        """Переносит документ на новый путь, счетчик ссылок сохраняется"""
+        if old_path not in self._ids:
+            return
+        if new_path in self._ids:
+            # Новый путь уже проиндексирован — ссылки складываются
+            self._refs[new_path] += self._refs.pop(old_path)
+            doc_id = self._ids.pop(old_path)
+            del self._paths[doc_id]
+            self._unindex_tokens(doc_id)
+            return
+        doc_id = self._ids.pop(old_path)
+        self._ids[new_path] = doc_id
+        self._paths[doc_id] = new_path
+        self._refs[new_path] = self._refs.pop(old_path)
+        self._unindex_tokens(doc_id)
+        self._index_tokens(doc_id, set(tokenize(document_text(new_path, info))))
+
+    def update(self, path, info):
+        """Переиндексирует трек после обновления метаданных"""
+        doc_id = self._ids.get(path)
+        if doc_id is None:
+            return
+        tokens = set(tokenize(document_text(path, info)))
+        if tokens != self._doc_tokens.get(doc_id):
+            self._unindex_tokens(doc_id)
+            self._index_tokens(doc_id, tokens)
+
+    def _index_tokens(self, doc_id, tokens):
+        self._doc_tokens[doc_id] = tokens
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                self._pending.add(token)
+            postings.add(doc_id)
+
+    def _unindex_tokens(self, doc_id):
+        for token in self._doc_tokens.pop(doc_id, ()):
+            postings = self._postings[token]
+            postings.discard(doc_id)
+            if not postings:
+                del self._postings[token]
+                if token in self._pending:
+                    self._pending.discard(token)
+                    continue
+                del self._vocab[bisect.bisect_left(self._vocab, token)]
+                for gram in trigrams(token):
+                    words = self._trigrams[gram]
+                    words.discard(token)
+                    if not words:
+                        del self._trigrams[gram]
+
+    def _merge_pending(self):
+        """Переносит новые слова в отсортированный словарь и триграммы"""
+        if not self._pending:
+            return
+        new_tokens = sorted(self._pending)
+        self._pending = set()
+        if len(new_tokens) <= MAX_PREFIX_EXPANSION:
+            for token in new_tokens:
+                bisect.insort(self._vocab, token)
+        else:
+            self._vocab = list(heapq.merge(self._vocab, new_tokens))
+        for token in new_tokens:
+            for gram in trigrams(token):
+                self._trigrams.setdefault(gram, set()).add(token)
+
+    def _prefix_tokens(self, term):
+        start = bisect.bisect_left(self._vocab, term)
+        end = min(start + MAX_PREFIX_EXPANSION, len(self._vocab))
+        for i in range(start, end):
+            token = self._vocab[i]
+            if not token.startswith(term):
+                break
+            yield token
+
+    def _fuzzy_tokens(self, term):
+        if len(term) < 3:
+            return []
+        limit = 1 if len(term) <= 8 else 2
+        grams = trigrams(term)
+        counts = {}
+        for gram in grams:
+            for token in self._trigrams.get(gram, ()):
+                counts[token] = counts.get(token, 0) + 1
+        # Отсекаем слова с малым числом общих триграмм до подсчета расстояния
+        threshold = max(1, len(grams) - 3 * limit)
+        return [token for token, count in counts.items()
+                if count >= threshold and within_distance(term, token, limit)]
+
+    def _match_term(self, term):
+        """Возвращает {doc_id: score} для одного слова запроса"""
+        scores = {}
+        for token in self._prefix_tokens(term):
+            score = SCORE_EXACT if token == term else SCORE_PREFIX
+            for doc_id in self._postings[token]:
+                if scores.get(doc_id, 0) < score:
+                    scores[doc_id] = score
+        if not scores:
+            for token in self._fuzzy_tokens(term):
+                for doc_id in self._postings[token]:
+                    scores.setdefault(doc_id, SCORE_FUZZY)
+        return scores
+
+    def search(self, query, limit=100):
+        """Ищет треки, в которых есть все слова запроса (по префиксу или нечетко)"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        self._merge_pending()
+
+        per_term = sorted((self._match_term(term) for term in terms), key=len)
+        if not per_term[0]:
+            return []
+
+        # Пересекаем, начиная с самого короткого списка
+        totals = dict(per_term[0])
+        for scores in per_term[1:]:
+            totals = {doc_id: total + scores[doc_id]
+                      for doc_id, total in totals.items() if doc_id in scores}
+            if not totals:
+                return []
+
+        best = heapq.nsmallest(limit, totals.items(),
+                               key=lambda item: (-item[1], item[0]))
+        return [self._paths[doc_id] for doc_id, _ in best]
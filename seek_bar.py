@@ -0,0 +1,106 @@
+from audio_decode import np
+
+
+# Цвета пройденной и оставшейся части
+PLAYED_COLOR = '#1DB954'
+REMAINING_COLOR = '#404040'
+
+# Ширина столбика формы волны с зазором, в пикселях
+COLUMN_STEP = 3
+
+
+class WaveformSeekBar:
+    """Прогресс-бар с формой волны трека.
+
+    Без сводки рисуется обычная полоса. Со сводкой столбики создаются один
+    раз на ширину холста, а при движении прогресса перекрашиваются только
+    столбики между старой и новой позицией.
+    """
+
+    def __init__(self, canvas, bar_height=4):
+        self.canvas = canvas
+        self.bar_height = bar_height
+        self.summary = None
+        self.progress = 0.0
+
+        self._columns = []
+        self._played = 0
+        self._width = 0
+        self._bg = None
+        self._fg = None
+
+        canvas.bind("<Configure>", lambda e: self.redraw(), add='+')
+        self.redraw()
+
+    def set_summary(self, summary):
+        """summary — массив (2, bins) из WaveformStore или None"""
+        self.summary = summary
+        self.redraw()
+
+    def set_progress(self, fraction):
+        self.progress = min(max(fraction, 0.0), 1.0)
+        width = self.canvas.winfo_width()
+        if width != self._width:
+            self.redraw()
+            return
+
+        if self._columns:
+            self._paint_columns(int(len(self._columns) * self.progress))
+        else:
+            top, bottom = self._flat_extent()
+            self.canvas.coords(self._fg, 0, top, int(width * self.progress), bottom)
+
+    def redraw(self):
+        self.canvas.delete("all")
+        self._columns = []
+        self._played = 0
+        self._width = self.canvas.winfo_width()
+
+        if self.summary is not None and np is not None and self._width > COLUMN_STEP:
+            self._draw_waveform()
+        else:
+            self._draw_flat()
+
+    def _flat_extent(self):
+        height = max(self.canvas.winfo_height(), self.bar_height)
+        top = (height - self.bar_height) // 2
+        return top, top + self.bar_height
+
+    def _draw_flat(self):
+        top, bottom = self._flat_extent()
+        self._bg = self.canvas.create_rectangle(0, top, self._width, bottom,
+                                                fill=REMAINING_COLOR, outline='')
+        self._fg = self.canvas.create_rectangle(0, top, int(self._width * self.progress), bottom,
+                                                fill=PLAYED_COLOR, outline='')
+
+    def _draw_waveform(self):
+        height = max(self.canvas.winfo_height(), self.bar_height)
+        count = self._width // COLUMN_STEP
+        peaks = np.asarray(self.summary[0], dtype=np.float32)
+
+        # Сводка сжимается до числа столбиков: максимум пиков в каждой группе
+        starts = np.linspace(0, len(peaks), count, endpoint=False).astype(np.int64)
+        columns = np.maximum.reduceat(peaks, starts)
+        top = columns.max()
+        if top > 0:
+            columns = columns / top
+        heights = np.maximum(columns * height, 2).astype(np.int64)
+
+        middle = height / 2
+        for i, column_height in enumerate(heights.tolist()):
+            x = i * COLUMN_STEP
+            self._columns.append(self.canvas.create_rectangle(
+                x, middle - column_height / 2, x + COLUMN_STEP - 1, middle + column_height / 2,
+                fill=REMAINING_COLOR, outline=''))
+        self._paint_columns(int(count * self.progress))
+
+    def _paint_columns(self, played):
+        if played > self._played:
+            color, changed = PLAYED_COLOR, self._columns[self._played:played]
+        elif played < self._played:
+            color, changed = REMAINING_COLOR, self._columns[played:self._played]
+        else:
+            return
+        for item in changed:
+            self.canvas.itemconfigure(item, fill=color)
+        self._played = played
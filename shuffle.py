@@ -0,0 +1,194 @@
+import random
+
+
+# Больше попыток выборки с весами не делаем: берем последний кандидат
+MAX_WEIGHTED_TRIES = 32
+# Минимальный вес трека, чтобы выборка с отказами не затягивалась
+MIN_WEIGHT = 0.05
+# Сжатие истории после удалений: когда дыр больше этой доли
+COMPACT_HOLES_RATIO = 0.5
+
+
+class ShuffleOrder:
+    """Случайный порядок треков без повторов с историей в обе стороны.
+
+    Порядок — ленивая перестановка Фишера–Йетса. order[start:drawn] —
+    уже выбранные в этом круге треки, order[drawn:] — пул невыбранных,
+    order[:start] — история прошлого круга (только для шагов назад).
+    Следующий трек берется из пула случайным обменом за O(1), поэтому ни
+    один трек не повторяется, пока не сыграны все. Новый круг начинается,
+    когда пул пуст; его перестройка O(n) раз в n шагов.
+
+    weight(path) -> 0..1 задает необязательные веса (например, реже
+    выбирать часто игравшие треки); выборка с отказами остается O(1) в
+    среднем. Добавление и удаление треков тоже O(1): удаленные из истории
+    треки оставляют дыру, дыры изредка сжимаются.
+    """
+
+    def __init__(self, items=(), current=None, weight=None, rng=None):
+        self.weight = weight
+        self.rng = rng or random.Random()
+        self.reset(items, current)
+
+    def reset(self, items, current=None):
+        """Новый порядок; current (если есть) становится первым в истории"""
+        self.order = list(dict.fromkeys(items))
+        # Позиции треков текущего круга
+        self.positions = {path: i for i, path in enumerate(self.order)}
+        self.start = 0
+        self.drawn = 0
+        self.cursor = -1
+        self.holes = 0
+        if current is not None and current in self.positions:
+            self._swap(self.positions[current], 0)
+            self.drawn = 1
+            self.cursor = 0
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, path):
+        return path in self.positions
+
+    @property
+    def current(self):
+        if 0 <= self.cursor < len(self.order):
+            return self.order[self.cursor]
+        return None
+
+    def peek(self):
+        """Следующий трек без сдвига курсора (выбор фиксируется)"""
+        position = self._next_position()
+        return None if position is None else self.order[position]
+
+    def next(self):
+        position = self._next_position()
+        if position is None:
+            return None
+        self.cursor = position
+        return self.order[position]
+
+    def prev(self):
+        """Предыдущий трек истории или None, если история кончилась"""
+        position = self.cursor - 1
+        while position >= 0 and not self._is_live(position):
+            position -= 1
+        if position < 0:
+            return None
+        self.cursor = position
+        return self.order[position]
+
+    def jump(self, path):
+        """Трек выбран вручную: он становится текущим.
+
+        Трек из пула ставится следующим в историю, трек из истории —
+        курсор переходит к нему.
+        """
+        if self.current == path:
+            return
+        position = self.positions.get(path)
+        if position is None:
+            return
+        if position >= self.drawn:
+            self._swap(position, self.drawn)
+            position = self.drawn
+            self.drawn += 1
+        self.cursor = position
+
+    def add(self, path):
+        """Новый трек попадает в пул невыбранных"""
+        if path in self.positions:
+            return
+        self.positions[path] = len(self.order)
+        self.order.append(path)
+
+    def discard(self, path):
+        position = self.positions.pop(path, None)
+        if position is None:
+            return
+        if position >= self.drawn:
+            # Из пула — обмен с последним
+            last = self.order.pop()
+            if position < len(self.order):
+                self.order[position] = last
+                self.positions[last] = position
+            return
+        # Из истории — дыра, чтобы не сдвигать позиции
+        self.order[position] = None
+        self.holes += 1
+        if self.holes > 32 and self.holes > len(self.order) * COMPACT_HOLES_RATIO:
+            self._compact()
+
+    def _is_live(self, position):
+        """Трек на позиции еще в плейлисте (история прошлого круга не обновляется)"""
+        path = self.order[position]
+        return path is not None and (position >= self.start or path in self.positions)
+
+    def _next_position(self):
+        # Сначала история впереди курсора (после шагов назад)
+        position = self.cursor + 1
+        while position < self.drawn and not self._is_live(position):
+            position += 1
+        if position < self.drawn:
+            return position
+
+        if not self.positions:
+            return None
+        if self.drawn >= len(self.order):
+            self._new_round()
+        self._swap(self._pick(), self.drawn)
+        self.drawn += 1
+        return self.drawn - 1
+
+    def _pick(self):
+        """Случайная позиция пула (не текущий трек); с весами — выборка с отказами"""
+        start, end = self.drawn, len(self.order)
+        current = self.current
+        position = self.rng.randrange(start, end)
+        for _ in range(MAX_WEIGHTED_TRIES):
+            path = self.order[position]
+            if path == current and end - start > 1:
+                pass
+            elif self.weight is None or self.rng.random() < max(self.weight(path), MIN_WEIGHT):
+                break
+            position = self.rng.randrange(start, end)
+        return position
+
+    def _new_round(self):
+        """Все треки сыграны: пул снова из всех треков.
+
+        История этого круга остается для шагов назад, более старые круги
+        отбрасываются. Текущий трек не выбирается первым, поэтому на стыке
+        кругов он не повторится сразу.
+        """
+        self._compact()
+        history = self.order[self.start:self.drawn]
+        live = self.order[self.start:]
+        self.cursor = max(self.cursor - self.start, -1)
+        self.order = history + live
+        self.start = self.drawn = len(history)
+        self.positions = {path: self.start + i for i, path in enumerate(live)}
+
+    def _compact(self):
+        """Убирает дыры и удаленные треки из истории; курсор остается на том же треке"""
+        order = []
+        start = drawn = cursor = 0
+        for position, path in enumerate(self.order):
+            if not self._is_live(position):
+                continue
+            order.append(path)
+            start += position < self.start
+            drawn += position < self.drawn
+            cursor += position <= self.cursor
+        self.order = order
+        self.start = start
+        self.drawn = drawn
+        self.cursor = cursor - 1
+        self.positions = {path: i for i, path in enumerate(order) if i >= start}
+        self.holes = 0
+
+    def _swap(self, a, b):
+        order = self.order
+        order[a], order[b] = order[b], order[a]
+        self.positions[order[a]] = a
+        self.positions[order[b]] = b
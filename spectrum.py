@@ -0,0 +1,123 @@
+import threading
+
+from audio_decode import decode_pcm, np
+from batch_analyzer import DecodeWorker
+
+
+# Параметры анализа
+FFT_SIZE = 2048
+NUM_BANDS = 30
+MIN_FREQ = 40.0
+MAX_FREQ = 16000.0
+FLOOR_DB = -60.0
+FRAME_INTERVAL = 1 / 30
+
+# Сглаживание: полосы быстро поднимаются и медленно опадают
+ATTACK = 0.6
+DECAY = 0.15
+
+
+class SpectrumAnalyzer:
+    """Спектр играющего трека по декодированному PCM.
+
+    Трек декодируется целиком в отдельном процессе (DecodeWorker), затем
+    окно FFT_SIZE сэмплов вокруг текущей позиции раскладывается через
+    numpy FFT на логарифмические полосы. UI только читает готовые уровни (0..1).
+    Пока анализатор не активен (визуализатор скрыт или пауза), поток спит.
+    """
+
+    def __init__(self, get_position, num_bands=NUM_BANDS):
+        self.get_position = get_position
+        self.num_bands = num_bands
+        self.levels = np.zeros(num_bands, dtype=np.float32)
+
+        self._path = None
+        self._pcm = None
+        self._sample_rate = 0
+        self._band_edges = None
+        self._window = np.hanning(FFT_SIZE).astype(np.float32)
+
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._stop = threading.Event()
+        self._load_request = None
+        self._decoder = DecodeWorker()
+        self._thread = threading.Thread(target=self._run, name="spectrum", daemon=True)
+        self._thread.start()
+
+    def load(self, path):
+        """Запрашивает декодирование нового трека (выполняется в рабочем потоке)"""
+        with self._lock:
+            if path == self._path:
+                return
+            self._path = path
+            self._pcm = None
+            self._load_request = path
+        self._active.set()
+
+    def set_active(self, active):
+        if active:
+            self._active.set()
+        else:
+            self._active.clear()
+
+    def stop(self):
+        self._stop.set()
+        self._active.set()
+        self._decoder.close()
+
+    def _band_edges_for(self, sample_rate):
+        """Границы логарифмических полос в индексах бинов FFT"""
+        freqs = np.geomspace(MIN_FREQ, min(MAX_FREQ, sample_rate / 2), self.num_bands + 1)
+        edges = np.round(freqs * FFT_SIZE / sample_rate).astype(np.int64)
+        # Каждая полоса — хотя бы один бин (границы строго возрастают)
+        steps = np.arange(len(edges))
+        edges = np.maximum.accumulate(np.maximum(edges, 1) - steps) + steps
+        return np.minimum(edges, FFT_SIZE // 2)
+
+    def _decode(self, path):
+        try:
+            pcm, sample_rate = self._decoder.run(decode_pcm, path)
+        except Exception as e:
+            print(f"Визуализатор: не удалось декодировать {path}: {e}")
+            pcm, sample_rate = None, 0
+        with self._lock:
+            # Пока декодировали, могли переключить трек
+            if self._path == path:
+                self._pcm = pcm
+                self._sample_rate = sample_rate
+                if pcm is not None:
+                    self._band_edges = self._band_edges_for(sample_rate)
+
+    def _analyze(self, pcm, sample_rate, edges):
+        start = int(self.get_position() * sample_rate)
+        frame = pcm[start:start + FFT_SIZE]
+        if len(frame) < FFT_SIZE:
+            frame = np.pad(frame, (0, FFT_SIZE - len(frame)))
+
+        magnitude = np.abs(np.fft.rfft(frame * self._window)) / (FFT_SIZE / 4)
+        bands = np.maximum.reduceat(magnitude[:edges[-1]], edges[:-1])
+        db = 20 * np.log10(np.maximum(bands, 1e-9))
+        target = np.clip((db - FLOOR_DB) / -FLOOR_DB, 0, 1).astype(np.float32)
+
+        rate = np.where(target > self.levels, ATTACK, DECAY).astype(np.float32)
+        # Новый массив целиком, чтобы UI не увидел наполовину обновленные уровни
+        self.levels = self.levels + (target - self.levels) * rate
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._active.wait()
+            if self._stop.is_set():
+                break
+
+            with self._lock:
+                request, self._load_request = self._load_request, None
+            if request is not None:
+                self._decode(request)
+
+            with self._lock:
+                pcm, sample_rate, edges = self._pcm, self._sample_rate, self._band_edges
+
+            if pcm is not None:
+                self._analyze(pcm, sample_rate, edges)
+            self._stop.wait(FRAME_INTERVAL)
@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+
+from control_server import MAX_BODY_BYTES, BadRequest, _read_request
+
+
+def read(data):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await _read_request(reader)
+    return asyncio.run(run())
+
+
+def test_request_with_body():
+    method, target, headers, body = read(
+        b"post /api/volume HTTP/1.1\r\nContent-Length: 4\r\nX-A: b\r\n\r\n{}{}")
+    assert (method, target, body) == ("POST", "/api/volume", b"{}{}")
+    assert headers['x-a'] == "b"
+    assert read(b"GET / HTTP/1.1\r\n\r\n")[3] == b''
+
+
+@pytest.mark.parametrize("length", ["abc", "-1", "1.5", str(MAX_BODY_BYTES + 1)])
+def test_bad_content_length(length):
+    with pytest.raises(BadRequest):
+        read(f"POST / HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode())
+
+
+def test_closed_or_garbled_connection():
+    assert read(b"") is None
+    assert read(b"GET /\r\n\r\n") is None
@@ -0,0 +1,24 @@
+import math
+import time
+
+import pytest
+
+from batch_analyzer import DecodeWorker
+
+
+def test_runs_in_child_and_shuts_down_when_idle():
+    worker = DecodeWorker(idle_shutdown=0.1)
+    try:
+        assert worker.run(math.sqrt, 16.0) == 4.0
+        with pytest.raises(ValueError):
+            worker.run(math.sqrt, -1.0)
+        deadline = time.monotonic() + 10
+        while worker._executor is not None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert worker._executor is None
+        # После простоя процесс создается заново
+        assert worker.run(math.sqrt, 9.0) == 3.0
+    finally:
+        worker.close()
+    with pytest.raises(RuntimeError):
+        worker.run(math.sqrt, 4.0)
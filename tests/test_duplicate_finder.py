@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+import file_hash
+from duplicate_finder import DuplicateFinder, _group, song_name
+from file_hash import FileHashStore, partial_hash
+
+
+@pytest.fixture
+def hashes(tmp_path):
+    store = FileHashStore(str(tmp_path / "hashes.db"))
+    yield store
+    store.close()
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def run(finder):
+    finder.start()
+    finder._thread.join()
+    assert finder.done
+    return finder
+
+
+def test_group():
+    assert _group([1, 2, 3, 4, 5], lambda x: x % 2 or None) == [[1, 3, 5]]
+    assert _group(["a", "b"], lambda x: x) == []
+
+
+def test_song_name():
+    assert song_name("/m/03 - Hey Jude.mp3", None) == "hey jude"
+    assert song_name("/m/x.mp3", {'title': 'Hey Jude', 'artist': 'The Beatles'}) == "the beatles hey jude"
+
+
+def test_identical_files_are_grouped(tmp_path, hashes, monkeypatch):
+    monkeypatch.setattr(file_hash, 'HASH_BLOCK', 16)
+    body = bytes(range(256)) * 4
+    same = [write(tmp_path / "a.mp3", body), write(tmp_path / "b.mp3", body)]
+    # Тот же размер, начало и конец — различие только в середине
+    middle = bytearray(body)
+    middle[500] ^= 0xFF
+    other = write(tmp_path / "c.mp3", bytes(middle))
+    write(tmp_path / "empty1.mp3", b"")
+    write(tmp_path / "empty2.mp3", b"")
+    paths = same + [other, str(tmp_path / "empty1.mp3"), str(tmp_path / "empty2.mp3"),
+                    str(tmp_path / "gone.mp3")]
+
+    assert partial_hash(other) == partial_hash(same[0])
+    finder = run(DuplicateFinder(paths + same, hashes, workers=2))
+    assert finder.groups == [sorted(same)]
+    assert finder.similar == []
+
+
+def test_hashes_are_reused_until_file_changes(tmp_path, hashes, monkeypatch):
+    a = write(tmp_path / "a.mp3", b"x" * 100)
+    write(tmp_path / "b.mp3", b"x" * 100)
+    run(DuplicateFinder([a, str(tmp_path / "b.mp3")], hashes))
+    assert hashes.peek(a) is not None
+
+    calls = []
+    monkeypatch.setattr(file_hash, 'full_hash', lambda path: calls.append(path))
+    run(DuplicateFinder([a, str(tmp_path / "b.mp3")], hashes))
+    assert calls == []
+
+    hashes.rename(a, str(tmp_path / "moved.mp3"))
+    assert hashes.peek(a) is None
+    assert hashes.peek(str(tmp_path / "moved.mp3")) is not None
+
+
+def test_similar_tracks(tmp_path, hashes):
+    def entry(duration, tempo=120.0, key=5, loudness=-10.0):
+        return {'duration': duration, 'tempo': tempo, 'key': key, 'loudness': loudness}
+
+    files = {name: write(tmp_path / name, name.encode() * 10) for name in
+             ("01 Song.mp3", "Song.flac", "Song live.mp3", "Other.mp3", "02 Song.ogg")}
+    features = {
+        files["01 Song.mp3"]: entry(200.0),
+        files["Song.flac"]: entry(200.5, tempo=120.4, loudness=-11.0),
+        files["02 Song.ogg"]: entry(203.0),
+        files["Song live.mp3"]: entry(200.2),
+        files["Other.mp3"]: entry(200.1),
+    }
+    finder = run(DuplicateFinder(list(files.values()), hashes,
+                                 features=features, info=lambda path: None))
+    assert finder.groups == []
+    assert finder.similar == [sorted([files["01 Song.mp3"], files["Song.flac"]])]
+
+
+def test_cancel(tmp_path, hashes):
+    paths = [write(tmp_path / f"{i}.mp3", b"same") for i in range(3)]
+    finder = DuplicateFinder(paths, hashes)
+    finder.cancel()
+    run(finder)
+    assert finder.groups == []
+    assert os.path.exists(paths[0])
@@ -0,0 +1,30 @@
+from library_store import LibraryStore
+from metadata_cache import MetadataCache
+
+
+def test_compact_prunes_metadata_of_removed_tracks(tmp_path):
+    paths = []
+    for name in ("a.mp3", "b.mp3", "c.mp3"):
+        (tmp_path / name).write_bytes(b"not audio")
+        paths.append(str(tmp_path / name))
+
+    library = LibraryStore(str(tmp_path / "data"))
+    library.load()
+    library.add_tracks("main", paths[:2])
+    library.create_playlist("rock", paths[1:])
+    for path in paths:
+        library.track_info(path)
+    assert len(library.metadata_cache) == 3
+
+    library.remove_track("main", paths[0])
+    library.remove_track("rock", paths[1])
+    library.compact()
+    # b.mp3 еще в main
+    assert library.metadata_cache.peek(paths[0]) is None
+    assert library.metadata_cache.peek(paths[1]) is not None
+
+    library.remove_track("rock", paths[2])
+    library.close()
+    cache = MetadataCache(str(tmp_path / "data" / "metadata.db"))
+    assert cache.peek(paths[2]) is None and len(cache) == 1
+    cache.close()
@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+import pytest
+
+from loudness import (REFERENCE_LUFS, LoudnessStore, _biquad_response, k_weighting,
+                      measure_loudness, track_gain)
+
+
+RATE = 48000
+
+
+def sine(amplitude, seconds, freq=997.0, rate=RATE):
+    t = np.arange(int(seconds * rate)) / rate
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)[:, np.newaxis]
+
+
+def test_k_weighting_matches_bs1770_table():
+    freqs = np.array([20.0, 100.0, 997.0, 5000.0, 15000.0])
+    shelf = _biquad_response((1.53512485958697, -2.69169618940638, 1.19839281085285),
+                             (1.0, -1.69065929318241, 0.73248077421585), freqs, RATE)
+    highpass = _biquad_response((1.0, -2.0, 1.0),
+                                (1.0, -1.99004745483398, 0.99007225036621), freqs, RATE)
+    assert k_weighting(freqs, RATE) == pytest.approx(shelf * highpass, rel=1e-9)
+
+
+@pytest.mark.parametrize("rate", [44100, 48000])
+def test_full_scale_sine_is_minus_3_lufs(rate):
+    integrated, peak = measure_loudness(sine(1.0, 5, rate=rate), rate)
+    assert integrated == pytest.approx(-3.01, abs=0.05)
+    assert peak == pytest.approx(1.0, abs=1e-6)
+
+
+def test_channels_add_up():
+    mono = sine(0.1, 5)
+    integrated, _ = measure_loudness(np.hstack([mono, mono]), RATE)
+    assert integrated == pytest.approx(-20.0, abs=0.05)
+
+
+def test_absolute_gate_ignores_silence():
+    loud, _ = measure_loudness(sine(0.1, 5), RATE)
+    padded = np.vstack([sine(0.1, 5), np.zeros((RATE * 30, 1), np.float32)])
+    gated, _ = measure_loudness(padded, RATE)
+    # Только блоки на стыке захватывают часть тишины
+    assert gated == pytest.approx(loud, abs=0.2)
+
+
+def test_relative_gate_ignores_quiet_part():
+    loud, _ = measure_loudness(sine(0.1, 5), RATE)
+    # Тихая часть на 30 дБ ниже — выше абсолютного порога, но ниже относительного
+    mixed, _ = measure_loudness(np.vstack([sine(0.1, 5), sine(0.00316, 20)]), RATE)
+    assert mixed == pytest.approx(loud, abs=0.2)
+    # Без стробирования средняя мощность упала бы на ~7 дБ
+    assert mixed > loud - 1
+
+
+def test_silence_and_short_input():
+    assert measure_loudness(np.zeros((RATE * 2, 1), np.float32), RATE) == (None, 0.0)
+    assert measure_loudness(sine(1.0, 0.2), RATE)[0] is None
+
+
+def test_track_gain():
+    assert track_gain(None, 0.5) == 1.0
+    assert track_gain(REFERENCE_LUFS, 0.5) == pytest.approx(1.0)
+    assert track_gain(REFERENCE_LUFS + 6, 0.1) == pytest.approx(10 ** (-6 / 20))
+    # Тихий трек поднимается, но пик не выходит за полную шкалу
+    assert track_gain(REFERENCE_LUFS - 20, 0.5) == pytest.approx(2.0)
+
+
+def test_store(tmp_path):
+    path = tmp_path / "a.wav"
+    path.write_bytes(b"data")
+    st = os.stat(path)
+    db_path = str(tmp_path / "loudness.db")
+
+    store = LoudnessStore(db_path)
+    assert store.gain_for(str(path)) == 1.0
+    store.put({'path': str(path), 'mtime': st.st_mtime_ns, 'size': st.st_size,
+               'integrated': REFERENCE_LUFS + 6, 'peak': 0.1})
+    store.close()
+
+    store = LoudnessStore(db_path)
+    assert store.is_current(str(path), st)
+    assert store.gain_for(str(path)) == pytest.approx(10 ** (-6 / 20))
+    path.write_bytes(b"changed data")
+    assert not store.is_current(str(path), os.stat(path))
+    store.close()
@@ -0,0 +1,172 @@
+import pytest
+
+import mix_engine
+from mix_engine import CROSSFADE_CURVES, MixEngine
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def start(self):
+        pass
+
+    def pause(self):
+        pass
+
+    def resume(self):
+        pass
+
+    def position(self):
+        return self.now
+
+
+class FakeEvent:
+    """Event для потока микса: ожидание двигает часы, а не спит"""
+
+    def __init__(self, clock, on_tick):
+        self.clock = clock
+        self.on_tick = on_tick
+        self.flag = False
+
+    def is_set(self):
+        return self.flag
+
+    def set(self):
+        self.flag = True
+
+    def wait(self, timeout):
+        self.clock.now = round(self.clock.now + timeout, 6)
+        self.on_tick(self.clock.now)
+        return self.flag
+
+
+class FakeChannel:
+    def __init__(self, index):
+        self.index = index
+        self.sound = None
+        self.volume = None
+
+    def play(self, sound):
+        self.sound = sound
+
+    def stop(self):
+        self.sound = None
+
+    def set_volume(self, volume):
+        self.volume = volume
+
+    def pause(self):
+        pass
+
+    def unpause(self):
+        pass
+
+    def fadeout(self, ms):
+        self.sound = None
+
+
+class FakeSound:
+    def __init__(self, name, length=100.0):
+        self.name = name
+        self.length = length
+
+    def get_length(self):
+        return self.length
+
+
+@pytest.fixture
+def make_engine(monkeypatch):
+    monkeypatch.setattr(mix_engine.pygame.mixer, 'set_reserved', lambda count: count)
+    monkeypatch.setattr(mix_engine.pygame.mixer, 'Channel', FakeChannel)
+
+    def make(tracks, skips=(), **kwargs):
+        engine = MixEngine(tracks, crossfade=4.0, segment=(10.0, 10.0), step=0.5, **kwargs)
+        clock = FakeClock()
+        skips = sorted(skips)
+
+        def on_tick(now):
+            while skips and skips[0] <= now:
+                skips.pop(0)
+                engine.skip()
+
+        engine._timeline = clock
+        engine._stop = FakeEvent(clock, on_tick)
+        queue = list(tracks)
+
+        def decode_next():
+            if not queue:
+                engine._stop.set()
+                return None, None
+            path = queue.pop(0)
+            return path, FakeSound(path)
+
+        engine._decode_next = decode_next
+        engine.clock = clock
+        return engine
+
+    return make
+
+
+def track_events(engine):
+    events = []
+    while not engine.events.empty():
+        events.append(engine.events.get())
+    return events
+
+
+def test_segments_and_crossfade_timing(make_engine):
+    engine = make_engine(["/a", "/b", "/c"])
+    engine._run()
+    assert track_events(engine) == [('track', "/a", None), ('track', "/b", 14.0),
+                                    ('track', "/c", 14.0)]
+    # /b начался вместе с переходом в 10 с, /c — в 20 с
+    assert engine._track_started == 20.0
+    assert engine._channels[0].sound.name == "/c"
+    assert engine._channels[1].sound is None
+
+
+def test_skip_during_crossfade_is_not_carried_over(make_engine):
+    engine = make_engine(["/a", "/b", "/c", "/d"], skips=[11.0])
+    starts = []
+    original = engine._crossfade
+
+    def crossfade(sound, gain):
+        starts.append(engine.clock.now)
+        return original(sound, gain)
+
+    engine._crossfade = crossfade
+    engine._run()
+    # Пропуск в середине первого перехода завершил его, но не сократил /b
+    assert starts == [10.0, 20.0, 30.0]
+    events = track_events(engine)
+    assert [event[1] for event in events] == ["/a", "/b", "/c", "/d"]
+    assert events[1][2] == 11.0
+
+
+def test_skip_while_playing_starts_transition(make_engine):
+    engine = make_engine(["/a", "/b", "/c"], skips=[3.0])
+    engine._run()
+    events = track_events(engine)
+    assert events[1] == ('track', "/b", 7.0)
+
+
+def test_stop_during_crossfade(make_engine):
+    engine = make_engine(["/a", "/b", "/c"])
+
+    def stop_at(now):
+        if now >= 12.0:
+            engine._stop.set()
+
+    engine._stop.on_tick = stop_at
+    engine._run()
+    assert [event[1] for event in track_events(engine)] == ["/a"]
+
+
+@pytest.mark.parametrize("curve", sorted(CROSSFADE_CURVES))
+def test_curves(curve):
+    function = CROSSFADE_CURVES[curve]
+    assert function(0) == pytest.approx((1, 0))
+    assert function(1) == pytest.approx((0, 1), abs=1e-9)
+    out_half, in_half = function(0.5)
+    assert out_half == pytest.approx(in_half)
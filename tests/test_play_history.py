@@ -0,0 +1,91 @@
+import datetime
+import sqlite3
+import time
+
+import pytest
+
+from play_history import PlayHistory
+
+
+DAY = 24 * 3600
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = PlayHistory(str(tmp_path / "history.db"))
+    yield history
+    history.close()
+
+
+def test_rollups(history):
+    # Полдень сегодня: соседние прослушивания не попадут во вчерашний день
+    now = datetime.datetime.combine(datetime.date.today(), datetime.time(12)).timestamp()
+    history.record("/a.mp3", now - 2 * DAY, 200, 200, completed=True)
+    history.record("/a.mp3", now - 60, 30, 200)
+    history.record("/b.mp3", now - 30, 150, 200)
+    history.flush()
+
+    assert history.total_plays == 3 and history.total_skips == 1
+    assert history.skip_rate() == pytest.approx(1 / 3)
+    assert history.skip_rate(days=1) == pytest.approx(1 / 2)
+    assert history.top_tracks() == [("/a.mp3", 2, 1, 230.0), ("/b.mp3", 1, 0, 150.0)]
+    assert sorted(history.top_tracks(days=1)) == [("/a.mp3", 1, 1, 30.0), ("/b.mp3", 1, 0, 150.0)]
+
+    assert history.plays_per_day(days=7) == [
+        (datetime.date.fromtimestamp(now - 2 * DAY), 1, 0, 200.0),
+        (datetime.date.today(), 2, 1, 180.0)]
+    assert [path for path, *_ in history.recent(2)] == ["/b.mp3", "/a.mp3"]
+    assert history.recent(1)[0][3] is False
+
+    # Итоги в памяти совпадают с базой после перезапуска
+    reopened = PlayHistory(history.db_path)
+    assert (reopened.total_plays, reopened.total_skips) == (3, 1)
+    reopened.close()
+
+
+def test_rename(history):
+    now = time.time()
+    history.record("/a.mp3", now, 100, 100, completed=True)
+    history.rename("/a.mp3", "/x.mp3")
+    history.record("/x.mp3", now + 1, 100, 100, completed=True)
+    history.flush()
+    assert history.track_stats("/a.mp3") is None
+    assert history.track_stats("/x.mp3")[:3] == (2, 0, 200.0)
+
+
+def test_rename_onto_path_with_history_merges(history):
+    now = time.time()
+    history.record("/a.mp3", now - 10, 100, 100, completed=True)
+    history.record("/a.mp3", now - 5, 10, 100)
+    history.record("/b.mp3", now, 50, 100, completed=True)
+    history.flush()
+
+    history.rename("/a.mp3", "/b.mp3")
+    history.flush()
+    assert history.track_stats("/a.mp3") is None
+    assert history.track_stats("/b.mp3") == (3, 1, 160.0, now)
+    assert history.top_tracks(days=1) == [("/b.mp3", 3, 1, 160.0)]
+    assert {path for path, *_ in history.recent()} == {"/b.mp3"}
+    assert history.total_plays == 3
+
+
+def test_failed_batch_rolls_back_totals(history, monkeypatch):
+    history.record("/a.mp3", time.time(), 100, 100, completed=True)
+    history.flush()
+
+    def fail(conn, track_ids, batch):
+        conn.execute("INSERT INTO tracks (path) VALUES ('/partial.mp3')")
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(history, '_write', fail)
+    history.record("/b.mp3", time.time(), 1, 100)
+    history.flush()
+    assert (history.total_plays, history.total_skips) == (1, 0)
+
+    monkeypatch.undo()
+    history.record("/c.mp3", time.time(), 100, 100, completed=True)
+    history.flush()
+    assert history.total_plays == 2
+    assert {path for path, *_ in history.top_tracks()} == {"/a.mp3", "/c.mp3"}
+    assert history._conn.execute(
+        "SELECT COUNT(*) FROM tracks WHERE path = '/partial.mp3'").fetchone()[0] == 0
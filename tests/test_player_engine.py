@@ -0,0 +1,116 @@
+import os
+import wave
+
+import pytest
+
+from control_server import CommandError, engine_handlers
+from library_store import LibraryStore
+from player_engine import PlayerEngine
+
+
+def write_wav(path, seconds=0.5, rate=22050):
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(b"\0\0" * int(seconds * rate))
+    return str(path)
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setenv('SDL_AUDIODRIVER', 'dummy')
+    monkeypatch.setenv('SDL_VIDEODRIVER', 'dummy')
+    library = LibraryStore(str(tmp_path / "data"))
+    library.load()
+    tracks = [write_wav(tmp_path / f"{i:02d}.wav") for i in range(10)]
+    library.create_playlist("big", tracks)
+    library.create_playlist("small", tracks[:3])
+    engine = PlayerEngine(library)
+    engine.errors = []
+    engine.listeners.append(
+        lambda event, data: event == 'error' and engine.errors.append(data))
+    engine.select_playlist("big")
+    yield engine
+    engine.close()
+    library.close()
+
+
+def test_select_smaller_playlist_then_play(engine):
+    engine.play_index(6)
+    engine.stop()
+    engine.select_playlist("small")
+    assert engine.current_song_index == 0
+    engine.play_pause()
+    assert engine.playing and not engine.errors
+    assert engine.current_path == engine.playlist[0]
+
+
+def test_select_keeps_playing_track_index(engine):
+    engine.play_index(2)
+    playing = engine.current_path
+    engine.select_playlist("small")
+    assert engine.playlist[engine.current_song_index] == playing
+    assert engine.queued_path == engine.playlist[(engine.current_song_index + 1) % 3]
+
+
+def test_clear_then_add_then_play(engine, tmp_path):
+    engine.play_index(6)
+    engine.clear_playlist()
+    assert engine.current_song_index == 0
+    new = [write_wav(tmp_path / "x.wav"), write_wav(tmp_path / "y.wav")]
+    engine.library.add_tracks("big", new)
+    engine.play_pause()
+    assert engine.playing and not engine.errors
+    assert engine.current_path == new[0]
+
+
+def test_removals_keep_current_and_queue(engine):
+    engine.play_index(5)
+    playing = engine.current_path
+    assert engine.queued_path == engine.playlist[6]
+    queued = engine.queued_path
+
+    engine.remove_track(engine.playlist[1])
+    assert engine.playlist[engine.current_song_index] == playing
+    assert engine.queued_path == queued
+
+    # Удаление не через движок (наблюдатель папок) тоже сдвигает индексы
+    engine.library.remove_tracks("big", [engine.playlist[0], queued])
+    assert engine.playlist[engine.current_song_index] == playing
+    assert engine.queued_path == engine.playlist[engine.current_song_index + 1]
+
+
+def test_removing_last_track_while_stopped_clamps(engine):
+    engine.play_index(9)
+    engine.stop()
+    engine.remove_track(engine.playlist[9])
+    assert engine.current_song_index == 0
+
+
+def test_next_prev_and_repeat(engine):
+    engine.play_index(9)
+    engine.next_song()
+    assert engine.current_song_index == 0
+    engine.prev_song()
+    assert engine.current_song_index == 9
+    engine.set_repeat(True)
+    assert engine.choose_next_index() == 9
+
+
+def test_shuffle_weighting_command(engine):
+    modes = []
+    engine.listeners.append(lambda event, data: event == 'modes' and modes.append(data))
+    handlers = engine_handlers(engine, engine.library)
+    engine.play_index(0)
+
+    result = handlers['shuffle']({'enabled': True, 'weighting': 'plays'})
+    assert result['shuffle'] and result['shuffle_weighting'] == 'plays'
+    assert engine.shuffle.weight is not None
+    assert modes[-1]['weighting'] == 'plays'
+
+    with pytest.raises(CommandError):
+        handlers['shuffle']({'weighting': 'loud'})
+    assert handlers['shuffle']({'weighting': None})['shuffle_weighting'] is None
+    assert engine.shuffle.weight is None
+    assert handlers['repeat']({'enabled': True})['repeat']
@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+from playlist_formats import (ExistenceChecker, PlaylistImporter, iter_playlist,
+                              resolve_location, write_playlist)
+
+
+TRICKY_NAMES = [
+    "100% hits.mp3",
+    "100%25 literal.mp3",
+    "with space & amp.mp3",
+    "Кино — Группа крови.flac",
+    "#hash first.ogg",
+]
+
+
+@pytest.fixture
+def music(tmp_path):
+    folder = tmp_path / "music" / "Артист 50%"
+    folder.mkdir(parents=True)
+    paths = []
+    for name in TRICKY_NAMES:
+        path = folder / name
+        path.write_bytes(b"")
+        paths.append(str(path))
+    return paths
+
+
+@pytest.mark.parametrize("ext", ["m3u", "m3u8", "pls", "xspf"])
+@pytest.mark.parametrize("relative", [True, False])
+def test_round_trip(tmp_path, music, ext, relative):
+    playlist = tmp_path / "lists" / f"out.{ext}"
+    playlist.parent.mkdir()
+    write_playlist(str(playlist), music, relative=relative)
+    assert list(iter_playlist(str(playlist))) == music
+
+
+def test_file_uri_is_decoded_once(tmp_path):
+    location = "file:///music/100%2525%20hits.mp3"
+    assert resolve_location(location, str(tmp_path)) == "/music/100%25 hits.mp3"
+    assert resolve_location("file:///music/100%25%20hits.mp3", str(tmp_path)) == "/music/100% hits.mp3"
+
+
+def test_streams_are_skipped(tmp_path):
+    assert resolve_location("http://radio.example/stream", str(tmp_path)) is None
+
+
+def test_m3u_windows_paths_and_legacy_encoding(tmp_path, music):
+    playlist = tmp_path / "lists" / "old.m3u"
+    playlist.parent.mkdir()
+    line = "..\\music\\Артист 50%\\Кино — Группа крови.flac"
+    playlist.write_bytes(b"#EXTM3U\r\n" + line.encode("cp1251") + b"\r\n")
+    assert list(iter_playlist(str(playlist))) == [music[3]]
+
+
+def test_m3u_with_bom_and_extinf(tmp_path, music):
+    playlist = tmp_path / "list.m3u8"
+    playlist.write_bytes(b"\xef\xbb\xbf#EXTM3U\n#EXTINF:10,Title\n" + music[0].encode() + b"\n\n")
+    assert list(iter_playlist(str(playlist))) == [music[0]]
+
+
+def test_unknown_extension(tmp_path):
+    with pytest.raises(ValueError):
+        iter_playlist(str(tmp_path / "list.txt"))
+
+
+def test_export_info(tmp_path, music):
+    playlist = tmp_path / "list.m3u8"
+    info = {music[0]: {'ok': 1, 'title': 'Song', 'artist': 'Band', 'duration': 61.7}}
+    write_playlist(str(playlist), music[:1], info=info.get, relative=False)
+    lines = playlist.read_text(encoding='utf-8').splitlines()
+    assert lines == ['#EXTM3U', '#EXTINF:61,Band - Song', music[0]]
+
+
+def test_existence_checker(music):
+    checker = ExistenceChecker(cache_size=1)
+    missing = os.path.join(os.path.dirname(music[0]), "nope.mp3")
+    found, gone = checker.filter(music + [missing, "/no/such/dir/a.mp3"])
+    assert found == music
+    assert gone == [missing, "/no/such/dir/a.mp3"]
+
+
+def test_importer_reports_missing(tmp_path, music):
+    playlist = tmp_path / "list.m3u8"
+    write_playlist(str(playlist), music + [str(tmp_path / "gone.mp3")])
+    importer = PlaylistImporter(str(playlist), batch_size=2)
+    importer.start()
+    importer._thread.join()
+    assert importer.done and importer.error is None
+    assert importer.take_results() == music
+    assert importer.read == len(music) + 1
+    assert importer.missing == 1
+
+
+def test_importer_error(tmp_path):
+    playlist = tmp_path / "broken.xspf"
+    playlist.write_text("<playlist><trackList><track>", encoding='utf-8')
+    importer = PlaylistImporter(str(playlist))
+    importer.start()
+    importer._thread.join()
+    assert importer.done and importer.error is not None
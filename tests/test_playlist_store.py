@@ -0,0 +1,150 @@
+import json
+
+import pytest
+
+from playlist_store import PlaylistStore
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "playlists.json"), str(tmp_path / "playlists.journal")
+
+
+def open_store(paths):
+    store = PlaylistStore(*paths)
+    store.load()
+    return store
+
+
+def reopen(store, paths):
+    """Закрывает журнал без сворачивания — как при аварийном выходе"""
+    store._journal.close()
+    store._journal = None
+    return open_store(paths)
+
+
+def test_journal_is_replayed(paths):
+    store = open_store(paths)
+    store.create("rock", ["/a.mp3", "/b.mp3", "/c.mp3"])
+    store.add_tracks("rock", ["/d.mp3", "/a.mp3"])
+    store.remove_track("rock", "/b.mp3")
+    store.remove_tracks("rock", ["/c.mp3", "/missing.mp3"])
+    store.rename_track("/a.mp3", "/x.mp3")
+    store.replace_tracks("rock", [("/d.mp3", "/e.mp3")])
+    store.create("empty")
+    store.delete("empty")
+
+    store = reopen(store, paths)
+    assert list(store.playlists["rock"]) == ["/x.mp3", "/e.mp3"]
+    assert "empty" not in store.playlists
+    assert list(store.playlists["main"]) == []
+
+
+def test_compact_then_replay(paths):
+    store = open_store(paths)
+    store.create("rock", ["/a.mp3", "/b.mp3"])
+    store.compact()
+    store.add_tracks("rock", ["/c.mp3"])
+
+    store = reopen(store, paths)
+    assert list(store.playlists["rock"]) == ["/a.mp3", "/b.mp3", "/c.mp3"]
+
+
+def test_journal_of_old_generation_is_ignored(paths):
+    snapshot_path, journal_path = paths
+    store = open_store(paths)
+    store.create("rock", ["/a.mp3"])
+    store.close()
+    generation = store.generation
+
+    # Сбой между записью снимка и очисткой журнала: журнал прошлого поколения
+    with open(journal_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'op': 'base', 'generation': generation - 1}) + "\n")
+        f.write(json.dumps({'op': 'add', 'name': 'rock', 'tracks': ['/stale.mp3']}) + "\n")
+
+    store = open_store(paths)
+    assert list(store.playlists["rock"]) == ["/a.mp3"]
+    assert store.generation == generation + 1
+    with open(journal_path, encoding='utf-8') as f:
+        assert json.loads(f.readline()) == {'op': 'base', 'generation': generation + 1}
+
+
+def test_torn_last_line_is_dropped(paths):
+    snapshot_path, journal_path = paths
+    store = open_store(paths)
+    store.create("rock", ["/a.mp3"])
+    store._journal.write('{"op":"add","name":"rock","tra')
+    store._journal.flush()
+
+    store = reopen(store, paths)
+    assert list(store.playlists["rock"]) == ["/a.mp3"]
+    with open(journal_path, encoding='utf-8') as f:
+        assert f.read().endswith("\n")
+
+
+def test_legacy_snapshot_is_migrated(paths):
+    snapshot_path, journal_path = paths
+    with open(snapshot_path, 'w', encoding='utf-8') as f:
+        json.dump({"rock": ["/a.mp3", "/b.mp3"]}, f)
+
+    store = open_store(paths)
+    assert list(store.playlists["rock"]) == ["/a.mp3", "/b.mp3"]
+    with open(snapshot_path, encoding='utf-8') as f:
+        assert json.load(f)['version'] == 3
+
+
+def test_corrupt_snapshot_is_kept_aside(paths, tmp_path):
+    snapshot_path, journal_path = paths
+    with open(snapshot_path, 'w', encoding='utf-8') as f:
+        f.write("{broken")
+
+    store = open_store(paths)
+    assert store.recovered_from is not None
+    with open(store.recovered_from, encoding='utf-8') as f:
+        assert f.read() == "{broken"
+
+
+def test_rename_onto_stale_interned_path(paths):
+    store = open_store(paths)
+    store.create("rock", ["/a.mp3", "/b.mp3"])
+    # /b.mp3 удален, но его путь остался в таблице
+    store.remove_track("rock", "/b.mp3")
+    assert store.table.id_of("/b.mp3") is not None
+
+    assert store.rename_track("/a.mp3", "/b.mp3")
+    assert list(store.playlists["rock"]) == ["/b.mp3"]
+
+    store = reopen(store, paths)
+    assert list(store.playlists["rock"]) == ["/b.mp3"]
+
+
+def test_rename_onto_track_in_playlist_is_refused(paths):
+    store = open_store(paths)
+    store.create("rock", ["/a.mp3"])
+    store.create("jazz", ["/b.mp3"])
+    assert not store.rename_track("/a.mp3", "/b.mp3")
+    assert not store.rename_track("/missing.mp3", "/c.mp3")
+    assert list(store.playlists["rock"]) == ["/a.mp3"]
+
+
+def test_listeners(paths):
+    store = open_store(paths)
+    events = []
+    store.listeners.append(lambda *event: events.append(event))
+    store.create("rock", ["/a.mp3"])
+    store.rename_track("/a.mp3", "/b.mp3")
+    assert events == [("create", "rock", ["/a.mp3"], []),
+                      ("rename", None, ["/b.mp3"], ["/a.mp3"])]
+
+
+def test_snapshot_keeps_only_used_paths(paths):
+    snapshot_path, journal_path = paths
+    store = open_store(paths)
+    store.create("rock", ["/a.mp3", "/b.mp3", "/c.mp3"])
+    store.remove_track("rock", "/b.mp3")
+    store.close()
+    with open(snapshot_path, encoding='utf-8') as f:
+        assert json.load(f)['tracks'] == ["/a.mp3", "/c.mp3"]
+
+    store = open_store(paths)
+    assert list(store.playlists["rock"]) == ["/a.mp3", "/c.mp3"]
@@ -0,0 +1,103 @@
+import pytest
+
+from library_store import LibraryStore
+from search_index import SearchIndex, within_distance
+
+
+def info(title, artist="", album=""):
+    return {'title': title, 'artist': artist, 'album': album}
+
+
+def test_prefix_fuzzy_and_all_terms():
+    index = SearchIndex()
+    index.add("/music/01 Yesterday.mp3", info("Yesterday", "The Beatles"))
+    index.add("/music/02 Let It Be.mp3", info("Let It Be", "The Beatles"))
+    index.add("/music/other.mp3")
+    assert index.search("beat") == ["/music/01 Yesterday.mp3", "/music/02 Let It Be.mp3"]
+    assert index.search("yestreday") == ["/music/01 Yesterday.mp3"]
+    assert index.search("beatles let") == ["/music/02 Let It Be.mp3"]
+    assert index.search("beatles nothing") == []
+    assert index.search("") == []
+
+
+def test_refcount_keeps_shared_document():
+    index = SearchIndex()
+    index.add("/a/tune.mp3")
+    index.add("/a/tune.mp3")
+    index.discard("/a/tune.mp3")
+    assert index.search("tune") == ["/a/tune.mp3"]
+    index.discard("/a/tune.mp3")
+    assert index.search("tune") == []
+    assert len(index) == 0
+
+
+def test_rename_keeps_refcount():
+    index = SearchIndex()
+    index.add("/a/song.mp3")
+    index.add("/a/song.mp3")
+    index.rename("/a/song.mp3", "/a/tune.mp3")
+    assert index.search("song") == []
+    assert index.search("tune") == ["/a/tune.mp3"]
+    index.discard("/a/tune.mp3")
+    assert index.search("tune") == ["/a/tune.mp3"]
+    index.discard("/a/tune.mp3")
+    assert "/a/tune.mp3" not in index
+
+
+def test_rename_onto_indexed_path_adds_refs():
+    index = SearchIndex()
+    index.add("/a/song.mp3")
+    index.add("/a/tune.mp3")
+    index.rename("/a/song.mp3", "/a/tune.mp3")
+    assert index.search("song") == []
+    index.discard("/a/tune.mp3")
+    assert index.search("tune") == ["/a/tune.mp3"]
+
+
+def test_update_reindexes_tags():
+    index = SearchIndex()
+    index.add("/a/track01.mp3")
+    index.update("/a/track01.mp3", info("Imagine", "Lennon"))
+    assert index.search("imagine") == ["/a/track01.mp3"]
+    assert index.search("track01") == ["/a/track01.mp3"]
+
+
+def test_within_distance():
+    assert within_distance("kitten", "sitten", 1)
+    assert within_distance("kitten", "sitting", 3)
+    assert not within_distance("kitten", "sitting", 2)
+    assert not within_distance("abc", "abcdef", 2)
+
+
+@pytest.fixture
+def library(tmp_path):
+    library = LibraryStore(str(tmp_path / "data"))
+    library.load()
+    yield library
+    library.close()
+
+
+def test_library_rename_in_two_playlists(library):
+    library.add_tracks("main", ["/m/song.mp3"])
+    library.add_tracks("избранное", ["/m/song.mp3"])
+    library.start_indexing()
+    while library.index_step():
+        pass
+    assert library.playlist_store.rename_track("/m/song.mp3", "/m/tune.mp3")
+    assert library.search("song") == []
+    library.remove_track("main", "/m/tune.mp3")
+    assert library.search("tune") == ["/m/tune.mp3"]
+
+
+def test_library_rename_while_indexing_is_replayed(library):
+    library.add_tracks("main", ["/m/song.mp3", "/m/other.mp3"])
+    library.add_tracks("избранное", ["/m/song.mp3"])
+    library.start_indexing()
+    library.playlist_store.rename_track("/m/song.mp3", "/m/tune.mp3")
+    library.remove_track("main", "/m/tune.mp3")
+    while library.index_step(chunk_size=1):
+        pass
+    assert library.search("song") == []
+    assert library.search("tune") == ["/m/tune.mp3"]
+    library.remove_track("избранное", "/m/tune.mp3")
+    assert library.search("tune") == []
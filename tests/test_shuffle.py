@@ -0,0 +1,95 @@
+import random
+
+from shuffle import ShuffleOrder
+
+
+def make(items, **kwargs):
+    return ShuffleOrder(items, rng=random.Random(5), **kwargs)
+
+
+def test_no_repeats_within_a_round():
+    items = [f"/{i}" for i in range(50)]
+    order = make(items)
+    for _ in range(3):
+        played = [order.next() for _ in items]
+        assert sorted(played) == sorted(items)
+
+
+def test_current_is_not_repeated_across_rounds():
+    items = [f"/{i}" for i in range(5)]
+    order = make(items)
+    previous = None
+    for _ in range(50):
+        path = order.next()
+        assert path != previous
+        previous = path
+
+
+def test_current_starts_history():
+    order = make(["/a", "/b", "/c"], current="/b")
+    assert order.current == "/b"
+    assert order.prev() is None
+    assert "/b" not in [order.next(), order.next()]
+
+
+def test_back_and_forward_replay_history():
+    order = make([f"/{i}" for i in range(10)])
+    played = [order.next() for _ in range(5)]
+    assert [order.prev() for _ in range(4)] == played[3::-1]
+    assert order.prev() is None
+    assert [order.next() for _ in range(4)] == played[1:]
+
+
+def test_peek_fixes_the_choice():
+    order = make([f"/{i}" for i in range(10)])
+    upcoming = order.peek()
+    assert order.peek() == upcoming
+    assert order.next() == upcoming
+
+
+def test_jump_from_pool_and_history():
+    order = make([f"/{i}" for i in range(10)])
+    first = order.next()
+    unplayed = next(p for p in order.order[order.drawn:])
+    order.jump(unplayed)
+    assert order.current == unplayed
+    assert order.prev() == first
+    order.jump(unplayed)
+    assert order.current == unplayed
+    rest = [order.next() for _ in range(8)]
+    assert sorted(rest + [first, unplayed]) == sorted(f"/{i}" for i in range(10))
+
+
+def test_add_and_discard():
+    items = [f"/{i}" for i in range(100)]
+    order = make(items)
+    played = [order.next() for _ in range(60)]
+    for path in played[:50]:
+        order.discard(path)
+    order.discard("/missing")
+    order.add("/new")
+    order.add("/new")
+    assert len(order) == 51
+    assert "/new" in order and played[0] not in order
+
+    # Оставшийся круг: несыгранные и новый трек, без удаленных
+    rest = set(items) - set(played) | {"/new"}
+    assert {order.next() for _ in range(len(rest))} == rest
+    # История назад пропускает удаленные треки
+    back = []
+    while (path := order.prev()) is not None:
+        back.append(path)
+    assert not set(back) & set(played[:50])
+
+
+def test_weights_prefer_heavy_tracks():
+    items = [f"/{i}" for i in range(20)]
+    light = set(items[:10])
+    order = make(items, weight=lambda path: 0.05 if path in light else 1.0)
+    firsts = [order.next() for _ in range(5)]
+    assert sum(path in light for path in firsts) <= 2
+
+
+def test_empty():
+    order = make([])
+    assert order.next() is None and order.peek() is None and order.prev() is None
@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+from track_list import TrackList, TrackTable, decode_ids, encode_ids
+
+
+def check(tracks, expected):
+    assert tracks.to_list() == expected
+    assert len(tracks) == len(expected)
+    for position, path in enumerate(expected):
+        assert tracks.index(path) == position
+        assert path in tracks
+
+
+def test_duplicates_are_skipped():
+    tracks = TrackList(["/a", "/b", "/a"])
+    assert tracks.extend(["/b", "/c"]) == ["/c"]
+    assert not tracks.insert(0, "/a")
+    check(tracks, ["/a", "/b", "/c"])
+
+
+def test_lazy_renumber_after_front_edits():
+    tracks = TrackList([f"/{i}" for i in range(10)])
+    tracks.insert(0, "/new")
+    tracks.remove("/3")
+    assert tracks._valid == 0
+    # Удаление из хвоста с устаревшими позициями не перенумеровывает его
+    tracks.remove("/8")
+    assert tracks._valid == 0
+    expected = ["/new"] + [f"/{i}" for i in range(10) if i not in (3, 8)]
+    check(tracks, expected)
+    assert tracks._valid == len(tracks)
+
+
+def test_random_edits_match_list():
+    rng = random.Random(17)
+    tracks = TrackList()
+    expected = []
+    for step in range(2000):
+        action = rng.random()
+        path = f"/{rng.randrange(200)}"
+        if action < 0.35:
+            if tracks.append(path):
+                expected.append(path)
+        elif action < 0.55:
+            index = rng.randrange(-5, len(expected) + 5)
+            if tracks.insert(index, path):
+                index = min(max(index if index >= 0 else len(expected) + index, 0), len(expected))
+                expected.insert(index, path)
+        elif action < 0.75:
+            if path in expected:
+                tracks.remove(path)
+                expected.remove(path)
+            else:
+                with pytest.raises(ValueError):
+                    tracks.remove(path)
+        elif action < 0.85 and expected:
+            old_index, new_index = rng.randrange(len(expected)), rng.randrange(len(expected))
+            tracks.move(old_index, new_index)
+            expected.insert(new_index, expected.pop(old_index))
+        elif action < 0.9:
+            batch = [f"/{rng.randrange(200)}" for _ in range(5)]
+            removed = tracks.remove_many(batch)
+            assert removed == [p for p in dict.fromkeys(batch) if p in expected]
+            expected = [p for p in expected if p not in removed]
+        elif action < 0.95 and expected:
+            old = rng.choice(expected)
+            if tracks.replace(old, path):
+                expected[expected.index(old)] = path
+            else:
+                assert path in expected
+        elif step % 7 == 0:
+            check(tracks, expected)
+        assert len(tracks) == len(expected)
+    check(tracks, expected)
+
+
+def test_index_bounds():
+    tracks = TrackList(["/a", "/b", "/c"])
+    assert tracks.index("/b", 1, 2) == 1
+    with pytest.raises(ValueError):
+        tracks.index("/b", 2)
+    with pytest.raises(ValueError):
+        tracks.index("/missing")
+
+
+def test_shared_table_rename():
+    table = TrackTable()
+    first = TrackList(["/a", "/b"], table)
+    second = TrackList(["/b"], table)
+    assert table.rename("/b", "/c")
+    assert first.to_list() == ["/a", "/c"]
+    assert second.to_list() == ["/c"]
+    assert not table.rename("/a", "/c")
+
+
+def test_from_ids_and_encoding():
+    table = TrackTable(["/a", "/b", "/c"])
+    ids = decode_ids(encode_ids([2, 0, 2, 1]))
+    tracks = TrackList.from_ids(ids, table)
+    check(tracks, ["/c", "/a", "/b"])
@@ -0,0 +1,238 @@
+import base64
+import sys
+from array import array
+from collections.abc import Sequence
+
+
+class TrackTable:
+    """Общая таблица треков: путь хранится один раз, плейлисты держат id.
+
+    id — индекс в списке paths и не меняется до перезапуска, поэтому
+    переименование или перенос файла исправляется в одном месте для всех
+    плейлистов сразу.
+    """
+
+    __slots__ = ('paths', 'ids')
+
+    def __init__(self, paths=()):
+        self.paths = list(dict.fromkeys(paths))
+        self.ids = {path: track_id for track_id, path in enumerate(self.paths)}
+
+    def __len__(self):
+        return len(self.paths)
+
+    def intern(self, path):
+        """id трека, новый путь получает новый id"""
+        track_id = self.ids.get(path)
+        if track_id is None:
+            track_id = self.ids[path] = len(self.paths)
+            self.paths.append(path)
+        return track_id
+
+    def id_of(self, path):
+        return self.ids.get(path)
+
+    def path(self, track_id):
+        return self.paths[track_id]
+
+    def forget(self, path):
+        """Отвязывает путь от id (его не держит ни один список). Id больше не выдается"""
+        self.ids.pop(path, None)
+
+    def rename(self, old_path, new_path):
+        """Меняет путь трека. False, если старого пути нет или новый уже занят"""
+        track_id = self.ids.get(old_path)
+        if track_id is None or new_path in self.ids:
+            return False
+        del self.ids[old_path]
+        self.ids[new_path] = track_id
+        self.paths[track_id] = new_path
+        return True
+
+
+def encode_ids(ids):
+    """Массив id -> строка base64 (uint32 little-endian) для снимка"""
+    ids = array('I', ids)
+    if sys.byteorder == 'big':
+        ids.byteswap()
+    return base64.b64encode(ids.tobytes()).decode('ascii')
+
+
+def decode_ids(text):
+    ids = array('I')
+    ids.frombytes(base64.b64decode(text))
+    if sys.byteorder == 'big':
+        ids.byteswap()
+    return ids
+
+
+class TrackList(Sequence):
+    """Упорядоченный список треков без повторов.
+
+    Треки хранятся как array('I') id из общей таблицы TrackTable, снаружи
+    список выглядит как последовательность путей. Рядом хранится словарь
+    id -> позиция. После вставки или удаления в середине позиции хвоста не
+    пересчитываются сразу: помечается, с какого места они устарели (_valid),
+    и хвост перенумеровывается при первом index().
+
+    Сложность: проверка на повтор и append — O(1); index() — O(1), если
+    позиции актуальны, иначе O(n) на перенумерацию хвоста; insert, remove
+    и move — O(n) (сдвиг массива). remove не перенумеровывает хвост, а
+    ищет id в массиве, поэтому k удалений по одному стоят O(k·n) сдвигов
+    без лишних проходов по словарю; для пачки есть remove_many — O(n).
+
+    id трека не меняется при вставках, удалениях и перестановках (строки
+    списка в UI можно привязывать к нему).
+    """
+
+    __slots__ = ('table', '_ids', '_positions', '_valid')
+
+    def __init__(self, paths=(), table=None):
+        self.table = table if table is not None else TrackTable()
+        self._ids = array('I')
+        self._positions = {}
+        self._valid = 0
+        self.extend(paths)
+
+    @classmethod
+    def from_ids(cls, ids, table):
+        """Список из готового массива id (при загрузке снимка)"""
+        tracks = cls(table=table)
+        tracks._ids = array('I', dict.fromkeys(ids))
+        tracks._positions = {track_id: position for position, track_id in enumerate(tracks._ids)}
+        tracks._valid = len(tracks._ids)
+        return tracks
+
+    # Чтение
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, index):
+        paths = self.table.paths
+        if isinstance(index, slice):
+            return [paths[track_id] for track_id in self._ids[index]]
+        return paths[self._ids[index]]
+
+    def __iter__(self):
+        return map(self.table.paths.__getitem__, self._ids)
+
+    def __contains__(self, path):
+        return self.table.ids.get(path) in self._positions
+
+    def __eq__(self, other):
+        if isinstance(other, (TrackList, list)):
+            return self.to_list() == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"TrackList({self.to_list()!r})"
+
+    @property
+    def ids(self):
+        return self._ids
+
+    def index(self, path, start=0, stop=None):
+        """Позиция трека; ValueError, если его нет"""
+        track_id = self.table.ids.get(path)
+        position = self._positions.get(track_id)
+        if position is None:
+            raise ValueError(f"{path!r} нет в списке")
+        if position >= self._valid:
+            self._renumber()
+            position = self._positions[track_id]
+        if position < start or (stop is not None and position >= stop):
+            raise ValueError(f"{path!r} нет в списке")
+        return position
+
+    def id_of(self, path):
+        """id трека, если он есть в этом списке"""
+        track_id = self.table.ids.get(path)
+        return track_id if track_id in self._positions else None
+
+    def to_list(self):
+        return list(self)
+
+    # Изменение
+
+    def append(self, path):
+        """Добавляет трек в конец. False, если он уже есть"""
+        track_id = self.table.intern(path)
+        if track_id in self._positions:
+            return False
+        if self._valid == len(self._ids):
+            self._valid += 1
+        self._positions[track_id] = len(self._ids)
+        self._ids.append(track_id)
+        return True
+
+    def extend(self, paths):
+        """Добавляет треки, которых еще нет. Возвращает добавленные"""
+        return [path for path in paths if self.append(path)]
+
+    def insert(self, index, path):
+        track_id = self.table.intern(path)
+        if track_id in self._positions:
+            return False
+        index = min(max(index if index >= 0 else len(self._ids) + index, 0), len(self._ids))
+        self._ids.insert(index, track_id)
+        self._positions[track_id] = index
+        self._valid = min(self._valid, index)
+        return True
+
+    def remove(self, path):
+        track_id = self.table.ids.get(path)
+        position = self._positions.get(track_id)
+        if position is None:
+            raise ValueError(f"{path!r} нет в списке")
+        if position >= self._valid:
+            # Позиции хвоста устарели, но трек точно в хвосте — ищем в массиве
+            position = self._ids.index(track_id, self._valid)
+        del self._positions[self._ids[position]]
+        del self._ids[position]
+        self._valid = min(self._valid, position)
+
+    def remove_many(self, paths):
+        """Удаляет несколько треков за один проход. Возвращает удаленные"""
+        removed = [path for path in dict.fromkeys(paths) if path in self]
+        if not removed:
+            return removed
+        gone = {self.table.ids[path] for path in removed}
+        first = min(self.index(path) for path in removed)
+        self._ids[first:] = array('I', (track_id for track_id in self._ids[first:]
+                                        if track_id not in gone))
+        for track_id in gone:
+            del self._positions[track_id]
+        self._valid = first
+        return removed
+
+    def replace(self, old_path, new_path):
+        """Ставит new_path на место old_path. False, если old_path нет или new_path уже есть"""
+        if new_path in self:
+            return False
+        position = self.index(old_path)
+        new_id = self.table.intern(new_path)
+        del self._positions[self._ids[position]]
+        self._ids[position] = new_id
+        self._positions[new_id] = position
+        return True
+
+    def move(self, old_index, new_index):
+        """Переставляет трек (id сохраняется)"""
+        old_index %= len(self._ids)
+        track_id = self._ids.pop(old_index)
+        new_index = min(max(new_index, 0), len(self._ids))
+        self._ids.insert(new_index, track_id)
+        self._valid = min(self._valid, old_index, new_index)
+
+    def clear(self):
+        del self._ids[:]
+        self._positions.clear()
+        self._valid = 0
+
+    def _renumber(self):
+        positions = self._positions
+        ids = self._ids
+        for position in range(self._valid, len(ids)):
+            positions[ids[position]] = position
+        self._valid = len(ids)
@@ -0,0 +1,202 @@
+import hashlib
+import heapq
+import itertools
+import os
+import queue
+import threading
+
+from audio_decode import decode_pcm, np
+from batch_analyzer import DecodeWorker
+
+
+# Число бинов в сводке формы волны
+WAVEFORM_BINS = 2048
+
+# Приоритеты в очереди построения
+PRIORITY_NOW = 0
+PRIORITY_LIBRARY = 10
+
+# Пауза между треками фонового прохода, чтобы не загружать CPU
+LIBRARY_PASS_DELAY = 0.05
+
+
+def waveform_key(path, stat):
+    """Ключ сводки: путь + mtime + размер (изменение файла дает новый ключ)"""
+    raw = f"{path}\0{stat.st_mtime_ns}\0{stat.st_size}".encode('utf-8', 'surrogateescape')
+    return hashlib.sha1(raw).hexdigest()
+
+
+def compute_summary(pcm, bins=WAVEFORM_BINS):
+    """Пиковая и RMS-амплитуда по bins равным отрезкам. Массив float16 (2, bins)"""
+    if len(pcm) < bins:
+        pcm = np.pad(pcm, (0, bins - len(pcm)))
+    usable = len(pcm) - len(pcm) % bins
+    frames = np.abs(pcm[:usable]).reshape(bins, -1)
+    peak = frames.max(axis=1)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+    return np.stack([peak, rms]).astype(np.float16)
+
+
+def build_summary(path):
+    """Сводка формы волны файла (выполняется в процессе декодирования)"""
+    pcm, _ = decode_pcm(path)
+    return compute_summary(pcm)
+
+
+class WaveformStore:
+    """Сводки формы волны в music_player_data/waveforms/<ключ>.npy.
+
+    Файлы читаются через memory-map, поэтому отрисовка сводки не требует
+    ни декодирования, ни чтения всего файла в память.
+    """
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+
+    def file_for_key(self, key):
+        return os.path.join(self.root_dir, key[:2], f"{key}.npy")
+
+    def file_for_path(self, path):
+        try:
+            return self.file_for_key(waveform_key(path, os.stat(path)))
+        except OSError:
+            return None
+
+    def load(self, path):
+        """Сводка для трека или None, если она еще не построена"""
+        file_path = self.file_for_path(path)
+        if file_path is None or not os.path.exists(file_path):
+            return None
+        try:
+            return np.load(file_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key, summary):
+        file_path = self.file_for_key(key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, summary)
+        os.replace(tmp_path, file_path)
+
+    def prune(self, live_keys):
+        """Удаляет сводки, ключей которых нет среди live_keys (файлы изменены или удалены)"""
+        removed = 0
+        for dir_path, _, file_names in os.walk(self.root_dir):
+            for name in file_names:
+                key, ext = os.path.splitext(name)
+                if ext == '.npy' and key not in live_keys:
+                    try:
+                        os.remove(os.path.join(dir_path, name))
+                        removed += 1
+                    except OSError:
+                        pass
+        return removed
+
+
+class WaveformBuilder:
+    """Фоновое построение сводок: один рабочий поток с очередью приоритетов.
+
+    Текущий трек запрашивается с PRIORITY_NOW и обгоняет фоновый проход по
+    библиотеке. Готовые пути складываются в очередь done, которую забирает UI.
+    Файлы декодируются в отдельном процессе (DecodeWorker), поток только
+    ждет результат.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.done = queue.Queue()
+
+        self._heap = []
+        self._queued = {}
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._live_keys = None
+        self._library_pending = set()
+        self._decoder = DecodeWorker()
+        self._thread = threading.Thread(target=self._run, name="waveform-builder", daemon=True)
+        self._thread.start()
+
+    def request(self, path, priority=PRIORITY_NOW):
+        with self._cond:
+            if path in self._queued and self._queued[path] <= priority:
+                return
+            self._queued[path] = priority
+            heapq.heappush(self._heap, (priority, next(self._counter), path))
+            self._cond.notify()
+
+    def enqueue_library(self, paths):
+        """Фоновый проход по всей библиотеке; после него удаляются устаревшие сводки"""
+        unique_paths = list(dict.fromkeys(paths))
+        with self._cond:
+            self._live_keys = set()
+            self._library_pending = set(unique_paths)
+        for path in unique_paths:
+            self.request(path, PRIORITY_LIBRARY)
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        self._decoder.close()
+
+    def _next(self):
+        with self._cond:
+            while True:
+                if self._stop:
+                    return None, None
+                while self._heap:
+                    priority, _, path = heapq.heappop(self._heap)
+                    # Устаревшая запись: путь переставлен с более высоким приоритетом
+                    if self._queued.get(path) == priority:
+                        del self._queued[path]
+                        return priority, path
+                self._cond.wait()
+
+    def _run(self):
+        while True:
+            priority, path = self._next()
+            if path is None:
+                return
+
+            key, built = self._build(path)
+            if built:
+                self.done.put(path)
+            self._library_step(path, key)
+            if priority == PRIORITY_LIBRARY:
+                with self._cond:
+                    self._cond.wait(LIBRARY_PASS_DELAY)
+
+    def _build(self, path):
+        """Строит сводку, если ее нет. Возвращает (ключ, построена ли сейчас)"""
+        try:
+            key = waveform_key(path, os.stat(path))
+        except OSError:
+            return None, False
+
+        if os.path.exists(self.store.file_for_key(key)):
+            return key, False
+
+        try:
+            summary = self._decoder.run(build_summary, path)
+        except Exception as e:
+            print(f"Не удалось построить форму волны для {path}: {e}")
+            return key, False
+        self.store.save(key, summary)
+        return key, True
+
+    def _library_step(self, path, key):
+        """Учет фонового прохода: по его окончании удаляются устаревшие сводки"""
+        with self._cond:
+            if path not in self._library_pending:
+                return
+            self._library_pending.discard(path)
+            if key is not None:
+                self._live_keys.add(key)
+            if self._library_pending:
+                return
+            live_keys, self._live_keys = self._live_keys, None
+        self.store.prune(live_keys)